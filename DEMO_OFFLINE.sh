@@ -11,7 +11,9 @@ cd "$SCRIPT_DIR"
 
 echo "📊 Step 1: Kiểm tra cache hiện tại"
 echo "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━"
-CACHE_COUNT=$(find cache -name "*.bin" 2>/dev/null | wc -l)
+# Đếm entry qua cache_store (index SQLite); body dedup trong cache/blobs/ không bị đếm 2 lần
+CACHE_COUNT=$(python3 -c "import cache_store; print(cache_store.count_entries('cache'))" 2>/dev/null \
+    || find cache -path cache/blobs -prune -o -name "*.bin" -print 2>/dev/null | wc -l)
 echo "   Cached responses: $CACHE_COUNT files"
 echo ""
 
@@ -122,6 +122,7 @@ nohup python3 auto_crawl_proxy.py \
   --delay 0.3 \
   --max-retries 10 \
   --auto-pagination \
+  --fresh \
   > "$LOG_FILE" 2>&1 &
 
 PID=$!
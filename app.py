@@ -1,7 +1,15 @@
 
-import os, re, json, hashlib, urllib.parse
+import os, re, json, time, threading, urllib.parse
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, Response
 import requests
+import cache_store
+from cache_http import (
+    is_textual, served_variant, cache_validators, is_not_modified, validators_only,
+    with_validators, precompressed_response, file_response,
+)
+from url_rewrite import Rewriter, charset_of, ascii_compatible
 
 # ================== CONFIG ==================
 ORIGIN = os.getenv("ORIGIN", "https://kiagds.ru")
@@ -12,122 +20,663 @@ os.makedirs(CACHE_DIR, exist_ok=True)
 LIVE_FALLBACK = os.getenv("LIVE_FALLBACK", "true").lower() == "true"
 UA = "LocalCacheProxy/1.0 (+offline-archiver; respectful; contact=you@example.com)"
 TIMEOUT = 25
+# Nén trên đường truyền origin -> proxy (requests/httpx tự giải nén khi stream; br cần package brotli).
+# Cache vẫn lưu body identity như trước
+ORIGIN_ACCEPT_ENCODING = os.getenv(
+    "ORIGIN_ACCEPT_ENCODING", "gzip, deflate, br" if cache_store.brotli is not None else "gzip, deflate"
+)
 
 ALLOWED_HOST = "kiagds.ru"  # chỉ proxy domain này để an toàn
+
+# LRU trong RAM cho response textual đã rewrite xong (giới hạn theo bytes, 0 = tắt)
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(64 * 1024 * 1024)))
+# Stale-while-revalidate theo content-type (giây), vd: "text/html=86400,json=3600,*=604800".
+# Entry cũ hơn vẫn được trả ngay, 1 lần refresh chạy nền rồi thay entry (atomic). Rỗng = không bao giờ refresh
+CACHE_FRESHNESS = os.getenv("CACHE_FRESHNESS", "")
+REFRESH_WORKERS = int(os.getenv("REFRESH_WORKERS", "2"))
+# Refresh lỗi (origin down, 5xx...) thì giữ entry cũ, chờ ngần này giây mới thử lại
+REFRESH_RETRY_SECONDS = int(os.getenv("REFRESH_RETRY_SECONDS", "60"))
+# Giới hạn số fetch origin đồng thời (mỗi process). Cache miss vượt giới hạn xếp hàng theo lớp client
+# (interactive / crawler, lần lượt xoay vòng); hàng của lớp đầy hoặc chờ quá lâu -> 503 + Retry-After ngay
+UPSTREAM_CONCURRENCY = int(os.getenv("UPSTREAM_CONCURRENCY", "8"))
+UPSTREAM_QUEUE = int(os.getenv("UPSTREAM_QUEUE", "32"))             # số request chờ tối đa mỗi lớp
+UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "10"))
+UPSTREAM_RETRY_AFTER = int(os.getenv("UPSTREAM_RETRY_AFTER", "5"))
+# User-Agent khớp regex này là lớp "crawler", còn lại "interactive" (trình duyệt)
+CRAWLER_UA_PATTERN = os.getenv("CRAWLER_UA_PATTERN", r"crawl|bot|spider|refresher|python-requests|python-httpx")
 # ============================================
 
 app = Flask(__name__)
 session = requests.Session()
 
-def _cache_key(method: str, url: str) -> str:
-    return hashlib.sha256(f"{method} {url}".encode("utf-8")).hexdigest()
+class ResponseLRU:
+    """
+    LRU các response đã rewrite sẵn sàng gửi: key -> (status, headers, content_type, body, fetched_at).
+    Giới hạn theo tổng bytes (body + header), không theo số entry. Thread-safe.
+    Mỗi process (worker) có LRU riêng: get() đối chiếu fetched_at với cache dùng chung,
+    entry đã bị process khác ghi đè / refresh / xoá thì bỏ (tính là miss).
+    """
 
-def _paths(method: str, url: str):
-    key = _cache_key(method, url)
-    return os.path.join(CACHE_DIR, key + ".bin"), os.path.join(CACHE_DIR, key + ".json")
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cost(headers: dict, body: bytes) -> int:
+        return len(body) + sum(len(k) + len(v) for k, v in headers.items()) + 200
+
+    def get(self, key: str, current_fetched_at=None):
+        """current_fetched_at(key) -> fetched_at của entry trên đĩa (gọi ngoài lock)"""
+        with self._lock:
+            item = self._items.get(key)
+        if item is not None and current_fetched_at is not None \
+                and current_fetched_at(key) != item[0][4]:
+            with self._lock:
+                if self._items.get(key) is item:
+                    del self._items[key]
+                    self.used -= item[1]
+                self.stale += 1
+            item = None
+        with self._lock:
+            if item is None:
+                self.misses += 1
+                return None
+            if key in self._items:
+                self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: str, status: int, headers: dict, content_type: str, body: bytes, fetched_at: float = None):
+        cost = self._cost(headers, body)
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.used -= old[1]
+            self._items[key] = ((status, headers, content_type, body, fetched_at), cost)
+            self.used += cost
+            while self.used > self.max_bytes:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self.used -= evicted
+
+    def invalidate(self, key: str):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.used -= old[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._items), "bytes": self.used, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "stale": self.stale,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+response_cache = ResponseLRU(RESPONSE_CACHE_BYTES)
+
+class SingleFlight:
+    """
+    Gộp các cache miss đồng thời cùng key: chỉ 1 request gọi origin (và ghi cache),
+    các request khác chờ xong rồi đọc entry vừa lưu (hoặc nhận cùng exception). Thread-safe, trong 1 process.
+    """
+
+    def __init__(self):
+        self.fetches = 0     # số lần thực sự gọi origin
+        self.coalesced = 0   # số request dùng chung kết quả = số lần gọi origin tiết kiệm được
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def record(self, leader: bool):
+        # Dùng cho app_asgi (gộp bằng asyncio, cùng bộ đếm)
+        with self._lock:
+            if leader:
+                self.fetches += 1
+            else:
+                self.coalesced += 1
+
+    def join(self, key: str):
+        """(call, leader) - leader phải gọi leave() khi xong (kể cả khi lỗi)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = {"done": threading.Event(), "error": None}
+                self.fetches += 1
+                return call, True
+            self.coalesced += 1
+            return call, False
+
+    def leave(self, key: str, call: dict, error: Exception = None):
+        # Bỏ key sau khi đã ghi cache: request đến sau sẽ thấy cache hit
+        call["error"] = error
+        with self._lock:
+            del self._calls[key]
+        call["done"].set()
+
+    def wait(self, call: dict):
+        call["done"].wait()
+        if call["error"] is not None:
+            raise call["error"]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"fetches": self.fetches, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+origin_flight = SingleFlight()
+
+class UpstreamLimiter:
+    """
+    Tối đa `limit` fetch origin cùng lúc. Request vượt giới hạn chờ trong hàng FIFO của lớp client mình
+    (tối đa `queue_size` mỗi lớp); slot trống được trao xoay vòng giữa các lớp đang có người chờ,
+    nên crawler chạy --concurrency cao không chiếm hết lượt của trình duyệt. Hàng đầy -> từ chối ngay.
+    Người chờ là 1 hàm grant() (threading.Event.set hoặc future của asyncio) - dùng được cho cả app_asgi.
+    """
+
+    ACQUIRED, QUEUED, FULL = "acquired", "queued", "full"
+
+    def __init__(self, limit: int, queue_size: int):
+        self.limit = max(1, limit)
+        self.queue_size = queue_size
+        self.active = 0
+        self._queues = {}    # lớp -> deque các grant()
+        self._turn = 0       # vị trí xoay vòng trong danh sách lớp
+        self.admitted = {}
+        self.shed = {}
+        self._lock = threading.Lock()
+
+    def try_acquire(self, cls: str, grant) -> str:
+        with self._lock:
+            queue = self._queues.setdefault(cls, deque())
+            if self.active < self.limit and not any(self._queues.values()):
+                self.active += 1
+                self.admitted[cls] = self.admitted.get(cls, 0) + 1
+                return self.ACQUIRED
+            if len(queue) >= self.queue_size:
+                self.shed[cls] = self.shed.get(cls, 0) + 1
+                return self.FULL
+            queue.append(grant)
+            return self.QUEUED
+
+    def cancel(self, cls: str, grant) -> bool:
+        """Bỏ chờ (hết hạn / client ngắt). False nếu slot vừa được trao - người gọi phải release()"""
+        with self._lock:
+            try:
+                self._queues[cls].remove(grant)
+            except ValueError:
+                return False
+            self.shed[cls] = self.shed.get(cls, 0) + 1
+            return True
+
+    def release(self):
+        with self._lock:
+            classes = list(self._queues)
+            for i in range(len(classes)):
+                cls = classes[(self._turn + i) % len(classes)]
+                if self._queues[cls]:
+                    self._turn = (self._turn + i + 1) % len(classes)
+                    grant = self._queues[cls].popleft()
+                    self.admitted[cls] = self.admitted.get(cls, 0) + 1
+                    break
+            else:
+                self.active -= 1
+                return
+        # Trao slot thẳng cho người chờ (active giữ nguyên)
+        grant()
+
+    def acquire(self, cls: str, timeout: float) -> bool:
+        """Bản blocking cho thread (Flask, refresh nền)"""
+        granted = threading.Event()
+        state = self.try_acquire(cls, granted.set)
+        if state != self.QUEUED:
+            return state == self.ACQUIRED
+        if granted.wait(timeout) or not self.cancel(cls, granted.set):
+            return True
+        return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": self.limit, "active": self.active, "queue_size": self.queue_size,
+                "queued": {cls: len(q) for cls, q in self._queues.items()},
+                "admitted": dict(self.admitted), "shed": dict(self.shed),
+            }
+
+upstream_limiter = UpstreamLimiter(UPSTREAM_CONCURRENCY, UPSTREAM_QUEUE)
+_crawler_ua = re.compile(CRAWLER_UA_PATTERN, re.I)
+
+def _client_class(user_agent: str) -> str:
+    return "crawler" if user_agent and _crawler_ua.search(user_agent) else "interactive"
+
+def _busy_response():
+    """Quá tải origin: trả ngay để client thử lại, không giữ kết nối chờ"""
+    return Response("Upstream busy, retry later", status=503,
+                    headers={"Retry-After": str(UPSTREAM_RETRY_AFTER)})
+
+# Kích thước chunk đọc từ origin khi stream (tee) cache miss
+STREAM_CHUNK_BYTES = 64 * 1024
+
+def _cache_key(method: str, url: str) -> str:
+    return cache_store.cache_key(method, url)
 
 def _load_cache(method: str, url: str):
-    bin_path, meta_path = _paths(method, url)
-    if not (os.path.exists(bin_path) and os.path.exists(meta_path)):
-        return None
-    with open(bin_path, "rb") as f:
-        body = f.read()
-    with open(meta_path, "r", encoding="utf-8") as f:
-        meta = json.load(f)
-    return body, meta
+    # Đọc qua backend CACHE_BACKEND (files: ab/cd/<key>.bin+.json | pack: segment + offset)
+    return cache_store.load_entry(_cache_key(method, url), CACHE_DIR)
+
+def _load_cache_meta(method: str, url: str):
+    # Chỉ metadata (index / sidecar) - đủ để trả 304 mà không đọc body
+    return cache_store.load_meta(_cache_key(method, url), CACHE_DIR)
+
+def _open_cache_body(method: str, url: str, meta: dict = None):
+    """(file body, meta) để stream thẳng từ đĩa - None nếu miss hoặc body lưu dạng nén"""
+    return cache_store.open_body(_cache_key(method, url), CACHE_DIR, meta)
+
+def _load_cache_encoded(method: str, url: str, accept_encoding: str):
+    # Body nén sẵn (gzip/br/zstd) nếu client chấp nhận và body không cần rewrite
+    accepted = cache_store.parse_accept_encoding(accept_encoding)
+    return cache_store.load_encoded(_cache_key(method, url), accepted, CACHE_DIR)
 
 def _save_cache(method: str, url: str, body: bytes, headers: dict, status: int):
-    bin_path, meta_path = _paths(method, url)
-    with open(bin_path, "wb") as f:
-        f.write(body)
+    key = _cache_key(method, url)
     meta = {"url": url, "status": status, "headers": dict(headers)}
-    with open(meta_path, "w", encoding="utf-8") as f:
-        json.dump(meta, f, ensure_ascii=False, indent=2)
+    cache_store.save_entry(key, body, meta, CACHE_DIR)
+    # Response đã rewrite của entry cũ không còn đúng
+    response_cache.invalidate(key)
 
-def _is_type(content_type: str, needle: str) -> bool:
-    ct = (content_type or "").lower()
-    return needle in ct
+_rewriter = Rewriter(LOCAL_BASE)
 
-def _is_html(content_type: str) -> bool:
-    return _is_type(content_type, "text/html") or _is_type(content_type, "application/xhtml")
+def _rewrite_text(s: str) -> str:
+    # https://kiagds.ru/... và //kiagds.ru/... (cả http://localhost:5002/...) -> LOCAL_BASE, 1 lượt regex
+    return _rewriter.rewrite_text(s)
 
-def _is_textual(content_type: str) -> bool:
-    ct = (content_type or "").lower()
-    # textual types we may safely rewrite absolute domain
-    return (
-        "text/" in ct
-        or "javascript" in ct
-        or ct.startswith("application/json")
-        or ct.startswith("application/xml")
-        or ct.startswith("application/xhtml")
+def _target_url(path: str, raw_qs: str) -> str:
+    target = urllib.parse.urljoin(ORIGIN, path)
+    if raw_qs:
+        target = f"{target}?{raw_qs}"
+    return target
+
+def _is_allowed(target: str) -> bool:
+    parsed = urllib.parse.urlparse(target)
+    return parsed.netloc.lower().split(":")[0].endswith(ALLOWED_HOST)
+
+def _open_origin(target: str, headers: dict = None):
+    """GET từ origin (blocking), chưa đọc body (stream=True). headers: thêm If-None-Match... khi revalidate"""
+    return session.get(
+        target,
+        headers={"User-Agent": UA, "Accept-Encoding": ORIGIN_ACCEPT_ENCODING, **(headers or {})},
+        timeout=TIMEOUT,
+        allow_redirects=True,
+        stream=True,
     )
 
-def _rewrite_text(s: str) -> str:
-    # https://kiagds.ru/... -> http://localhost:5002/...
-    s = re.sub(r"https?://kiagds\.ru", LOCAL_BASE, s, flags=re.I)
-    # //kiagds.ru/...       -> //localhost:5002/...
-    s = re.sub(r"(?<!:)//kiagds\.ru", "//localhost:5002", s, flags=re.I)
-    return s
+# Bytes nhận từ origin: trên đường truyền (có thể nén) vs body sau giải nén
+transfer_stats = {"responses": 0, "wire_bytes": 0, "body_bytes": 0}
+_transfer_lock = threading.Lock()
+
+def _wire_bytes(resp):
+    """Số byte đã đọc từ socket của response requests (trước khi giải nén)"""
+    try:
+        return resp.raw.tell()
+    except Exception:
+        return None
+
+class UpstreamTee:
+    """
+    Cache miss: body từ origin được gửi cho client theo từng chunk (text thì rewrite dần) đồng thời
+    ghi vào file tạm trong cache; chỉ khi nhận đủ mới commit thành entry (atomic).
+    Dùng chung cho app.py (requests) và app_asgi.py (httpx).
+    """
+
+    def __init__(self, method: str, target: str, status: int, headers: dict):
+        self.key = _cache_key(method, target)
+        self.status = status
+        self.headers = headers
+        self.meta = {"url": target, "status": status, "headers": dict(headers)}
+        self.content_type = headers.get("Content-Type", "application/octet-stream")
+        length = headers.get("Content-Length", "")
+        # Origin vẫn nén thì Content-Length là độ dài bản nén, không so với body đã giải nén được
+        encoded = headers.get("Content-Encoding", "identity").lower() != "identity"
+        self.expected = int(length) if length.isdigit() and not encoded else None
+        self.writer = cache_store.CacheWriter(self.key, CACHE_DIR)
+        self.textual = is_textual(self.content_type)
+        self._stream = self._buffer = None
+        if self.textual:
+            self._charset = charset_of(self.content_type)
+            if ascii_compatible(self._charset):
+                self._stream = _rewriter.stream()
+            else:
+                # utf-16...: phải có cả body mới decode/rewrite được
+                self._buffer = []
+
+    def headers_out(self) -> dict:
+        headers_out = {
+            k: v for k, v in self.headers.items()
+            if k.lower() not in ("content-length", "content-encoding", "transfer-encoding", "content-type")
+        }
+        headers_out["Content-Type"] = self.content_type
+        if self.textual:
+            # Độ dài sau rewrite chưa biết trước => chunked
+            headers_out["Content-Encoding"] = "identity"
+        elif self.expected is not None:
+            headers_out["Content-Length"] = str(self.expected)
+        return headers_out
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Ghi chunk vào file tạm, trả phần gửi được cho client ngay"""
+        self.writer.write(chunk)
+        if self._stream is not None:
+            return self._stream.feed(chunk)
+        if self._buffer is not None:
+            self._buffer.append(chunk)
+            return b""
+        return chunk
+
+    def finish(self, wire_bytes: int = None):
+        """
+        Hết body: commit entry (nếu đủ byte) - response lỗi (>= 400) vào negative cache có TTL thay vì thành entry.
+        wire_bytes: số byte thực nhận từ origin (bản nén), lưu vào meta["wire_size"] để crawler báo tiết kiệm.
+        Returns: (phần body còn lại, đã lưu chưa)
+        """
+        if wire_bytes is not None:
+            self.meta["wire_size"] = wire_bytes
+            with _transfer_lock:
+                transfer_stats["responses"] += 1
+                transfer_stats["wire_bytes"] += wire_bytes
+                transfer_stats["body_bytes"] += self.writer.size
+        if self._stream is not None:
+            tail = self._stream.flush()
+        elif self._buffer is not None:
+            tail = _rewriter.rewrite_body(b"".join(self._buffer), self._charset)
+        else:
+            tail = b""
+        if cache_store.is_error_status(self.status):
+            return tail, self.writer.commit_failure(self.meta, self.expected)
+        committed = self.writer.commit(self.meta, self.expected)
+        if committed:
+            # Response đã rewrite của entry cũ không còn đúng
+            response_cache.invalidate(self.key)
+        return tail, committed
+
+    def abort(self):
+        self.writer.abort()
+
+def _parse_freshness(spec: str):
+    """ "text/html=86400,json=3600,*=604800" -> ([("text/html", 86400), ("json", 3600)], 604800)"""
+    rules, default = [], None
+    for item in spec.split(","):
+        needle, _, seconds = item.strip().partition("=")
+        if not needle or not seconds.strip().isdigit():
+            continue
+        if needle.strip() == "*":
+            default = int(seconds)
+        else:
+            rules.append((needle.strip().lower(), int(seconds)))
+    return rules, default
+
+_freshness_rules, _freshness_default = _parse_freshness(CACHE_FRESHNESS)
+_refresher = ThreadPoolExecutor(max_workers=max(1, REFRESH_WORKERS), thread_name_prefix="refresh")
+_refresh_tried = {}   # key -> thời điểm thử refresh gần nhất (giãn cách khi origin lỗi)
+_refresh_lock = threading.Lock()
+refresh_stats = {"scheduled": 0, "refreshed": 0, "not_modified": 0, "failed": 0}
+
+def _max_age_for(content_type: str):
+    """Số giây entry còn tươi theo content-type (rule đầu tiên khớp), None = không bao giờ stale"""
+    ct = (content_type or "").lower()
+    for needle, seconds in _freshness_rules:
+        if needle in ct:
+            return seconds
+    return _freshness_default
+
+def _refresh_entry(method: str, target: str, key: str, call: dict):
+    """
+    Chạy nền: hỏi lại origin có điều kiện (If-None-Match / If-Modified-Since từ validator đã lưu).
+    304 -> chỉ cập nhật metadata; body mới 2xx/3xx nhận đủ mới thay entry (atomic); lỗi thì giữ entry cũ.
+    """
+    acquired = False
+    try:
+        # Refresh nền là 1 lớp riêng trong hàng chờ origin: không chen lượt trình duyệt / crawler
+        acquired = upstream_limiter.acquire("background", UPSTREAM_QUEUE_TIMEOUT)
+        if not acquired:
+            raise IOError("Upstream busy")
+        meta = cache_store.load_meta(key, CACHE_DIR)
+        resp = _open_origin(target, cache_store.revalidation_headers(meta))
+        try:
+            if resp.status_code == 304 and meta is not None:
+                cache_store.touch_entry(key, meta, dict(resp.headers), CACHE_DIR)
+                # LRU còn giữ fetched_at cũ
+                response_cache.invalidate(key)
+                with _refresh_lock:
+                    refresh_stats["not_modified"] += 1
+                return
+            if cache_store.is_error_status(resp.status_code):
+                raise IOError(f"HTTP {resp.status_code}")
+            tee = UpstreamTee(method, target, resp.status_code, dict(resp.headers))
+            try:
+                for chunk in resp.iter_content(STREAM_CHUNK_BYTES):
+                    tee.feed(chunk)
+            except BaseException:
+                tee.abort()
+                raise
+            _, committed = tee.finish(_wire_bytes(resp))
+            if not committed:
+                raise IOError(f"Truncated upstream body: {tee.writer.size}/{tee.expected} bytes")
+        finally:
+            resp.close()
+        with _refresh_lock:
+            refresh_stats["refreshed"] += 1
+    except Exception as e:
+        with _refresh_lock:
+            refresh_stats["failed"] += 1
+        print(f"⚠️  Refresh thất bại, giữ entry cũ: {target} ({e.__class__.__name__}: {e})")
+    finally:
+        if acquired:
+            upstream_limiter.release()
+        origin_flight.leave(key, call)
+
+def _revalidate_if_stale(key: str, target: str, content_type: str, fetched_at: float):
+    """Entry quá hạn theo CACHE_FRESHNESS: lên lịch 1 lần refresh nền (request hiện tại vẫn trả entry cũ)"""
+    if not LIVE_FALLBACK or not fetched_at:
+        return
+    max_age = _max_age_for(content_type)
+    now = time.time()
+    if max_age is None or now - fetched_at <= max_age:
+        return
+    with _refresh_lock:
+        if now - _refresh_tried.get(key, 0) < REFRESH_RETRY_SECONDS:
+            return
+        if len(_refresh_tried) > 100000:
+            _refresh_tried.clear()
+        _refresh_tried[key] = now
+    # Đã có request khác đang fetch key này (miss hoặc refresh) thì thôi
+    call, leader = origin_flight.join(key)
+    if not leader:
+        return
+    with _refresh_lock:
+        refresh_stats["scheduled"] += 1
+    _refresher.submit(_refresh_entry, "GET", target, key, call)
+
+def _failure_response(failure: dict):
+    """Response từ negative cache: lỗi origin đã biết (còn hạn TTL), không gọi lại origin"""
+    status = failure["status"]
+    if not status:
+        return Response(f"Upstream error: {failure['error']}", status=502)
+    headers = failure["headers"]
+    content_type = headers.get("Content-Type", "application/octet-stream")
+    body = failure["body"]
+    if is_textual(content_type):
+        body = _rewriter.rewrite_body(body, charset_of(content_type))
+    headers_out = {
+        k: v for k, v in headers.items()
+        if k.lower() not in ("content-length", "content-encoding", "transfer-encoding")
+    }
+    headers_out["Content-Length"] = str(len(body))
+    return Response(body, status=status, headers=headers_out, content_type=content_type)
+
+def _tee_response(resp, method: str, target: str, key: str, call: dict):
+    """Response stream body origin cho client + ghi cache; leader của single-flight rời đi khi stream xong"""
+    tee = UpstreamTee(method, target, resp.status_code, dict(resp.headers))
+    state = {"started": False, "finished": False, "closed": False}
+
+    def generate():
+        state["started"] = True
+        try:
+            for chunk in resp.iter_content(STREAM_CHUNK_BYTES):
+                out = tee.feed(chunk)
+                if out:
+                    yield out
+            state["finished"] = True
+            tail, committed = tee.finish(_wire_bytes(resp))
+            if not committed:
+                raise IOError(f"Truncated upstream body: {tee.writer.size}/{tee.expected} bytes ({target})")
+        finally:
+            # Entry đã commit (hoặc bị bỏ) -> cho request đang chờ chạy tiếp ngay, không đợi close()
+            cleanup()
+        if tail:
+            yield tail
+
+    def cleanup():
+        if state["closed"]:
+            return
+        state["closed"] = True
+        try:
+            if not state["started"]:
+                # HEAD / 204 / 304: server không đọc body - vẫn tải hết để lưu cache như trước
+                for chunk in resp.iter_content(STREAM_CHUNK_BYTES):
+                    tee.feed(chunk)
+                state["finished"] = True
+                tee.finish(_wire_bytes(resp))
+        except Exception:
+            pass
+        finally:
+            # Lỗi mạng giữa chừng / client ngắt kết nối: bỏ file tạm, request đang chờ sẽ tự fetch lại
+            if not state["finished"]:
+                tee.abort()
+            resp.close()
+            upstream_limiter.release()
+            origin_flight.leave(key, call)
+
+    response = Response(generate(), status=tee.status, headers=tee.headers_out(), content_type=tee.content_type)
+    response.call_on_close(cleanup)
+    return response
 
 def _proxy_get(path: str):
     # Chỉ proxy cho domain cho phép
-    target = urllib.parse.urljoin(ORIGIN, path)
-    raw_qs = request.query_string.decode("utf-8")
-    if raw_qs:
-        target = f"{target}?{raw_qs}"
+    target = _target_url(path, request.query_string.decode("utf-8"))
 
     # Kiểm tra domain an toàn
-    parsed = urllib.parse.urlparse(target)
-    if parsed.netloc.lower().split(":")[0].endswith(ALLOWED_HOST) is False:
+    if not _is_allowed(target):
         return Response("Forbidden host", status=403)
 
     method = "GET"
-    cached = _load_cache(method, target)
+    key = _cache_key(method, target)
+    accept_encoding = request.headers.get("Accept-Encoding", "")
+    if RESPONSE_CACHE_BYTES > 0:
+        ready = response_cache.get(key, lambda k: cache_store.entry_fetched_at(k, CACHE_DIR))
+        if ready:
+            status, headers_out, content_type, body_out, fetched_at = ready
+            _revalidate_if_stale(key, target, content_type, fetched_at)
+            if is_not_modified(headers_out):
+                return Response(status=304, headers=validators_only(headers_out))
+            return Response(body_out, status=status, headers=headers_out, content_type=content_type)
+
+    # Chỉ cần metadata để trả 304 (ETag từ hash body) - không đọc body
+    meta = _load_cache_meta(method, target)
+    if meta is not None:
+        headers = meta.get("headers", {})
+        content_type = headers.get("Content-Type", "application/octet-stream")
+        variant = served_variant(meta, content_type, accept_encoding)
+        validators = cache_validators(meta, variant, content_type)
+        # Refresh nền (SWR) chỉ lên lịch sau khi body cũ đã mở / đọc: refresh thay entry sớm
+        # cũng không đổi response của request này
+        if is_not_modified(validators):
+            _revalidate_if_stale(key, target, content_type, meta.get("fetched_at"))
+            return Response(status=304, headers=validators)
+
+        # Nhị phân (ảnh, font, pdf...) lưu identity: stream thẳng từ file, không đọc vào RAM
+        if variant == "identity":
+            opened = _open_cache_body(method, target, meta)
+            if opened:
+                body_file, meta = opened
+                _revalidate_if_stale(key, target, content_type, meta.get("fetched_at"))
+                return file_response(body_file, headers, int(meta.get("status", 200)), validators)
+
+    cached = _load_cache_encoded(method, target, accept_encoding)
+    # Chưa có entry tốt: URL lỗi gần đây (negative cache còn hạn) thì trả lỗi đã nhớ ngay
+    failure = None if cached else cache_store.load_failure(key, CACHE_DIR)
+    meta = {}
+    validators = {}
 
     if cached:
-        body, meta = cached
+        body, meta, encoding = cached
         headers = meta.get("headers", {})
         status = int(meta.get("status", 200))
+        content_type = headers.get("Content-Type", "application/octet-stream")
+        validators = cache_validators(meta, served_variant(meta, content_type, accept_encoding), content_type)
+        _revalidate_if_stale(key, target, content_type, meta.get("fetched_at"))
+        if encoding != "identity":
+            return precompressed_response(body, headers, status, encoding, validators)
+    elif failure:
+        return _failure_response(failure)
     elif LIVE_FALLBACK:
-        # Lấy mới từ origin & lưu cache (chỉ nếu chưa có cache)
-        resp = session.get(
-            target,
-            headers={"User-Agent": UA, "Accept-Encoding": "identity"},
-            timeout=TIMEOUT,
-            allow_redirects=True,
-        )
-        status = resp.status_code
-        body = resp.content  # requests trả về đã giải nén nếu cần
-        headers = dict(resp.headers)
-        # Chỉ lưu cache nếu chưa có cache (không ghi đè cache cũ)
-        if not cached:
-            _save_cache(method, target, body, headers, status)
+        # Lấy mới từ origin: stream cho client đồng thời ghi cache (tee), miss đồng thời cùng URL
+        # chỉ gọi origin 1 lần - các request khác chờ rồi đọc entry vừa lưu
+        call, leader = origin_flight.join(key)
+        if not leader:
+            try:
+                origin_flight.wait(call)
+            except requests.RequestException:
+                pass  # lỗi kết nối đã được leader ghi vào negative cache
+            return _proxy_get(path)
+        if not upstream_limiter.acquire(_client_class(request.headers.get("User-Agent")), UPSTREAM_QUEUE_TIMEOUT):
+            # Không lỗi: request đang chờ cùng URL tự xếp hàng lại theo lớp client của mình
+            origin_flight.leave(key, call)
+            return _busy_response()
+        try:
+            resp = _open_origin(target)
+        except requests.RequestException as e:
+            # Lỗi kết nối / timeout: nhớ trong negative cache (TTL ngắn) để không gọi lại origin liên tục
+            error = e.__class__.__name__
+            cache_store.remember_failure(key, target, 0, error=error, cache_dir=CACHE_DIR)
+            upstream_limiter.release()
+            origin_flight.leave(key, call, e)
+            return Response(f"Upstream error: {error}", status=502)
+        except Exception as e:
+            upstream_limiter.release()
+            origin_flight.leave(key, call, e)
+            raise
+        return _tee_response(resp, method, target, key, call)
     else:
         return Response("Offline cache miss", status=404)
 
     content_type = headers.get("Content-Type", "application/octet-stream")
 
     # Tất cả textual (HTML/CSS/JS/JSON) => rewrite domain tuyệt đối về LOCAL_BASE
-    if _is_textual(content_type):
-        # lấy charset nếu có
-        m = re.search(r"charset=([^;]+)", content_type, flags=re.I)
-        enc = (m.group(1).strip() if m else "utf-8")
-        try:
-            text = body.decode(enc, errors="replace")
-        except Exception:
-            text = body.decode("utf-8", errors="replace")
-
-        text = _rewrite_text(text)
-        body_out = text.encode(enc, errors="replace")
+    # (entry lưu sau khi có nén biết trước body có URL cần rewrite hay không: meta["origin_refs"],
+    # trừ charset không tương thích ASCII như UTF-16 - luôn rewrite)
+    if is_textual(content_type) and cache_store.needs_rewrite(meta):
+        # Ghép các đoạn không đổi + LOCAL_BASE theo offset tính sẵn lúc lưu (meta["rewrite_offsets"]),
+        # entry cũ chưa có offset thì quét 1 lượt regex trên bytes
+        parts, length = _rewriter.spliced(body, charset_of(content_type), meta.get("rewrite_offsets"))
 
         headers_out = {
             k: v for k, v in headers.items()
             if k.lower() not in ("content-length", "content-encoding", "transfer-encoding")
         }
-        headers_out["Content-Length"] = str(len(body_out))
+        headers_out["Content-Length"] = str(length)
         headers_out["Content-Encoding"] = "identity"
+        headers_out = with_validators(headers_out, validators)
+        if RESPONSE_CACHE_BYTES > 0:
+            body_out = b"".join(parts)
+            response_cache.put(key, status, headers_out, content_type, body_out, meta.get("fetched_at"))
+            return Response(body_out, status=status, headers=headers_out, content_type=content_type)
 
-        return Response(body_out, status=status, headers=headers_out, content_type=content_type)
+        return Response(parts, status=status, headers=headers_out, content_type=content_type)
 
     # Nhị phân (ảnh, font, pdf...): trả nguyên vẹn, bỏ content-encoding để tránh lệch
     headers_out = {
@@ -135,6 +684,7 @@ def _proxy_get(path: str):
         if k.lower() not in ("content-length", "content-encoding", "transfer-encoding")
     }
     headers_out["Content-Length"] = str(len(body))
+    headers_out = with_validators(headers_out, validators)
     return Response(body, status=status, headers=headers_out, content_type=content_type)
 
 # ================== MENU GENERATOR ==================
@@ -455,6 +1005,12 @@ def _generate_select_options(params, select_type):
 
 # ============================================
 
+def _ajax_can_generate(cat: str) -> bool:
+    """cat mà ajax_handler tự generate từ tree_title.json khi cache miss (không cần gọi origin)"""
+    if cat in ("leftMenu", "titleCar"):
+        return True
+    return bool(cat) and cat.startswith("get_") and cat[4:] in ("marke", "year", "model", "mkb")
+
 @app.route("/ajax.php", methods=["GET"])
 def ajax_handler():
     """Handle AJAX requests - ưu tiên cache, fallback về generate từ tree_title.json"""
@@ -484,7 +1040,7 @@ def ajax_handler():
         status = int(meta.get("status", 200))
         content_type = headers.get("Content-Type", "text/html")
         
-        if _is_textual(content_type):
+        if is_textual(content_type):
             enc = "utf-8"
             try:
                 text = body.decode(enc, errors="replace")
@@ -527,9 +1083,18 @@ def ajax_handler():
 
 @app.route("/_cache_stats")
 def cache_stats():
-    # Thống kê sơ bộ
-    n = len([f for f in os.listdir(CACHE_DIR) if f.endswith(".bin")])
-    return {"cached_responses": n, "live_fallback": LIVE_FALLBACK, "origin": ORIGIN}
+    # Bộ đếm duy trì trong index (entries, bytes, theo content-type/status); ?recount=1 để đếm lại (chậm)
+    stats = cache_store.cache_stats(CACHE_DIR, recount=request.args.get("recount") == "1")
+    return {
+        "cached_responses": stats["entries"], "cache": stats,
+        "live_fallback": LIVE_FALLBACK, "origin": ORIGIN,
+        "response_cache": response_cache.stats(),
+        "origin_fetches": origin_flight.stats(),
+        "negative_cache": cache_store.failure_stats(CACHE_DIR),
+        "refresh": dict(refresh_stats, policy=CACHE_FRESHNESS or None),
+        "origin_transfer": dict(transfer_stats, accept_encoding=ORIGIN_ACCEPT_ENCODING),
+        "upstream": upstream_limiter.stats(),
+    }
 
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>", methods=["GET"])
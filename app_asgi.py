@@ -0,0 +1,287 @@
+"""
+Chế độ ASGI/async cho proxy cache (production, nhiều worker).
+
+    uvicorn app_asgi:app --host 0.0.0.0 --port 5002 --workers 4
+
+- Cache miss cần gọi origin: fetch non-blocking bằng httpx.AsyncClient dùng chung (pool kết nối,
+  keep-alive), body stream thẳng cho client đồng thời ghi cache ngoài event loop (asyncio.to_thread)
+  - 1 origin chậm không giữ thread nào. HEAD miss chỉ trả header, body vẫn tải tiếp vào cache.
+- Mọi thứ còn lại (cache hit, 304, Range, nén sẵn, rewrite, ajax generate, /_cache_stats) chạy đúng
+  code Flask của app.py trong thread pool, body stream theo từng khối cũng đọc ngoài event loop
+  => hành vi hit/miss giống hệt `python app.py`.
+"""
+
+import io
+import os
+import sys
+import asyncio
+import urllib.parse
+
+import httpx
+import cache_store
+import app as flask_proxy
+
+# Pool kết nối tới origin (mỗi worker process 1 pool)
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+# Gom các khối body WSGI tới ngần này bytes mỗi lần sang thread pool
+STREAM_CHUNK_BYTES = 64 * 1024
+
+_client = None
+# Single-flight: cache key -> Future xong khi leader đã stream + lưu xong (gộp miss đồng thời trong worker)
+_inflight = {}
+
+def _get_client() -> httpx.AsyncClient:
+    # Tạo lười trong event loop của worker (server không hỗ trợ lifespan vẫn chạy được)
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            headers={"User-Agent": flask_proxy.UA, "Accept-Encoding": flask_proxy.ORIGIN_ACCEPT_ENCODING},
+            timeout=flask_proxy.TIMEOUT,
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            ),
+        )
+    return _client
+
+def _needs_origin(path: str, raw_qs: str) -> str:
+    """URL cần lấy từ origin trước khi giao cho Flask (miss + được phép gọi origin), ngược lại None"""
+    if not flask_proxy.LIVE_FALLBACK or path == "/_cache_stats":
+        return None
+    if path == "/ajax.php":
+        cat = urllib.parse.parse_qs(raw_qs).get("cat", [None])[0]
+        if flask_proxy._ajax_can_generate(cat):
+            return None
+        # ajax_handler ghép URL thẳng, không qua urljoin
+        target = f"{flask_proxy.ORIGIN}/ajax.php" + (f"?{raw_qs}" if raw_qs else "")
+    else:
+        target = flask_proxy._target_url(path, raw_qs)
+    if not flask_proxy._is_allowed(target):
+        return None
+    key = flask_proxy._cache_key("GET", target)
+    if cache_store.is_cached(target, "GET", flask_proxy.CACHE_DIR):
+        return None
+    # Lỗi còn hạn trong negative cache: Flask trả lỗi đã nhớ
+    if cache_store.load_failure(key, flask_proxy.CACHE_DIR) is not None:
+        return None
+    return target
+
+async def _acquire_upstream(cls: str) -> bool:
+    """Slot fetch origin từ app.upstream_limiter (dùng chung với Flask) - chờ bằng future, không giữ thread"""
+    limiter = flask_proxy.upstream_limiter
+    loop = asyncio.get_running_loop()
+    granted = loop.create_future()
+
+    def grant():
+        loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(True))
+
+    state = limiter.try_acquire(cls, grant)
+    if state != limiter.QUEUED:
+        return state == limiter.ACQUIRED
+    try:
+        await asyncio.wait_for(asyncio.shield(granted), flask_proxy.UPSTREAM_QUEUE_TIMEOUT)
+        return True
+    except asyncio.TimeoutError:
+        # Slot có thể vừa được trao đúng lúc hết hạn
+        return not limiter.cancel(cls, grant)
+    except asyncio.CancelledError:
+        if not limiter.cancel(cls, grant):
+            limiter.release()
+        raise
+
+async def _stream_origin(method: str, target: str, send, head: bool = False):
+    """
+    Leader của cache miss: stream body origin cho client (rewrite dần nếu là text) đồng thời ghi file tạm
+    trong cache, nhận đủ byte mới commit thành entry (app.UpstreamTee). Ghi file chạy ngoài event loop.
+    head=True (HEAD): client chỉ nhận header, body vẫn được tải hết vào cache sau khi response đã xong.
+    """
+    async with _get_client().stream("GET", target) as resp:
+        tee = flask_proxy.UpstreamTee(method, target, resp.status_code, cache_store.headers_from_raw(resp.headers.raw))
+        finished = False
+        try:
+            await send({"type": "http.response.start", "status": tee.status, "headers": [
+                (k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in tee.headers_out().items()
+            ]})
+            if head:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            # httpx giải nén gzip/br khi stream; body thiếu byte -> httpx.RemoteProtocolError
+            async for chunk in resp.aiter_bytes(flask_proxy.STREAM_CHUNK_BYTES):
+                out = await asyncio.to_thread(tee.feed, chunk)
+                if out and not head:
+                    await send({"type": "http.response.body", "body": out, "more_body": True})
+            finished = True
+            tail, committed = await asyncio.to_thread(tee.finish, resp.num_bytes_downloaded)
+            if not committed:
+                raise IOError(f"Truncated upstream body: {tee.writer.size}/{tee.expected} bytes ({target})")
+            if not head:
+                await send({"type": "http.response.body", "body": tail, "more_body": False})
+        finally:
+            # Lỗi mạng giữa chừng / client ngắt kết nối: bỏ file tạm, request đang chờ sẽ tự fetch lại
+            if not finished:
+                await asyncio.to_thread(tee.abort)
+
+async def _serve_miss(scope, send) -> bool:
+    """
+    Cache miss cần gọi origin: request đầu tiên của mỗi key stream từ origin (tee), các request cùng key
+    đến trong lúc đó chờ (đếm vào app.origin_flight) rồi giao cho Flask đọc entry vừa lưu.
+    Returns: True nếu đã trả response; False để Flask xử lý (cache hit, ajax generate, 403, offline...).
+    """
+    path, raw_qs = scope["path"], scope["query_string"].decode("utf-8")
+    head = scope["method"] == "HEAD"
+    while True:
+        target = await asyncio.to_thread(_needs_origin, path, raw_qs)
+        if target is None:
+            return False
+        key = flask_proxy._cache_key("GET", target)
+        pending = _inflight.get(key)
+        flask_proxy.origin_flight.record(leader=pending is None)
+        if pending is not None:
+            try:
+                # shield: 1 client ngắt kết nối không huỷ future mà request khác đang chờ
+                await asyncio.shield(pending)
+            except httpx.HTTPError as e:
+                await _plain(send, 502, f"Upstream error: {e.__class__.__name__}")
+                return True
+            # Entry đã lưu -> Flask trả như cache hit; leader bị cắt ngang -> thử lại
+            continue
+
+        done = _inflight[key] = asyncio.get_running_loop().create_future()
+        started = acquired = False
+
+        async def tracked_send(message):
+            nonlocal started
+            started = True
+            await send(message)
+
+        try:
+            user_agent = dict(scope["headers"]).get(b"user-agent", b"").decode("latin-1")
+            acquired = await _acquire_upstream(flask_proxy._client_class(user_agent))
+            if not acquired:
+                # Không lỗi: request đang chờ cùng URL tự xếp hàng lại theo lớp client của mình
+                await _plain(send, 503, "Upstream busy, retry later",
+                             [(b"retry-after", str(flask_proxy.UPSTREAM_RETRY_AFTER).encode("latin-1"))])
+                return True
+            await _stream_origin("GET", target, tracked_send, head)
+        except (httpx.HTTPError, IOError) as e:
+            if started and head:
+                # HEAD đã trả xong header: chỉ mất entry, request đang chờ sẽ tự fetch lại
+                print(f"⚠️  Không lưu được cache sau HEAD: {target} ({e.__class__.__name__}: {e})")
+                return True
+            if started or not isinstance(e, httpx.HTTPError):
+                raise
+            # Không kết nối được origin: nhớ trong negative cache, request đang chờ cũng nhận lỗi này
+            await asyncio.to_thread(
+                cache_store.remember_failure, key, target, 0,
+                error=e.__class__.__name__, cache_dir=flask_proxy.CACHE_DIR,
+            )
+            done.set_exception(e)
+            done.exception()  # đánh dấu đã xử lý (không ai chờ thì asyncio không cảnh báo)
+            await _plain(send, 502, f"Upstream error: {e.__class__.__name__}")
+            return True
+        finally:
+            if acquired:
+                flask_proxy.upstream_limiter.release()
+            # Bỏ key sau khi đã ghi cache: request đến sau sẽ thấy cache hit
+            del _inflight[key]
+            if not done.done():
+                done.set_result(None)
+        return True
+
+def _environ(scope, body: bytes) -> dict:
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client")
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0] if client else "",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope["headers"]:
+        name, value = raw_name.decode("latin-1").upper().replace("-", "_"), raw_value.decode("latin-1")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = "HTTP_" + name
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+def _next_block(iterator):
+    """Đọc (trong thread) các khối body tới ~STREAM_CHUNK_BYTES: (bytes, hết body chưa)"""
+    parts, size = [], 0
+    for chunk in iterator:
+        if chunk:
+            parts.append(chunk)
+            size += len(chunk)
+        if size >= STREAM_CHUNK_BYTES:
+            return b"".join(parts), False
+    return b"".join(parts), True
+
+async def _call_flask(scope, body: bytes, send):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    def run():
+        result = flask_proxy.app(_environ(scope, body), start_response)
+        iterator = iter(result)
+        return result, iterator, _next_block(iterator)
+
+    result, iterator, (block, done) = await asyncio.to_thread(run)
+    try:
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        while not done:
+            await send({"type": "http.response.body", "body": block, "more_body": True})
+            block, done = await asyncio.to_thread(_next_block, iterator)
+        await send({"type": "http.response.body", "body": block, "more_body": False})
+    finally:
+        if hasattr(result, "close"):
+            await asyncio.to_thread(result.close)
+
+async def _plain(send, status: int, text: str, headers=None):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8")] + (headers or [])})
+    await send({"type": "http.response.body", "body": text.encode("utf-8")})
+
+async def _lifespan(receive, send):
+    global _client
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            _get_client()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if _client is not None:
+                await _client.aclose()
+                _client = None
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+
+    if scope["method"] in ("GET", "HEAD") and await _serve_miss(scope, send):
+        return
+    await _call_flask(scope, body, send)
@@ -1,5 +1,11 @@
-import os, re, json, hashlib, urllib.parse
+import os, json, urllib.parse
 from flask import Flask, request, Response
+import cache_store
+from cache_http import (
+    is_textual, served_variant, cache_validators, is_not_modified,
+    with_validators, precompressed_response, file_response,
+)
+from url_rewrite import Rewriter, charset_of
 
 # ================== CONFIG ==================
 # OFFLINE VIEWER - Port 5003
@@ -8,6 +14,8 @@ ORIGIN = os.getenv("ORIGIN", "https://kiagds.ru")
 LOCAL_BASE = os.getenv("LOCAL_BASE", "http://localhost:5003")  # Port 5003
 CACHE_DIR = os.getenv("CACHE_DIR", "cache")  # Dùng chung cache với crawl process
 os.makedirs(CACHE_DIR, exist_ok=True)
+# Index SQLite mở mode=ro: viewer không tạo / migrate / đếm lại cache_dir/index.sqlite3
+cache_store.READ_ONLY = True
 
 LIVE_FALLBACK = False  # OFFLINE ONLY - Hardcode, không cho phép đổi
 # Không có session vì không fetch từ internet
@@ -20,49 +28,31 @@ app = Flask(__name__)
 # Note: Không tạo session vì không fetch từ internet
 
 def _cache_key(method: str, url: str) -> str:
-    return hashlib.sha256(f"{method} {url}".encode("utf-8")).hexdigest()
-
-def _paths(method: str, url: str):
-    key = _cache_key(method, url)
-    return os.path.join(CACHE_DIR, key + ".bin"), os.path.join(CACHE_DIR, key + ".json")
+    return cache_store.cache_key(method, url)
 
 def _load_cache(method: str, url: str):
-    """Load cache - READ ONLY, không ghi đè"""
-    bin_path, meta_path = _paths(method, url)
-    if not (os.path.exists(bin_path) and os.path.exists(meta_path)):
-        return None
-    with open(bin_path, "rb") as f:
-        body = f.read()
-    with open(meta_path, "r", encoding="utf-8") as f:
-        meta = json.load(f)
-    return body, meta
-
-def _is_type(content_type: str, needle: str) -> bool:
-    ct = (content_type or "").lower()
-    return needle in ct
-
-def _is_html(content_type: str) -> bool:
-    return _is_type(content_type, "text/html") or _is_type(content_type, "application/xhtml")
-
-def _is_textual(content_type: str) -> bool:
-    ct = (content_type or "").lower()
-    return (
-        "text/" in ct
-        or "javascript" in ct
-        or ct.startswith("application/json")
-        or ct.startswith("application/xml")
-        or ct.startswith("application/xhtml")
-    )
+    """Load cache - READ ONLY, không ghi đè (đọc được cả layout phẳng và sharded)"""
+    return cache_store.load_entry(_cache_key(method, url), CACHE_DIR)
+
+def _load_cache_meta(method: str, url: str):
+    """Chỉ metadata (index / sidecar) - đủ để trả 304 mà không đọc body"""
+    return cache_store.load_meta(_cache_key(method, url), CACHE_DIR)
+
+def _open_cache_body(method: str, url: str, meta: dict = None):
+    """(file body, meta) để stream thẳng từ đĩa - None nếu miss hoặc body lưu dạng nén"""
+    return cache_store.open_body(_cache_key(method, url), CACHE_DIR, meta)
+
+def _load_cache_encoded(method: str, url: str, accept_encoding: str):
+    """Body nén sẵn (gzip/br/zstd) nếu client chấp nhận và body không cần rewrite"""
+    accepted = cache_store.parse_accept_encoding(accept_encoding)
+    return cache_store.load_encoded(_cache_key(method, url), accepted, CACHE_DIR)
+
+_rewriter = Rewriter(LOCAL_BASE)
 
 def _rewrite_text(s: str) -> str:
     """Rewrite URLs về LOCAL_BASE (port 5003)"""
-    # https://kiagds.ru/... -> http://localhost:5003/...
-    s = re.sub(r"https?://kiagds\.ru", LOCAL_BASE, s, flags=re.I)
-    # //kiagds.ru/...       -> //localhost:5003/...
-    s = re.sub(r"(?<!:)//kiagds\.ru", "//localhost:5003", s, flags=re.I)
-    # Also rewrite localhost:5002 -> localhost:5003 (nếu có trong cache từ crawl process)
-    s = re.sub(r"http://localhost:5002", LOCAL_BASE, s, flags=re.I)
-    return s
+    # https://kiagds.ru/... và //kiagds.ru/... (cả http://localhost:5002/...) -> LOCAL_BASE, 1 lượt regex
+    return _rewriter.rewrite_text(s)
 
 def _proxy_get(path: str):
     """Proxy GET - OFFLINE ONLY, chỉ dùng cache, không fetch từ internet"""
@@ -78,12 +68,35 @@ def _proxy_get(path: str):
         return Response("Forbidden host", status=403)
 
     method = "GET"
-    cached = _load_cache(method, target)
+    accept_encoding = request.headers.get("Accept-Encoding", "")
+    # Chỉ cần metadata để trả 304 (ETag từ hash body) - không đọc body
+    meta = _load_cache_meta(method, target)
+    if meta is not None:
+        headers = meta.get("headers", {})
+        content_type = headers.get("Content-Type", "application/octet-stream")
+        variant = served_variant(meta, content_type, accept_encoding)
+        validators = cache_validators(meta, variant, content_type)
+        if is_not_modified(validators):
+            return Response(status=304, headers=validators)
+
+        # Nhị phân (ảnh, font, pdf...) lưu identity: stream thẳng từ file, không đọc vào RAM
+        if variant == "identity":
+            opened = _open_cache_body(method, target, meta)
+            if opened:
+                body_file, meta = opened
+                return file_response(body_file, headers, int(meta.get("status", 200)), validators)
+
+    cached = _load_cache_encoded(method, target, accept_encoding)
+    meta = {}
 
     if cached:
-        body, meta = cached
+        body, meta, encoding = cached
         headers = meta.get("headers", {})
         status = int(meta.get("status", 200))
+        content_type = headers.get("Content-Type", "application/octet-stream")
+        validators = cache_validators(meta, served_variant(meta, content_type, accept_encoding), content_type)
+        if encoding != "identity":
+            return precompressed_response(body, headers, status, encoding, validators)
     else:
         # OFFLINE ONLY - không fetch từ internet
         return Response("Offline cache miss - This URL is not cached yet. Please wait for crawler to cache it at port 5002.", status=404)
@@ -91,25 +104,22 @@ def _proxy_get(path: str):
     content_type = headers.get("Content-Type", "application/octet-stream")
 
     # Tất cả textual (HTML/CSS/JS/JSON) => rewrite domain về LOCAL_BASE (5003)
-    if _is_textual(content_type):
-        m = re.search(r"charset=([^;]+)", content_type, flags=re.I)
-        enc = (m.group(1).strip() if m else "utf-8")
-        try:
-            text = body.decode(enc, errors="replace")
-        except Exception:
-            text = body.decode("utf-8", errors="replace")
-
-        text = _rewrite_text(text)
-        body_out = text.encode(enc, errors="replace")
+    # (entry lưu sau khi có nén biết trước body có URL cần rewrite hay không: meta["origin_refs"],
+    # trừ charset không tương thích ASCII như UTF-16 - luôn rewrite)
+    if is_textual(content_type) and cache_store.needs_rewrite(meta):
+        # Ghép các đoạn không đổi + LOCAL_BASE theo offset tính sẵn lúc lưu (meta["rewrite_offsets"]),
+        # entry cũ chưa có offset thì quét 1 lượt regex trên bytes
+        parts, length = _rewriter.spliced(body, charset_of(content_type), meta.get("rewrite_offsets"))
 
         headers_out = {
             k: v for k, v in headers.items()
             if k.lower() not in ("content-length", "content-encoding", "transfer-encoding")
         }
-        headers_out["Content-Length"] = str(len(body_out))
+        headers_out["Content-Length"] = str(length)
         headers_out["Content-Encoding"] = "identity"
+        headers_out = with_validators(headers_out, validators)
 
-        return Response(body_out, status=status, headers=headers_out, content_type=content_type)
+        return Response(parts, status=status, headers=headers_out, content_type=content_type)
 
     # Nhị phân (ảnh, font, pdf...): trả nguyên vẹn
     headers_out = {
@@ -117,6 +127,7 @@ def _proxy_get(path: str):
         if k.lower() not in ("content-length", "content-encoding", "transfer-encoding")
     }
     headers_out["Content-Length"] = str(len(body))
+    headers_out = with_validators(headers_out, validators)
     return Response(body, status=status, headers=headers_out, content_type=content_type)
 
 # ================== MENU GENERATOR ==================
@@ -461,7 +472,7 @@ def ajax_handler():
         status = int(meta.get("status", 200))
         content_type = headers.get("Content-Type", "text/html")
         
-        if _is_textual(content_type):
+        if is_textual(content_type):
             enc = "utf-8"
             try:
                 text = body.decode(enc, errors="replace")
@@ -490,10 +501,11 @@ def ajax_handler():
 
 @app.route("/_cache_stats")
 def cache_stats():
-    """Cache stats - chỉ đếm, không ảnh hưởng crawl"""
-    n = len([f for f in os.listdir(CACHE_DIR) if f.endswith(".bin")])
+    """Cache stats - bộ đếm duy trì trong index (viewer chỉ đọc nên không đếm lại)"""
+    stats = cache_store.cache_stats(CACHE_DIR)
     return {
-        "cached_responses": n, 
+        "cached_responses": stats["entries"],
+        "cache": stats,
         "live_fallback": False,  # OFFLINE ONLY
         "origin": ORIGIN,
         "port": 5003,
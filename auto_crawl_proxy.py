@@ -8,13 +8,17 @@ import asyncio
 import os
 import json
 import sys
-import hashlib
 import argparse
 import re
+import html as html_lib
 from typing import Set
 from urllib.parse import urlparse, urljoin, urlencode, parse_qs
 import httpx
-from bs4 import BeautifulSoup
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup, Tag
+import cache_store
+from crawl_frontier import Frontier, frontier_path
 
 # ================== CONFIG ==================
 PROXY_BASE = os.getenv("LOCAL_BASE", "http://localhost:5002")  # Proxy đang chạy
@@ -22,22 +26,41 @@ ORIGIN = os.getenv("ORIGIN", "https://kiagds.ru")
 CACHE_DIR = os.getenv("CACHE_DIR", "cache")
 IMPORTANT_LINKS_FILE = "important_links.json"
 UA = "AutoCrawler/1.0 (+respectful; via-proxy)"
+DIRECT_ACCEPT_ENCODING = "gzip, deflate, br" if cache_store.brotli is not None else "gzip, deflate"
+# --direct: đọc body origin theo khối này để ghi cache (giống STREAM_CHUNK_BYTES của proxy)
+DIRECT_CHUNK_BYTES = 64 * 1024
 os.makedirs(CACHE_DIR, exist_ok=True)
 # ============================================
 
 def cache_key(method: str, url: str) -> str:
     """Tạo cache key giống với app.py"""
-    return hashlib.sha256(f"{method} {url}".encode("utf-8")).hexdigest()
+    return cache_store.cache_key(method, url)
 
-def cache_paths(method: str, url: str):
-    """Tạo đường dẫn cache file giống với app.py"""
-    key = cache_key(method, url)
-    return os.path.join(CACHE_DIR, key + ".bin"), os.path.join(CACHE_DIR, key + ".json")
+def proxy_target(url: str) -> str:
+    """
+    URL origin mà proxy dùng làm cache key khi nhận url (giống app._target_url): path đã percent-decode
+    như Flask route, query giữ nguyên như httpx gửi đi. Chế độ --direct ghi entry đúng key này.
+    """
+    u = httpx.URL(url)
+    target = urljoin(ORIGIN, u.path)
+    if u.query:
+        target = f"{target}?{u.query.decode('ascii')}"
+    return target
 
 def is_cached(url: str) -> bool:
-    """Kiểm tra URL đã được cache chưa"""
-    bin_path, meta_path = cache_paths("GET", url)
-    return os.path.exists(bin_path) and os.path.exists(meta_path)
+    """Kiểm tra URL đã được cache chưa (layout phẳng hoặc sharded)"""
+    return cache_store.is_cached(proxy_target(url), cache_dir=CACHE_DIR)
+
+def is_known_bad(url: str) -> bool:
+    """URL lỗi gần đây (404/5xx/lỗi kết nối còn hạn trong negative cache của proxy)"""
+    return cache_store.is_known_bad(proxy_target(url), cache_dir=CACHE_DIR)
+
+def origin_transfer(url: str):
+    """(bytes trên đường truyền origin -> proxy, bytes body) proxy đã ghi khi lưu URL; None nếu không có số liệu"""
+    meta = cache_store.load_meta(cache_key("GET", proxy_target(url)), CACHE_DIR)
+    if not meta or meta.get("wire_size") is None:
+        return None
+    return meta["wire_size"], meta.get("size") or 0
 
 def has_docid_and_page(url: str) -> bool:
     """Kiểm tra URL có chứa docId và page không"""
@@ -52,6 +75,7 @@ def extract_docids_from_html(base_url: str, html: str) -> Set[str]:
     """
     Extract tất cả docId từ HTML (từ ajaxHref, href, docid attribute)
     Returns: Set of docId values (strings)
+    (Bản tham chiếu - crawl() dùng extract_page(), cho kết quả giống hệt trong 1 lần parse)
     """
     soup = BeautifulSoup(html, "html.parser")
     docids = set()
@@ -189,6 +213,7 @@ def extract_pagination_info(base_url: str, html: str):
     Returns: (max_page, pagination_type)
     - max_page: số trang tối đa (None nếu không tìm thấy)
     - pagination_type: 'page_of' hoặc 'numbered' hoặc None
+    (Bản tham chiếu - crawl() dùng extract_page())
     """
     soup = BeautifulSoup(html, "html.parser")
     max_page = None
@@ -261,7 +286,7 @@ def extract_pagination_info(base_url: str, html: str):
     return None, None
 
 def extract_links(base_url: str, html: str):
-    """Extract tất cả links từ HTML"""
+    """Extract tất cả links từ HTML (bản tham chiếu - crawl() dùng extract_page())"""
     soup = BeautifulSoup(html, "html.parser")
     urls = set()
     
@@ -388,6 +413,310 @@ def extract_links(base_url: str, html: str):
     
     return urls
 
+# ================== EXTRACT 1 LƯỢT ==================
+
+# Kết quả extract của 1 trang HTML: links (set), docids (set), max_page / pagination_type (None nếu không có)
+PageInfo = namedtuple("PageInfo", ["links", "docids", "max_page", "pagination_type"])
+
+# Parser của BeautifulSoup: "html.parser" (mặc định, không cần cài thêm) hoặc "lxml" (nhanh hơn nhiều, uv pip install lxml)
+HTML_PARSER = os.getenv("CRAWL_HTML_PARSER", "html.parser")
+# Các giá trị --parser hợp lệ
+HTML_PARSERS = ("html.parser", "lxml")
+
+_LINK_ATTRS = {"a": "href", "link": "href", "script": "src", "img": "src", "source": "src", "iframe": "src", "form": "action"}
+_ORIGIN_URL_RE = re.compile(r'https?://kiagds\.ru[^\s"\'<>)]+')
+_ONCLICK_URL_RE = re.compile(r"(?:ajaxHref|location\.href|window\.location)\s*[=\(]\s*['\"]([^'\"]+)['\"]")
+_DOCID_QS_RE = re.compile(r'\?mode=[^\s"\'<>)]+docId=\d+')
+_AJAX_DOCID_RE = re.compile(r"ajaxHref\s*\(\s*['\"]([^'\"]*docId=(\d+)[^'\"]*)['\"]", re.IGNORECASE)
+_QS_DOCID_RE = re.compile(r'[?&]docId=(\d+)', re.IGNORECASE)
+_PAGE_OF_RE = re.compile(r'Page\s+(\d+)\s+of\s+(\d+)', re.IGNORECASE)
+_PAGE_PARAM_RE = re.compile(r'[&?]page=(\d+)')
+_PAGINATION_MARK_RE = re.compile(r'[«»]', re.I)
+_PAGE_TAGS = ("a", "span", "div", "li", "button")
+
+def _add_origin_urls(urls: set, text: str):
+    for u in _ORIGIN_URL_RE.findall(text):
+        try:
+            u = normalize_url(u)
+            if in_domain(u):
+                urls.add(u)
+        except Exception:
+            continue
+
+def _attr_links(urls: set, base_url: str, attr_name: str, attr_value: str):
+    """data-* / onclick / thuộc tính có docId - như phần cuối extract_links()"""
+    if attr_name.startswith('data-') and 'kiagds.ru' in attr_value:
+        _add_origin_urls(urls, attr_value)
+    if attr_name == 'onclick' and ('docId=' in attr_value or 'kiagds.ru' in attr_value):
+        for match in _ONCLICK_URL_RE.findall(attr_value):
+            try:
+                u = match if 'kiagds.ru' in match and not match.startswith(('?', '/')) else urljoin(base_url, match)
+                u = normalize_url(u)
+                if in_domain(u):
+                    urls.add(u)
+            except Exception:
+                continue
+        _add_origin_urls(urls, attr_value)
+    if 'docId=' in attr_value or 'kiagds.ru' in attr_value:
+        for qs in _DOCID_QS_RE.findall(attr_value):
+            try:
+                u = normalize_url(urljoin(base_url, qs))
+                if in_domain(u):
+                    urls.add(u)
+            except Exception:
+                continue
+        _add_origin_urls(urls, attr_value)
+
+class _PageCollector:
+    """
+    Phần chung của các extractor: nhận từng thẻ (tên + attrs) theo thứ tự tài liệu, gom links / docIds /
+    số trang. Extractor chỉ khác nhau ở cách tách thẻ (cây BeautifulSoup hoặc quét regex) và lấy text.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.links, self.docids, self.page_numbers = set(), set(), set()
+
+    def tag(self, name: str, attrs: dict):
+        # Links từ thẻ HTML
+        attr = _LINK_ATTRS.get(name)
+        href = attrs.get(attr) if attr else None
+        if href:
+            try:
+                u = urljoin(self.base_url, href)
+                if in_domain(u):
+                    self.links.add(normalize_url(u))
+            except Exception:
+                pass
+
+        # docid attribute (lowercase)
+        docid = attrs.get("docid")
+        if isinstance(docid, str) and docid and docid.isdigit():
+            self.docids.add(docid)
+
+        for attr_name, attr_value in attrs.items():
+            if not isinstance(attr_value, str):
+                continue
+            _attr_links(self.links, self.base_url, attr_name, attr_value)
+            # docId trong ajaxHref('...') / query string của onclick, href
+            if attr_name in ("onclick", "href") and attr_value:
+                for _, found in _AJAX_DOCID_RE.findall(attr_value):
+                    if found.isdigit():
+                        self.docids.add(found)
+                for found in _QS_DOCID_RE.findall(attr_value):
+                    if found.isdigit():
+                        self.docids.add(found)
+
+        # Số trang từ href có page= của a/link
+        if name in ("a", "link"):
+            href = attrs.get("href", "")
+            if href and 'page=' in href:
+                self.page_numbers.update(int(m) for m in _PAGE_PARAM_RE.findall(href) if m.isdigit())
+
+    def script(self, text: str):
+        """Nội dung <script> inline (script.string)"""
+        if text:
+            _add_origin_urls(self.links, text)
+
+    @staticmethod
+    def wants_text(name: str, attrs: dict) -> bool:
+        """Phần tử a/span/div/li/button có onclick/href với page= - cần text của nó (có thể là số trang)"""
+        return name in _PAGE_TAGS and ('page=' in attrs.get("onclick", "") or 'page=' in attrs.get("href", ""))
+
+    def page_text(self, text: str):
+        """text = get_text(strip=True) của phần tử wants_text()"""
+        try:
+            if text.isdigit() and 1 <= int(text) <= 1000:
+                self.page_numbers.add(int(text))
+        except ValueError:
+            pass
+
+    def result(self, html: str, full_text, mark_text) -> PageInfo:
+        """
+        full_text(): get_text() của cả trang (chỉ gọi khi HTML thô không có "Page X of Y")
+        mark_text: get_text() của phần tử chứa string đầu tiên có « / » (None nếu không có)
+        """
+        page_of = _PAGE_OF_RE.search(html) or _PAGE_OF_RE.search(full_text())
+        if page_of:
+            return PageInfo(self.links, self.docids, int(page_of.group(2)), 'page_of')
+        if mark_text is not None:
+            for num_str in re.findall(r'\b(\d+)\b', mark_text):
+                if 1 <= int(num_str) <= 1000:
+                    self.page_numbers.add(int(num_str))
+        if self.page_numbers:
+            return PageInfo(self.links, self.docids, max(self.page_numbers), 'numbered')
+        return PageInfo(self.links, self.docids, None, None)
+
+def extract_page(base_url: str, html: str, parser: str = None) -> PageInfo:
+    """
+    Links + docIds + pagination của 1 trang trong 1 lần parse và 1 lần duyệt cây
+    (thay cho extract_links() + extract_docids_from_html() + extract_pagination_info(), mỗi hàm tự parse
+    và find_all() nhiều lượt). Kết quả giống hệt 3 hàm đó (tests/test_extract_parity.py).
+    parser: parser BeautifulSoup ("html.parser", "lxml"...), mặc định HTML_PARSER.
+    """
+    soup = BeautifulSoup(html, parser or HTML_PARSER)
+    page = _PageCollector(base_url)
+    mark = None   # string đầu tiên có « hoặc » (khung pagination)
+
+    for node in soup.descendants:
+        if not isinstance(node, Tag):
+            if mark is None and isinstance(node, str) and _PAGINATION_MARK_RE.search(node):
+                mark = node
+            continue
+        attrs = node.attrs if isinstance(node.attrs, dict) else {}
+        page.tag(node.name, attrs)
+        if node.name == "script":
+            page.script(node.string)
+        if page.wants_text(node.name, attrs):
+            page.page_text(node.get_text(strip=True))
+
+    mark_text = mark.parent.get_text() if mark is not None and mark.parent else None
+    return page.result(html, soup.get_text, mark_text)
+
+# ---- Fast path: quét regex trên HTML thô, không dựng cây DOM ----
+
+# Tách token giống html.parser (parser mặc định của BeautifulSoup): comment, thẻ mở (giá trị attr trong
+# nháy có thể chứa ">"), thẻ đóng, CDATA có "]]>" đóng (nội dung là text, không phải thẻ),
+# khai báo <!...> / <?...>
+_TOKEN_RE = re.compile(
+    r"<!--.*?(?:-->|\Z)"
+    r"|<([a-zA-Z][^\t\n\r\f />\x00]*)((?:[^>\"']|\"[^\"]*\"|'[^']*')*)>"
+    r"|</([a-zA-Z][^\t\n\r\f />\x00]*)[^>]*>"
+    r"|<!\[CDATA\[(.*?)\]\s*\]\s*>"
+    r"|<[!?][^>]*>",
+    re.S,
+)
+_ATTR_RE = re.compile(
+    r"((?<=['\"\s/])[^\s/>][^\s/=>]*)(\s*=+\s*('[^']*'|\"[^\"]*\"|(?!['\"])[^>\s]*))?(?:\s|/(?!>))*"
+)
+# Nội dung thô (không có thẻ con) như html.parser
+_RAW_TEXT_TAGS = ("script", "style")
+# Thẻ rỗng: BeautifulSoup đóng ngay, không bao giờ là cha của text
+_VOID_TAGS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "menuitem", "meta",
+    "param", "source", "track", "wbr", "basefont", "bgsound", "command", "frame", "image", "isindex",
+    "nextid", "spacer",
+))
+
+def _parse_attrs(raw: str) -> dict:
+    """Attrs của thẻ mở như html.parser + BeautifulSoup: tên lowercase, giá trị unescape, không giá trị -> "" """
+    attrs = {}
+    for m in _ATTR_RE.finditer(" " + raw):
+        name, value = m.group(1).lower(), m.group(3)
+        if value is None:
+            value = ""
+        else:
+            if value[:1] in ("'", '"') and value[:1] == value[-1:] and len(value) > 1:
+                value = value[1:-1]
+            if "&" in value:
+                value = html_lib.unescape(value)
+        attrs[name] = value
+    return attrs
+
+def extract_page_fast(base_url: str, html: str, parser: str = None) -> PageInfo:
+    """
+    Như extract_page() nhưng không dựng cây: 1 lượt regex tách thẻ / text, giữ stack các thẻ đang mở
+    chỉ để biết text thuộc phần tử nào (số trang, khung «»). Nhanh hơn nhiều; có thể khác BeautifulSoup
+    với HTML hỏng nặng - tests/test_extract_parity.py kiểm tra trên corpus mẫu.
+    parser: bỏ qua (cùng chữ ký với extract_page để chọn qua EXTRACTORS).
+    """
+    page = _PageCollector(base_url)
+    texts = []        # các string text thường theo thứ tự (get_text() = "".join)
+    stack = []        # [tên thẻ, vị trí bắt đầu trong texts, cần text strip cho số trang?]
+    mark = None       # (phần tử cha hoặc None = cả trang, string có «», string đó là nội dung script/style?)
+    mark_text = None
+
+    def add_text(text: str, cdata: bool = False):
+        nonlocal mark
+        if "&" in text and not cdata:
+            text = html_lib.unescape(text)
+        if mark is None and _PAGINATION_MARK_RE.search(text):
+            mark = (stack[-1] if stack else None, text, False)
+        texts.append(text)
+
+    def close(entry):
+        nonlocal mark_text
+        if entry[2]:
+            page.page_text("".join(t.strip() for t in texts[entry[1]:]))
+        if mark is not None and mark[0] is entry and mark_text is None:
+            mark_text = "".join(texts[entry[1]:])
+
+    pos = 0
+    n = len(html)
+    while pos < n:
+        m = _TOKEN_RE.search(html, pos)
+        if m is None:
+            add_text(html[pos:])
+            break
+        if m.start() > pos:
+            add_text(html[pos:m.start()])
+        pos = m.end()
+        token = m.group(0)
+        if token.startswith("<!--"):
+            # Comment: không phải text của get_text(), nhưng vẫn là string khi tìm «»
+            if mark is None and _PAGINATION_MARK_RE.search(token[4:-3]):
+                mark = (stack[-1] if stack else None, token[4:-3], True)
+            continue
+        if m.group(4) is not None:
+            # CDATA: BeautifulSoup giữ thành string (CData) nguyên văn, có trong get_text()
+            add_text(m.group(4), cdata=True)
+            continue
+        if m.group(1):
+            name = m.group(1).lower()
+            raw = m.group(2)
+            self_closing = raw.endswith("/")
+            attrs = _parse_attrs(raw[:-1] if self_closing else raw)
+            page.tag(name, attrs)
+            if name in _RAW_TEXT_TAGS and not self_closing:
+                end = re.compile(r"</%s\s*>" % name, re.I).search(html, pos)
+                content = html[pos:end.start() if end else n]
+                pos = end.end() if end else n
+                if name == "script":
+                    page.script(content)
+                if mark is None and _PAGINATION_MARK_RE.search(content):
+                    # Cha của string là chính thẻ script/style: get_text() của nó là nội dung này
+                    mark = (None, content, True)
+                    mark_text = content
+                continue
+            if name in _VOID_TAGS or self_closing:
+                if page.wants_text(name, attrs):
+                    page.page_text("")
+                continue
+            stack.append([name, len(texts), page.wants_text(name, attrs)])
+        elif m.group(3):
+            # Thẻ đóng: đóng tới thẻ mở gần nhất cùng tên (không có thì bỏ qua) như BeautifulSoup
+            name = m.group(3).lower()
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i][0] == name:
+                    while len(stack) > i:
+                        close(stack.pop())
+                    break
+    while stack:
+        close(stack.pop())
+
+    if mark is not None and mark_text is None:
+        mark_text = "".join(texts) if mark[0] is None else mark[1]
+    return page.result(html, lambda: "".join(texts), mark_text)
+
+# Extractor chọn bằng --extractor / CRAWL_EXTRACTOR
+EXTRACTORS = {"soup": extract_page, "fast": extract_page_fast}
+DEFAULT_EXTRACTOR = os.getenv("CRAWL_EXTRACTOR", "soup")
+
+# Số process parse HTML (--parse-workers): 0 = parse ngay trong event loop như trước
+PARSE_WORKERS = int(os.getenv("CRAWL_PARSE_WORKERS", str(os.cpu_count() or 1)))
+
+def parse_page(url: str, content: bytes, content_type: str, extractor: str = "soup", parser: str = None) -> PageInfo:
+    """
+    Decode body theo charset của Content-Type + extract links / docIds / pagination.
+    Hàm top-level (pickle được) để crawl() chạy trong ProcessPoolExecutor, không chặn event loop.
+    """
+    enc = re.search(r"charset=([^;]+)", content_type, flags=re.I)
+    try:
+        text = content.decode(enc.group(1).strip() if enc else "utf-8", errors="replace")
+    except LookupError:
+        text = content.decode("utf-8", errors="replace")
+    return EXTRACTORS[extractor](url, text, parser)
+
 async def fetch_via_proxy(client: httpx.AsyncClient, url: str, proxy_base: str):
     """Fetch URL qua proxy"""
     # Chuyển đổi URL origin sang proxy URL
@@ -412,14 +741,115 @@ async def fetch_via_proxy(client: httpx.AsyncClient, url: str, proxy_base: str):
         print(f"[ERROR] {url}: {e}")
         raise
 
-async def fetch_via_proxy_with_retry(client: httpx.AsyncClient, url: str, proxy_base: str, max_retries: int = 10, verbose: bool = False):
-    """Fetch URL qua proxy với retry logic"""
+def _is_html_type(ctype: str) -> bool:
+    ctype = ctype.lower()
+    return "text/html" in ctype or "application/xhtml" in ctype
+
+def _read_response(status: int, headers, body: bytes, request: httpx.Request = None) -> httpx.Response:
+    """httpx.Response đã đọc xong (body identity) cho phần parse / retry của crawler"""
+    headers = [(k, v) for k, v in headers
+               if k.lower() not in ("content-encoding", "content-length", "transfer-encoding")]
+    return httpx.Response(status, headers=headers, content=body, request=request)
+
+def load_direct(url: str):
+    """
+    --direct: URL đã có trong cache thì dùng entry thay vì gọi lại origin (như cache hit của proxy).
+    Chỉ đọc body nếu là HTML (cần extract links); ảnh / PDF... chỉ đọc metadata.
+    Returns: httpx.Response hoặc None nếu entry không còn.
+    """
+    key = cache_key("GET", proxy_target(url))
+    meta = cache_store.load_meta(key, CACHE_DIR)
+    if meta is None:
+        return None
+    headers = meta.get("headers") or {}
+    ctype = next((v for k, v in headers.items() if k.lower() == "content-type"), "")
+    body = b""
+    if _is_html_type(ctype):
+        entry = cache_store.load_entry(key, CACHE_DIR)
+        if entry is None:
+            return None
+        body, meta = entry
+        headers = meta.get("headers") or {}
+    return _read_response(int(meta.get("status", 200)), headers.items(), body)
+
+def remember_direct_failure(url: str, error: Exception):
+    """--direct: lỗi kết nối / timeout sau lần thử cuối vào negative cache (TTL ngắn) như proxy"""
+    target = proxy_target(url)
+    cache_store.remember_failure(cache_key("GET", target), target, 0,
+                                 error=error.__class__.__name__, cache_dir=CACHE_DIR)
+
+def _direct_meta(url: str, r: httpx.Response):
+    """(target, meta, expected_length) cho entry của response lấy thẳng từ origin - giống app.UpstreamTee"""
+    target = proxy_target(url)
+    headers = cache_store.headers_from_raw(r.headers.raw)
+    meta = {"url": target, "status": r.status_code, "headers": headers}
+    length = headers.get("Content-Length", "")
+    encoded = headers.get("Content-Encoding", "identity").lower() != "identity"
+    expected = int(length) if length.isdigit() and not encoded else None
+    return target, meta, expected
+
+def _commit_direct(writer: cache_store.CacheWriter, meta: dict, expected: int = None) -> bool:
+    """Lỗi >= 400 vào negative cache có TTL thay vì thành entry; thiếu byte thì không lưu gì"""
+    if cache_store.is_error_status(meta["status"]):
+        return writer.commit_failure(meta, expected)
+    return writer.commit(meta, expected)
+
+async def save_direct(url: str, r: httpx.Response) -> bytes:
+    """
+    Stream body của response (mở bằng client.stream) vào cache giống hệt proxy: cùng key, cùng meta,
+    CacheWriter ghi từng chunk ngoài event loop và commit atomic. Chỉ giữ body trong RAM nếu là HTML
+    (crawler cần parse); ảnh / PDF... đi thẳng xuống file tạm. Returns: body HTML (b"" nếu không phải HTML).
+    """
+    target, meta, expected = _direct_meta(url, r)
+    keep = _is_html_type(r.headers.get("Content-Type", ""))
+    parts = []
+    writer = await asyncio.to_thread(cache_store.CacheWriter, cache_key("GET", target), CACHE_DIR)
+    try:
+        # httpx giải nén gzip/br khi stream (cache lưu identity); body thiếu byte -> httpx.RemoteProtocolError
+        async for chunk in r.aiter_bytes(DIRECT_CHUNK_BYTES):
+            await asyncio.to_thread(writer.write, chunk)
+            if keep:
+                parts.append(chunk)
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
+    meta["wire_size"] = r.num_bytes_downloaded
+    await asyncio.to_thread(_commit_direct, writer, meta, expected)
+    return b"".join(parts)
+
+async def fetch_direct(client: httpx.AsyncClient, url: str):
+    """
+    Fetch URL thẳng từ origin (--direct, không qua proxy), stream vào cache như proxy.
+    Lỗi kết nối / timeout chỉ vào negative cache sau lần thử cuối (fetch_via_proxy_with_retry).
+    """
+    try:
+        async with client.stream("GET", url) as r:
+            body = await save_direct(url, r)
+    except httpx.HTTPError as e:
+        print(f"[HTTP_ERROR] {url}: {e}")
+        raise
+    # Response đã đóng: trả bản đã đọc (chỉ body HTML) cho phần parse / retry của crawler
+    return _read_response(r.status_code, r.headers.multi_items(), body, r.request)
+
+async def fetch_via_proxy_with_retry(client: httpx.AsyncClient, url: str, proxy_base: str, max_retries: int = 10, verbose: bool = False, direct: bool = False):
+    """Fetch URL qua proxy (hoặc thẳng từ origin nếu direct) với retry logic"""
     last_exception = None
     
     for attempt in range(max_retries):
         try:
-            r = await fetch_via_proxy(client, url, proxy_base)
-            
+            if direct:
+                r = await fetch_direct(client, url)
+            else:
+                r = await fetch_via_proxy(client, url, proxy_base)
+
+            # Proxy quá tải origin (503 + Retry-After): chờ đúng thời gian proxy yêu cầu rồi thử lại
+            retry_after = r.headers.get("Retry-After", "")
+            if r.status_code == 503 and retry_after.isdigit() and attempt < max_retries - 1:
+                if verbose:
+                    print(f"  ⏳ Proxy bận, thử lại sau {retry_after}s: {url}")
+                await asyncio.sleep(int(retry_after))
+                continue
+
             # Nếu thành công ở lần retry thứ 2 trở đi, log ra
             if attempt > 0:
                 print(f"  ✅ Retry thành công sau {attempt + 1} lần thử: {url}")
@@ -445,6 +875,8 @@ async def fetch_via_proxy_with_retry(client: httpx.AsyncClient, url: str, proxy_
                 print(f"  ❌ Đã retry {max_retries} lần nhưng vẫn thất bại: {url}")
     
     # Raise exception cuối cùng nếu tất cả lần retry đều thất bại
+    if direct and isinstance(last_exception, httpx.HTTPError):
+        await asyncio.to_thread(remember_direct_failure, url, last_exception)
     raise last_exception
 
 def load_important_links() -> set:
@@ -500,11 +932,53 @@ async def append_to_important_links(new_urls: set, existing_urls: set, lock: asy
     return len(truly_new)
 
 async def crawl(args, proxy_base: str):
+    """
+    Crawl với frontier lưu trên đĩa (--frontier) + process pool parse HTML (--parse-workers);
+    luôn ghi nốt batch frontier cuối và dừng pool kể cả khi lỗi / Ctrl-C
+    """
+    try:
+        frontier = Frontier(args.frontier, resume=args.resume, fresh=args.fresh) if args.frontier else None
+    except FileExistsError as e:
+        print(f"❌ {e}")
+        print("   Dùng --resume để crawl tiếp, hoặc --fresh để bỏ frontier cũ và bắt đầu lại từ seed")
+        sys.exit(1)
+    parse_pool = ProcessPoolExecutor(max_workers=args.parse_workers) if args.parse_workers > 0 else None
+    try:
+        await _crawl(args, proxy_base, frontier, parse_pool)
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown(cancel_futures=True)
+        if frontier is not None:
+            frontier.close()
+
+async def _crawl(args, proxy_base: str, frontier: Frontier = None, parse_pool: ProcessPoolExecutor = None):
     seen = set()
     q = asyncio.Queue()
+
+    def enqueue(url: str, depth: int):
+        seen.add(url)
+        q.put_nowait((url, depth))
+        if frontier is not None:
+            frontier.add(url, depth)
+
+    def finish(url: str):
+        q.task_done()
+        if frontier is not None:
+            frontier.done(url)
+            frontier.checkpoint()
+
+    if frontier is not None and args.resume:
+        seen, pending = frontier.load()
+        for url, depth in pending:
+            q.put_nowait((url, depth))
+        print(f"♻️  Resume từ {args.frontier}: {len(seen):,} URL đã thấy, {len(pending):,} URL còn chờ")
     cached_count = 0
     new_count = 0
     error_count = 0
+    known_bad_count = 0
+    # Bytes origin -> proxy của các URL mới crawl (proxy xin gzip/br từ origin)
+    wire_bytes = 0
+    body_bytes = 0
     
     # Load important_links.json để track URLs đã có
     important_links = load_important_links()
@@ -528,49 +1002,53 @@ async def crawl(args, proxy_base: str):
             seeds.append(normalized)
     
     if not seeds:
-        # Default: trang chủ qua proxy
-        seeds = [f"{proxy_base}/"]
+        # Default: trang chủ qua proxy (--direct: trang chủ origin)
+        seeds = [f"{ORIGIN}/" if args.direct else f"{proxy_base}/"]
 
     for u in seeds:
         normalized = normalize_url(u)
         if normalized not in seen:
-            await q.put((normalized, 0))
-            seen.add(normalized)
+            enqueue(normalized, 0)
+
+    if q.empty():
+        print("✅ Không còn URL nào cần crawl (frontier đã xong)")
+        return
 
     if not seeds:
         print("❌ Không có seed URL nào!")
         return
 
-    # Kiểm tra proxy có đang chạy không
-    print(f"\n🔍 Kiểm tra proxy {proxy_base}...")
-    proxy_ok = False
-    try:
-        test_client = httpx.Client(timeout=5.0)
-        test_response = test_client.get(f"{proxy_base}/_cache_stats")
-        if test_response.status_code == 200:
-            print(f"✅ Proxy đang chạy")
-            try:
-                stats = test_response.json()
-                print(f"   - Cached responses: {stats.get('cached_responses', 'N/A')}")
-                print(f"   - Live fallback: {stats.get('live_fallback', 'N/A')}")
-            except:
-                pass
-            proxy_ok = True
-        else:
-            print(f"⚠️  Proxy trả về status {test_response.status_code}")
-        test_client.close()
-    except Exception as e:
-        print(f"❌ Proxy không thể kết nối: {e}")
-        print(f"\n💡 Hãy chạy proxy trước trong terminal khác:")
-        print(f"   conda activate crawl")
-        print(f"   export LIVE_FALLBACK=true")
-        print(f"   conda run -n crawl python app.py")
-        print(f"\n⚠️  Không thể tiếp tục crawl nếu proxy không chạy!")
-        return
+    # Kiểm tra proxy có đang chạy không (--direct: không dùng proxy)
+    if not args.direct:
+        print(f"\n🔍 Kiểm tra proxy {proxy_base}...")
+        proxy_ok = False
+        try:
+            test_client = httpx.Client(timeout=5.0)
+            test_response = test_client.get(f"{proxy_base}/_cache_stats")
+            if test_response.status_code == 200:
+                print(f"✅ Proxy đang chạy")
+                try:
+                    stats = test_response.json()
+                    print(f"   - Cached responses: {stats.get('cached_responses', 'N/A')}")
+                    print(f"   - Live fallback: {stats.get('live_fallback', 'N/A')}")
+                except:
+                    pass
+                proxy_ok = True
+            else:
+                print(f"⚠️  Proxy trả về status {test_response.status_code}")
+            test_client.close()
+        except Exception as e:
+            print(f"❌ Proxy không thể kết nối: {e}")
+            print(f"\n💡 Hãy chạy proxy trước trong terminal khác:")
+            print(f"   conda activate crawl")
+            print(f"   export LIVE_FALLBACK=true")
+            print(f"   conda run -n crawl python app.py")
+            print(f"\n⚠️  Không thể tiếp tục crawl nếu proxy không chạy!")
+            return
     
-    if not proxy_ok:
-        print(f"\n⚠️  Proxy check không thành công. Dừng crawl để tránh lỗi.")
-        return
+        if not proxy_ok:
+            print(f"\n⚠️  Proxy check không thành công. Dừng crawl để tránh lỗi.")
+            return
 
     print(f"\n📋 Seed URLs: {len(seeds)}")
     for seed in seeds[:5]:  # Hiển thị 5 seed đầu
@@ -580,19 +1058,48 @@ async def crawl(args, proxy_base: str):
 
     limits = httpx.Limits(max_keepalive_connections=10, max_connections=args.concurrency)
     timeout = httpx.Timeout(30.0)
+    client_kwargs = {}
+    if args.direct:
+        # Pool kết nối thẳng tới origin, xin nén như proxy (httpx tự giải nén, cache lưu identity)
+        client_kwargs = {
+            "headers": {"User-Agent": UA, "Accept-Encoding": DIRECT_ACCEPT_ENCODING},
+            "follow_redirects": True,
+        }
     
-    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+    # Parse HTML là CPU-bound: chạy trong process pool để event loop vẫn fetch / timer đúng hạn.
+    # parse_slots giới hạn số trang đang chờ / đang parse (mỗi job giữ 1 body trong RAM)
+    loop = asyncio.get_running_loop()
+    parse_capacity = args.parse_queue or 2 * max(args.parse_workers, 1)
+    parse_slots = asyncio.Semaphore(parse_capacity)
+
+    async def parse(url: str, content: bytes, ctype: str) -> PageInfo:
+        if parse_pool is None:
+            return parse_page(url, content, ctype, args.extractor, args.parser)
+        async with parse_slots:
+            return await loop.run_in_executor(parse_pool, parse_page, url, content, ctype, args.extractor, args.parser)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout, **client_kwargs) as client:
         sem = asyncio.Semaphore(args.concurrency)
 
         async def worker():
-            nonlocal cached_count, new_count, error_count, new_important_links_count
+            nonlocal cached_count, new_count, error_count, new_important_links_count, known_bad_count
+            nonlocal wire_bytes, body_bytes
             while True:
                 try:
                     url, depth = await asyncio.wait_for(q.get(), timeout=1.0)
                 except asyncio.TimeoutError:
                     return
                 
-                # Kiểm tra đã cache chưa (chỉ để đếm, không skip)
+                # Bỏ qua URL lỗi đã biết (negative cache còn hạn) - không gọi lại origin mỗi lượt crawl
+                if not args.retry_bad and is_known_bad(url):
+                    known_bad_count += 1
+                    if args.verbose:
+                        print(f"[KNOWN_BAD] {url} (lỗi còn hạn trong negative cache, bỏ qua)")
+                    finish(url)
+                    continue
+
+                # Kiểm tra đã cache chưa (qua proxy: chỉ để đếm, proxy trả từ cache;
+                # --direct: đọc entry có sẵn thay cho origin, không ghi đè)
                 already_cached = is_cached(url)
                 if already_cached:
                     cached_count += 1
@@ -601,137 +1108,130 @@ async def crawl(args, proxy_base: str):
 
                 try:
                     async with sem:
-                        if args.delay > 0:
-                            await asyncio.sleep(args.delay)
-                        
-                        r = await fetch_via_proxy_with_retry(client, url, proxy_base, max_retries=args.max_retries, verbose=args.verbose)
+                        r = await asyncio.to_thread(load_direct, url) if args.direct and already_cached else None
+                        if r is None:
+                            if args.delay > 0:
+                                await asyncio.sleep(args.delay)
+                            r = await fetch_via_proxy_with_retry(client, url, proxy_base, max_retries=args.max_retries, verbose=args.verbose, direct=args.direct)
                         # Đếm là "mới crawl" nếu chưa có cache trước đó
                         if not already_cached:
                             new_count += 1
+                            transfer = origin_transfer(url)
+                            if transfer:
+                                wire_bytes += transfer[0]
+                                body_bytes += transfer[1]
                         status_icon = "✅" if r.status_code == 200 else "⚠️"
                         cache_status = " [CACHED]" if already_cached else ""
                         print(f"{status_icon} [{r.status_code}]{cache_status} {url} (depth={depth})")
-                        
-                        # Extract links từ HTML
-                        ctype = r.headers.get("Content-Type", "").lower()
-                        if args.follow_depth > depth and ("text/html" in ctype or "application/xhtml" in ctype):
-                            try:
-                                enc = re.search(r"charset=([^;]+)", ctype, flags=re.I)
-                                enc = enc.group(1).strip() if enc else "utf-8"
-                                text = r.content.decode(enc, errors="replace")
-                            except Exception:
+
+                    # Extract links từ HTML - ngoài sem: trang chờ / đang parse không giữ slot fetch
+                    ctype = r.headers.get("Content-Type", "").lower()
+                    if args.follow_depth > depth and ("text/html" in ctype or "application/xhtml" in ctype):
+                        # Extract links với error handling
+                        try:
+                            # 1 lần parse cho links + docIds + pagination (trong process pool nếu có)
+                            page = await parse(url, r.content, ctype)
+                            links = page.links
+                            added = 0
+                            new_important_links = set()  # Track URLs có docId và page
+                            
+                            for link in links:
                                 try:
-                                    text = r.text
+                                    normalized = normalize_url(link)
+                                    if in_domain(normalized) and normalized not in seen:
+                                        enqueue(normalized, depth + 1)
+                                        added += 1
+                                        
+                                        # Nếu URL có docId và page, thêm vào danh sách để update important_links.json
+                                        if has_docid_and_page(normalized):
+                                            new_important_links.add(normalized)
                                 except Exception:
-                                    text = r.content.decode("utf-8", errors="replace")
+                                    continue
                             
-                            # Extract links với error handling
+                            # Extract docIds từ HTML và tạo links với các page
                             try:
-                                links = extract_links(url, text)
-                                added = 0
-                                new_important_links = set()  # Track URLs có docId và page
-                                
-                                for link in links:
-                                    try:
-                                        normalized = normalize_url(link)
-                                        if in_domain(normalized) and normalized not in seen:
-                                            seen.add(normalized)
-                                            await q.put((normalized, depth + 1))
-                                            added += 1
-                                            
-                                            # Nếu URL có docId và page, thêm vào danh sách để update important_links.json
-                                            if has_docid_and_page(normalized):
-                                                new_important_links.add(normalized)
-                                    except Exception:
-                                        continue
-                                
-                                # Extract docIds từ HTML và tạo links với các page
+                                docids = page.docids
+                                if docids:
+                                    # Phát hiện max_page từ pagination
+                                    max_page = page.max_page if page.max_page else 10  # Default 10 nếu không tìm thấy
+                                    
+                                    # Tạo URLs với docId và page
+                                    docid_page_urls = build_docid_page_urls(url, docids, max_page)
+                                    
+                                    # Thêm vào queue và track
+                                    docid_links_added = 0
+                                    for docid_url in docid_page_urls:
+                                        if docid_url not in seen:
+                                            enqueue(docid_url, depth + 1)
+                                            docid_links_added += 1
+                                            new_important_links.add(docid_url)
+                                    
+                                    if docid_links_added > 0:
+                                        print(f"  🔗 Tìm thấy {len(docids)} docId, tạo {docid_links_added} links với page (max_page={max_page})")
+                            except Exception as docid_error:
+                                if args.verbose:
+                                    print(f"  ⚠️  Lỗi khi extract docIds: {docid_error}")
+                            
+                            # Tự động update important_links.json nếu có links mới có docId và page
+                            if new_important_links:
+                                count = await append_to_important_links(new_important_links, important_links, important_links_lock)
+                                if count > 0:
+                                    new_important_links_count += count
+                                    print(f"  📝 Đã thêm {count} URLs có docId&page vào {IMPORTANT_LINKS_FILE} (tổng: {new_important_links_count} mới)")
+                            
+                            # Tự động phát hiện và crawl pagination
+                            if args.auto_pagination:
                                 try:
-                                    docids = extract_docids_from_html(url, text)
-                                    if docids:
-                                        # Phát hiện max_page từ pagination
-                                        max_page_info, pagination_type = extract_pagination_info(url, text)
-                                        max_page = max_page_info if max_page_info else 10  # Default 10 nếu không tìm thấy
+                                    max_page, pagination_type = page.max_page, page.pagination_type
+                                    if max_page and max_page > 1:
+                                        print(f"  📄 Phát hiện pagination: {pagination_type}, max_page={max_page}")
                                         
-                                        # Tạo URLs với docId và page
-                                        docid_page_urls = build_docid_page_urls(url, docids, max_page)
+                                        # Tạo base URL cho pagination
+                                        parsed = urlparse(url)
+                                        query_params = {}
+                                        if parsed.query:
+                                            query_params = {k: v[0] if len(v) == 1 else v for k, v in parse_qs(parsed.query).items()}
                                         
-                                        # Thêm vào queue và track
-                                        docid_links_added = 0
-                                        for docid_url in docid_page_urls:
-                                            if docid_url not in seen:
-                                                seen.add(docid_url)
-                                                await q.put((docid_url, depth + 1))
-                                                docid_links_added += 1
-                                                new_important_links.add(docid_url)
+                                        # Xóa page parameter nếu có để tạo base URL
+                                        base_url_for_pagination = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
                                         
-                                        if docid_links_added > 0:
-                                            print(f"  🔗 Tìm thấy {len(docids)} docId, tạo {docid_links_added} links với page (max_page={max_page})")
-                                except Exception as docid_error:
-                                    if args.verbose:
-                                        print(f"  ⚠️  Lỗi khi extract docIds: {docid_error}")
-                                
-                                # Tự động update important_links.json nếu có links mới có docId và page
-                                if new_important_links:
-                                    count = await append_to_important_links(new_important_links, important_links, important_links_lock)
-                                    if count > 0:
-                                        new_important_links_count += count
-                                        print(f"  📝 Đã thêm {count} URLs có docId&page vào {IMPORTANT_LINKS_FILE} (tổng: {new_important_links_count} mới)")
-                                
-                                # Tự động phát hiện và crawl pagination
-                                if args.auto_pagination:
-                                    try:
-                                        max_page, pagination_type = extract_pagination_info(url, text)
-                                        if max_page and max_page > 1:
-                                            print(f"  📄 Phát hiện pagination: {pagination_type}, max_page={max_page}")
-                                            
-                                            # Tạo base URL cho pagination
-                                            parsed = urlparse(url)
-                                            query_params = {}
-                                            if parsed.query:
-                                                query_params = {k: v[0] if len(v) == 1 else v for k, v in parse_qs(parsed.query).items()}
-                                            
-                                            # Xóa page parameter nếu có để tạo base URL
-                                            base_url_for_pagination = f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
-                                            
-                                            # Thêm tất cả các trang vào queue
-                                            pagination_added = 0
-                                            new_pagination_important = set()
+                                        # Thêm tất cả các trang vào queue
+                                        pagination_added = 0
+                                        new_pagination_important = set()
+                                        
+                                        for page_num in range(1, max_page + 1):
+                                            query_params['page'] = str(page_num)
+                                            pagination_url = f"{base_url_for_pagination}?{urlencode(query_params)}"
+                                            normalized = normalize_url(pagination_url)
                                             
-                                            for page_num in range(1, max_page + 1):
-                                                query_params['page'] = str(page_num)
-                                                pagination_url = f"{base_url_for_pagination}?{urlencode(query_params)}"
-                                                normalized = normalize_url(pagination_url)
+                                            if normalized not in seen:
+                                                enqueue(normalized, depth)
+                                                pagination_added += 1
                                                 
-                                                if normalized not in seen:
-                                                    seen.add(normalized)
-                                                    await q.put((normalized, depth))
-                                                    pagination_added += 1
-                                                    
-                                                    # Nếu pagination URL có docId và page, thêm vào important_links
-                                                    if has_docid_and_page(normalized):
-                                                        new_pagination_important.add(normalized)
-                                            
-                                            if pagination_added > 0:
-                                                print(f"  📄 Đã thêm {pagination_added} trang pagination vào queue")
-                                            
-                                            # Update important_links.json cho pagination URLs
-                                            if new_pagination_important:
-                                                count = await append_to_important_links(new_pagination_important, important_links, important_links_lock)
-                                                if count > 0:
-                                                    new_important_links_count += count
-                                                    print(f"  📝 Đã thêm {count} pagination URLs có docId&page vào {IMPORTANT_LINKS_FILE}")
-                                    except Exception as pagination_error:
-                                        if args.verbose:
-                                            print(f"  ⚠️  Không thể extract pagination từ {url}: {pagination_error}")
-                                
-                                if args.verbose and added > 0:
-                                    print(f"  🔗 Found {added} new links (total: {len(seen)})")
-                            except Exception as extract_error:
-                                # Log nhưng không crash nếu extract links fail
-                                if args.verbose:
-                                    print(f"  ⚠️  Không thể extract links từ {url}: {extract_error}")
+                                                # Nếu pagination URL có docId và page, thêm vào important_links
+                                                if has_docid_and_page(normalized):
+                                                    new_pagination_important.add(normalized)
+                                        
+                                        if pagination_added > 0:
+                                            print(f"  📄 Đã thêm {pagination_added} trang pagination vào queue")
+                                        
+                                        # Update important_links.json cho pagination URLs
+                                        if new_pagination_important:
+                                            count = await append_to_important_links(new_pagination_important, important_links, important_links_lock)
+                                            if count > 0:
+                                                new_important_links_count += count
+                                                print(f"  📝 Đã thêm {count} pagination URLs có docId&page vào {IMPORTANT_LINKS_FILE}")
+                                except Exception as pagination_error:
+                                    if args.verbose:
+                                        print(f"  ⚠️  Không thể extract pagination từ {url}: {pagination_error}")
                             
+                            if args.verbose and added > 0:
+                                print(f"  🔗 Found {added} new links (total: {len(seen)})")
+                        except Exception as extract_error:
+                            # Log nhưng không crash nếu extract links fail
+                            if args.verbose:
+                                print(f"  ⚠️  Không thể extract links từ {url}: {extract_error}")
+                        
                 except httpx.HTTPError as e:
                     error_count += 1
                     print(f"❌ [HTTP_ERROR] {url}: {e}")
@@ -739,9 +1239,12 @@ async def crawl(args, proxy_base: str):
                     error_count += 1
                     print(f"❌ [ERROR] {url}: {e}")
                 finally:
-                    q.task_done()
+                    finish(url)
 
-        workers = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+        # sem giới hạn số fetch song song; thêm worker cho các trang đang chờ / đang parse trong pool
+        # để fetch vẫn chạy đủ --concurrency khi pool bận
+        n_workers = args.concurrency + (parse_capacity if parse_pool is not None else 0)
+        workers = [asyncio.create_task(worker()) for _ in range(n_workers)]
         await q.join()
         for w in workers:
             w.cancel()
@@ -754,7 +1257,13 @@ async def crawl(args, proxy_base: str):
         print(f"   - Đã cache sẵn: {cached_count} URLs")
         print(f"   - Mới crawl: {new_count} URLs")
         print(f"   - Lỗi: {error_count} URLs")
+        if known_bad_count:
+            print(f"   - Bỏ qua (lỗi đã biết, còn hạn TTL): {known_bad_count} URLs")
         print(f"   - Tổng URLs đã xử lý: {len(seen)} URLs")
+        if body_bytes:
+            saved = 100 * (1 - wire_bytes / body_bytes)
+            print(f"   - Origin -> proxy: {wire_bytes / 1024 / 1024:.1f} MB trên đường truyền / "
+                  f"{body_bytes / 1024 / 1024:.1f} MB body (tiết kiệm {saved:.0f}% nhờ gzip/br)")
         if new_important_links_count > 0:
             print(f"   - URLs có docId&page mới thêm vào {IMPORTANT_LINKS_FILE}: {new_important_links_count}")
         print(f"{'='*60}")
@@ -790,7 +1299,38 @@ if __name__ == "__main__":
                     help="Tự động phát hiện và crawl pagination (mặc định: True)")
     ap.add_argument("--max-retries", type=int, default=10,
                     help="Số lần retry khi gặp lỗi (mặc định: 10)")
+    ap.add_argument("--retry-bad", action="store_true",
+                    help="Vẫn crawl các URL đang nằm trong negative cache (lỗi 404/5xx còn hạn TTL)")
+    ap.add_argument("--parser", choices=HTML_PARSERS, default=HTML_PARSER,
+                    help=f"Parser HTML của BeautifulSoup: html.parser | lxml (mặc định: {HTML_PARSER}, env CRAWL_HTML_PARSER)")
+    ap.add_argument("--extractor", choices=sorted(EXTRACTORS), default=DEFAULT_EXTRACTOR,
+                    help=f"Cách extract: soup (BeautifulSoup) | fast (quét regex, không dựng cây) "
+                         f"(mặc định: {DEFAULT_EXTRACTOR}, env CRAWL_EXTRACTOR)")
+    ap.add_argument("--parse-workers", type=int, default=PARSE_WORKERS,
+                    help=f"Số process parse HTML song song (mặc định: {PARSE_WORKERS} = số CPU, env CRAWL_PARSE_WORKERS; "
+                         f"0 = parse trong event loop)")
+    ap.add_argument("--parse-queue", type=int, default=0,
+                    help="Số trang tối đa đang chờ / đang parse (mặc định: 0 = 2 x --parse-workers)")
+    ap.add_argument("--frontier", type=str, default="",
+                    help="File SQLite lưu seen + hàng đợi (mặc định khi có --resume / --fresh: crawl_frontier-<hash>.sqlite3 "
+                         "theo --seed / --extra-urls / --json-file + khoảng index, env CRAWL_FRONTIER; "
+                         "không có --resume / --fresh / --frontier = không lưu)")
+    resume_group = ap.add_mutually_exclusive_group()
+    resume_group.add_argument("--resume", action="store_true",
+                              help="Lưu frontier và crawl tiếp từ lượt trước cùng tham số (bị dừng / crash); "
+                                   "chưa có frontier thì bắt đầu từ seed")
+    resume_group.add_argument("--fresh", action="store_true",
+                              help="Lưu frontier, bỏ frontier của lượt trước cùng tham số và crawl lại từ seed")
+    ap.add_argument("--direct", action="store_true",
+                    help="Lấy thẳng từ ORIGIN và ghi vào CACHE_DIR (không cần proxy; entry giống hệt proxy ghi)")
     args = ap.parse_args()
+
+    # Frontier chỉ lưu khi được yêu cầu; mỗi bộ seed (vd. từng khoảng của crawl_range.sh) có file riêng
+    if args.resume or args.fresh:
+        args.frontier = args.frontier or frontier_path(
+            seed=args.seed, start_page=args.start_page, end_page=args.end_page, extra_urls=args.extra_urls,
+            json_file=os.path.abspath(args.json_file) if args.json_file else "",
+            json_start_index=args.json_start_index, json_end_index=args.json_end_index, direct=args.direct)
     
     # Load URLs từ file JSON nếu được chỉ định
     if args.json_file:
@@ -854,13 +1394,16 @@ if __name__ == "__main__":
     print(f"{'='*60}")
     print(f"🚀 Auto Crawler qua Proxy")
     print(f"{'='*60}")
-    print(f"   Proxy: {proxy_base}")
+    print(f"   Proxy: {'(--direct: không dùng proxy)' if args.direct else proxy_base}")
     print(f"   Origin: {ORIGIN}")
     print(f"   Cache dir: {CACHE_DIR}")
     print(f"   Follow depth: {args.follow_depth}")
     print(f"   Concurrency: {args.concurrency}")
     print(f"   Delay: {args.delay}s")
     print(f"   Max retries: {args.max_retries}")
+    print(f"   Extractor: {args.extractor}" + (f" ({args.parser})" if args.extractor == "soup" else ""))
+    print(f"   Parse: {f'{args.parse_workers} process' if args.parse_workers > 0 else 'trong event loop'}")
+    print(f"   Frontier: {args.frontier or '(không lưu)'}" + (" (--resume)" if args.resume else " (--fresh)" if args.fresh else ""))
     print(f"{'='*60}\n")
     
     asyncio.run(crawl(args, proxy_base))
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Benchmark extract link/docId/pagination của crawler trên HTML thật trong cache (pages/s):
+cách cũ (extract_links + extract_docids_from_html + extract_pagination_info, mỗi hàm tự parse)
+so với auto_crawl_proxy.extract_page (1 lần parse, 1 lần duyệt cây) với từng parser và
+extract_page_fast (quét regex, không dựng cây). Kết quả giống hệt cách cũ được kiểm tra bởi
+tests/test_extract_parity.py trên corpus HTML mẫu.
+
+    python bench_extract.py --repeat 3
+    python bench_extract.py --dir saved_pages/ --parsers html.parser
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import cache_store
+import auto_crawl_proxy as crawler
+from url_rewrite import charset_of
+
+def load_pages(cache_dir: str, limit: int):
+    """[(url, html)] các entry HTML trong cache (decode theo charset như crawler)"""
+    pages = []
+    store = cache_store.get_store(cache_dir)
+    for key in store.iter_keys():
+        entry = cache_store.load_entry(key, cache_dir)
+        if entry is None:
+            continue
+        body, meta = entry
+        content_type = cache_store._header(meta.get("headers"), "Content-Type", "").lower()
+        if "text/html" not in content_type and "application/xhtml" not in content_type:
+            continue
+        charset = charset_of(content_type)
+        try:
+            html = body.decode(charset, errors="replace")
+        except LookupError:
+            html = body.decode("utf-8", errors="replace")
+        pages.append((meta.get("url") or crawler.ORIGIN + "/", html))
+        if len(pages) >= limit:
+            break
+    return pages
+
+def load_dir(path: str, limit: int):
+    """[(url, html)] các file .html / .htm trong thư mục (url = ORIGIN + tên file, decode utf-8)"""
+    pages = []
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            if not name.lower().endswith((".html", ".htm")):
+                continue
+            with open(os.path.join(root, name), "rb") as f:
+                html = f.read().decode("utf-8", errors="replace")
+            pages.append((crawler.ORIGIN + "/" + name, html))
+            if len(pages) >= limit:
+                return pages
+    return pages
+
+def legacy_extract(url: str, html: str):
+    max_page, pagination_type = crawler.extract_pagination_info(url, html)
+    return crawler.PageInfo(
+        crawler.extract_links(url, html), crawler.extract_docids_from_html(url, html), max_page, pagination_type
+    )
+
+def _pages_per_second(fn, pages, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for url, html in pages:
+            fn(url, html)
+        best = min(best, time.perf_counter() - start)
+    return len(pages) / max(best, 1e-9)
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark extract 1 lượt của crawler trên HTML trong cache")
+    ap.add_argument("--cache-dir", type=str, default=cache_store.CACHE_DIR,
+                    help=f"Thư mục cache (mặc định: {cache_store.CACHE_DIR})")
+    ap.add_argument("--dir", type=str, default=None,
+                    help="Đọc file .html trong thư mục này thay vì cache")
+    ap.add_argument("--limit", type=int, default=300,
+                    help="Số trang HTML tối đa (mặc định: 300)")
+    ap.add_argument("--repeat", type=int, default=1,
+                    help="Số lần lặp, lấy lần nhanh nhất (mặc định: 1)")
+    ap.add_argument("--parsers", nargs="+", choices=crawler.HTML_PARSERS, default=list(crawler.HTML_PARSERS),
+                    help="Parser BeautifulSoup cần đo (mặc định: html.parser lxml; parser chưa cài sẽ bỏ qua)")
+    ap.add_argument("--no-fast", action="store_true",
+                    help="Không đo extract_page_fast")
+    args = ap.parse_args()
+
+    source = args.dir or args.cache_dir
+    print(f"📥 Đọc HTML từ {source}...")
+    pages = load_dir(args.dir, args.limit) if args.dir else load_pages(args.cache_dir, args.limit)
+    if not pages:
+        print(f"❌ Không có trang HTML nào trong {source}")
+        sys.exit(1)
+    print(f"   {len(pages):,} trang, {sum(len(h) for _, h in pages) / 1024 / 1024:.1f} MB")
+
+    print(f"\n{'='*60}")
+    print(f"{'Cách':<28} {'pages/s':>10} {'x':>6}")
+    baseline = _pages_per_second(legacy_extract, pages, args.repeat)
+    print(f"{'cũ (3 lần parse)':<28} {baseline:>10.1f} {1.0:>6.1f}")
+    candidates = [
+        ("extract_page " + parser, lambda url, html, parser=parser: crawler.extract_page(url, html, parser))
+        for parser in args.parsers
+    ]
+    if not args.no_fast:
+        candidates.append(("extract_page_fast", crawler.extract_page_fast))
+    for label, new in candidates:
+        try:
+            rate = _pages_per_second(new, pages, args.repeat)
+        except Exception as e:  # bs4.FeatureNotFound khi parser chưa cài
+            print(f"{label:<28} ⚠️  bỏ qua ({e.__class__.__name__})")
+            continue
+        print(f"{label:<28} {rate:>10.1f} {rate / baseline:>6.1f}")
+    print(f"{'='*60}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Benchmark rewrite URL trên HTML/JS thật trong cache: cách cũ (decode -> 2-3 lần re.sub -> encode)
+so với url_rewrite.Rewriter (1 regex, trực tiếp trên bytes). Báo MB/s cho từng loại nội dung.
+"""
+
+import re
+import sys
+import time
+import argparse
+
+import cache_store
+from url_rewrite import Rewriter, charset_of
+
+def legacy_rewrite(body: bytes, content_type: str, local_base: str, local_host: str, viewer: bool) -> bytes:
+    """Bản sao _rewrite_text + decode/encode trước khi chuyển sang url_rewrite"""
+    enc = charset_of(content_type)
+    try:
+        text = body.decode(enc, errors="replace")
+    except Exception:
+        text = body.decode("utf-8", errors="replace")
+    text = re.sub(r"https?://kiagds\.ru", local_base, text, flags=re.I)
+    text = re.sub(r"(?<!:)//kiagds\.ru", "//" + local_host, text, flags=re.I)
+    if viewer:
+        text = re.sub(r"http://localhost:5002", local_base, text, flags=re.I)
+    return text.encode(enc, errors="replace")
+
+def _kind(content_type: str):
+    ct = content_type.lower()
+    if "html" in ct:
+        return "html"
+    if "javascript" in ct:
+        return "js"
+    if "css" in ct:
+        return "css"
+    return None
+
+def load_samples(cache_dir: str, limit: int, max_bytes: int):
+    """Lấy body identity của các entry HTML/JS/CSS trong cache"""
+    samples = {"html": [], "js": [], "css": []}
+    total = 0
+    store = cache_store.get_store(cache_dir)
+    for key in store.iter_keys():
+        entry = cache_store.load_entry(key, cache_dir)
+        if entry is None:
+            continue
+        body, meta = entry
+        content_type = cache_store._header(meta.get("headers"), "Content-Type", "")
+        kind = _kind(content_type)
+        if kind is None or len(samples[kind]) >= limit:
+            continue
+        samples[kind].append((body, content_type))
+        total += len(body)
+        if total >= max_bytes or all(len(v) >= limit for v in samples.values()):
+            break
+    return samples
+
+def _measure(fn, items, repeat: int) -> float:
+    """MB/s (lấy lần chạy nhanh nhất)"""
+    size = sum(len(body) for body, _ in items)
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for body, content_type in items:
+            fn(body, content_type)
+        best = min(best, time.perf_counter() - start)
+    return size / (1024 * 1024) / max(best, 1e-9)
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark rewrite URL (cũ vs 1-pass bytes) trên body thật trong cache")
+    ap.add_argument("--cache-dir", type=str, default=cache_store.CACHE_DIR,
+                    help=f"Thư mục cache (mặc định: {cache_store.CACHE_DIR})")
+    ap.add_argument("--limit", type=int, default=500,
+                    help="Số body tối đa mỗi loại (html/js/css) (mặc định: 500)")
+    ap.add_argument("--max-mb", type=int, default=200,
+                    help="Tổng dung lượng mẫu tối đa, MB (mặc định: 200)")
+    ap.add_argument("--repeat", type=int, default=3,
+                    help="Số lần lặp, lấy lần nhanh nhất (mặc định: 3)")
+    ap.add_argument("--viewer", action="store_true",
+                    help="Đo theo offline viewer (LOCAL_BASE=http://localhost:5003, 3 lần re.sub)")
+    args = ap.parse_args()
+
+    local_base = "http://localhost:5003" if args.viewer else "http://localhost:5002"
+    local_host = local_base.split("//", 1)[1]
+    rewriter = Rewriter(local_base)
+
+    print(f"📥 Đọc mẫu HTML/JS/CSS từ {args.cache_dir}...")
+    samples = load_samples(args.cache_dir, args.limit, args.max_mb * 1024 * 1024)
+    if not any(samples.values()):
+        print("❌ Không có body HTML/JS/CSS nào trong cache để benchmark")
+        sys.exit(1)
+
+    def old(body, content_type):
+        return legacy_rewrite(body, content_type, local_base, local_host, args.viewer)
+
+    def new(body, content_type):
+        return rewriter.rewrite_body(body, charset_of(content_type))
+
+    print(f"\n{'='*60}")
+    print(f"{'Loại':<6} {'Số body':>8} {'MB':>8} {'Cũ MB/s':>10} {'Mới MB/s':>10} {'x':>6}")
+    for kind, items in samples.items():
+        if not items:
+            continue
+        # Kết quả phải giống hệt nhau trước khi so tốc độ (trừ byte lỗi charset mà cách cũ thay bằng '?')
+        mismatched = sum(1 for body, ct in items if old(body, ct) != new(body, ct))
+        before = _measure(old, items, args.repeat)
+        after = _measure(new, items, args.repeat)
+        mb = sum(len(b) for b, _ in items) / (1024 * 1024)
+        print(f"{kind:<6} {len(items):>8,} {mb:>8.1f} {before:>10.1f} {after:>10.1f} {after / before:>6.1f}")
+        if mismatched:
+            print(f"   ⚠️  {mismatched} body cho kết quả khác (thường do byte không hợp lệ với charset)")
+    print(f"{'='*60}")
+
+if __name__ == "__main__":
+    main()
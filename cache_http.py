@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Phần HTTP dùng chung của proxy (app.py) và offline viewer (app_offline_viewer.py) khi trả entry từ cache:
+loại nội dung, validator (ETag / Last-Modified / Cache-Control) + 304, Range / 206 / multipart/byteranges
+và stream body từ file. Sửa ở đây là cả 2 app cùng đổi.
+
+Các hàm đọc request Flask hiện tại (flask.request) nên chỉ gọi trong request context.
+"""
+
+import os
+import uuid
+from datetime import datetime, timezone
+from flask import request, Response
+from werkzeug.http import http_date, parse_date, quote_etag, unquote_etag
+from werkzeug.wsgi import wrap_file
+import cache_store
+
+# Số đoạn tối đa trong 1 Range request (nhiều hơn thì trả cả body)
+MAX_RANGES = int(os.getenv("MAX_RANGES", "16"))
+# Cache-Control cho CSS/JS/ảnh/font/pdf (giây, 0 = giữ header của origin) - browser không tải lại mỗi lần chuyển trang
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", str(7 * 24 * 3600)))
+
+def is_type(content_type: str, needle: str) -> bool:
+    ct = (content_type or "").lower()
+    return needle in ct
+
+def is_html(content_type: str) -> bool:
+    return is_type(content_type, "text/html") or is_type(content_type, "application/xhtml")
+
+def is_textual(content_type: str) -> bool:
+    ct = (content_type or "").lower()
+    # textual types we may safely rewrite absolute domain
+    return (
+        "text/" in ct
+        or "javascript" in ct
+        or ct.startswith("application/json")
+        or ct.startswith("application/xml")
+        or ct.startswith("application/xhtml")
+    )
+
+def is_static(content_type: str) -> bool:
+    ct = (content_type or "").lower()
+    return (
+        ct.startswith(("image/", "font/", "text/css", "application/pdf"))
+        or "javascript" in ct
+        or "font" in ct
+    )
+
+def served_variant(meta: dict, content_type: str, accept_encoding: str) -> str:
+    """Biểu diễn sẽ trả cho entry: "rewrite" | encoding nén đã lưu | "identity" """
+    if is_textual(content_type) and cache_store.needs_rewrite(meta):
+        return "rewrite"
+    return cache_store.choose_encoding(meta, cache_store.parse_accept_encoding(accept_encoding))
+
+def cache_validators(meta: dict, variant: str, content_type: str) -> dict:
+    """Header ETag / Last-Modified / Cache-Control (+ Vary) cho response lấy từ cache"""
+    out = {}
+    etag = cache_store.entry_etag(meta, "" if variant == "identity" else variant)
+    if etag:
+        out["ETag"] = quote_etag(etag)
+    last_modified = parse_date(cache_store._header(meta.get("headers"), "Last-Modified", ""))
+    if last_modified is None and meta.get("fetched_at"):
+        last_modified = datetime.fromtimestamp(meta["fetched_at"], timezone.utc)
+    if last_modified is not None:
+        out["Last-Modified"] = http_date(last_modified)
+    if STATIC_MAX_AGE > 0 and is_static(content_type):
+        out["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}"
+    if (meta.get("encoding") or "identity") != "identity" or meta.get("variants"):
+        out["Vary"] = "Accept-Encoding"
+    return out
+
+def is_not_modified(validators: dict) -> bool:
+    """If-None-Match (ưu tiên) / If-Modified-Since của request khớp với validator của entry"""
+    if request.if_none_match:
+        etag = validators.get("ETag")
+        return bool(etag) and request.if_none_match.contains_weak(unquote_etag(etag)[0])
+    since = request.if_modified_since
+    last_modified = parse_date(validators.get("Last-Modified"))
+    return bool(since and last_modified) and last_modified <= since
+
+def validators_only(headers: dict) -> dict:
+    """Header được phép gửi kèm 304 Not Modified"""
+    keep = ("etag", "last-modified", "cache-control", "vary")
+    return {k: v for k, v in headers.items() if k.lower() in keep}
+
+def with_validators(headers_out: dict, validators: dict) -> dict:
+    """Thay header validator của origin (ETag, Cache-Control...) bằng validator tính từ cache"""
+    if not validators:
+        return headers_out
+    names = {k.lower() for k in validators}
+    headers_out = {k: v for k, v in headers_out.items() if k.lower() not in names}
+    headers_out.update(validators)
+    return headers_out
+
+def precompressed_response(body: bytes, headers: dict, status: int, encoding: str, validators: dict = None):
+    """Trả thẳng bytes đã nén lúc lưu cache (không giải nén, không rewrite)"""
+    headers_out = {
+        k: v for k, v in headers.items()
+        if k.lower() not in ("content-length", "content-encoding", "transfer-encoding", "vary")
+    }
+    headers_out["Content-Encoding"] = encoding
+    headers_out["Content-Length"] = str(len(body))
+    headers_out["Vary"] = "Accept-Encoding"
+    headers_out = with_validators(headers_out, validators)
+    content_type = headers.get("Content-Type", "application/octet-stream")
+    return Response(body, status=status, headers=headers_out, content_type=content_type)
+
+def requested_ranges(length: int, validators: dict):
+    """
+    Các đoạn [start, stop) client yêu cầu qua header Range.
+    None: trả cả body (không có Range, If-Range không khớp, quá nhiều đoạn) | []: không thoả mãn được (416)
+    """
+    req_range = request.range
+    if req_range is None or req_range.units != "bytes" or len(req_range.ranges) > MAX_RANGES:
+        return None
+    if_range = request.if_range
+    if if_range.etag and validators.get("ETag") != quote_etag(if_range.etag):
+        return None
+    if if_range.date and parse_date(validators.get("Last-Modified")) != if_range.date:
+        return None
+    ranges = []
+    for begin, end in req_range.ranges:
+        if begin < 0:
+            start, stop = max(length + begin, 0), length
+        else:
+            start, stop = begin, length if end is None else min(end, length)
+        if start < stop:
+            ranges.append((start, stop))
+    return ranges
+
+def multirange_body(body_file, ranges, content_type: str):
+    """multipart/byteranges: (iterator các mảnh, Content-Length, boundary) - đọc từng chunk, không nạp cả body"""
+    boundary = uuid.uuid4().hex
+    total = body_file.length
+    parts = [
+        (
+            f"\r\n--{boundary}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{stop - 1}/{total}\r\n\r\n".encode("latin-1"),
+            start, stop,
+        )
+        for start, stop in ranges
+    ]
+    tail = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    length = sum(len(head) + stop - start for head, start, stop in parts) + len(tail)
+
+    def generate():
+        try:
+            for head, start, stop in parts:
+                yield head
+                yield from body_file.iter_range(start, stop)
+            yield tail
+        finally:
+            body_file.close()
+
+    return generate(), length, boundary
+
+def file_response(body_file, headers: dict, status: int, validators: dict = None):
+    """Stream body từ file qua wsgi.file_wrapper (sendfile nếu server hỗ trợ) - RAM không tăng theo kích thước file"""
+    headers_out = {
+        k: v for k, v in headers.items()
+        if k.lower() not in ("content-length", "content-encoding", "transfer-encoding")
+    }
+    headers_out["Accept-Ranges"] = "bytes"
+    headers_out = with_validators(headers_out, validators)
+    content_type = headers.get("Content-Type", "application/octet-stream")
+
+    # Range request (PDF viewer, tải tiếp): 206 với 1 đoạn hoặc multipart/byteranges
+    total = body_file.length
+    ranges = requested_ranges(total, validators or {}) if status == 200 else None
+    if ranges == []:
+        body_file.close()
+        return Response(status=416, headers={"Content-Range": f"bytes */{total}", "Accept-Ranges": "bytes"})
+    if ranges and len(ranges) > 1:
+        parts, length, boundary = multirange_body(body_file, ranges, content_type)
+        headers_out["Content-Length"] = str(length)
+        return Response(
+            parts, status=206, headers=headers_out,
+            content_type=f"multipart/byteranges; boundary={boundary}", direct_passthrough=True,
+        )
+    if ranges:
+        start, stop = ranges[0]
+        body_file.restrict(start, stop - start)
+        headers_out["Content-Range"] = f"bytes {start}-{stop - 1}/{total}"
+        status = 206
+
+    headers_out["Content-Length"] = str(body_file.length)
+    return Response(
+        wrap_file(request.environ, body_file), status=status, headers=headers_out,
+        content_type=content_type, direct_passthrough=True,
+    )
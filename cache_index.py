@@ -0,0 +1,508 @@
+#!/usr/bin/env python3
+"""
+SQLite index (WAL) cho metadata của cache: cache/index.sqlite3
+
+Thay cho việc json.load file <key>.json mỗi lần hit: url/status/headers nằm trong
+bảng `entries` (PRIMARY KEY = cache key), tra cứu bằng câu lệnh cố định nên
+sqlite3 dùng lại prepared statement. Nhờ đó "đã cache chưa", /_cache_stats và
+các script coverage chỉ còn là truy vấn có index, không cần stat filesystem.
+
+Dùng như script:
+    python cache_index.py --rebuild          # nạp metadata của cache hiện có vào index
+    python cache_index.py --stats            # thống kê theo status / content-type
+    python cache_index.py --docid 435525     # tất cả URL đã cache có docId=435525
+    python cache_index.py --failures         # negative cache: URL lỗi còn hạn TTL
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from urllib.request import pathname2url
+
+INDEX_FILE = "index.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key          TEXT PRIMARY KEY,
+    url          TEXT NOT NULL,
+    status       INTEGER NOT NULL,
+    content_type TEXT,
+    size         INTEGER NOT NULL,
+    fetched_at   REAL NOT NULL,
+    headers      TEXT NOT NULL,
+    doc_id       TEXT,
+    extra        TEXT,
+    body_sha256  TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_doc_id ON entries(doc_id) WHERE doc_id IS NOT NULL;
+CREATE TABLE IF NOT EXISTS blobs (
+    hash     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    refcount INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (
+    dim     TEXT NOT NULL,
+    value   TEXT NOT NULL,
+    entries INTEGER NOT NULL,
+    bytes   INTEGER NOT NULL,
+    PRIMARY KEY (dim, value)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS failures (
+    key        TEXT PRIMARY KEY,
+    url        TEXT NOT NULL,
+    status     INTEGER NOT NULL,
+    error      TEXT,
+    headers    TEXT,
+    body       BLOB,
+    failed_at  REAL NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS index_info (
+    name  TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_SQL_GET = "SELECT url, status, headers, extra, body_sha256, fetched_at, size FROM entries WHERE key = ?"
+_SQL_HAS = "SELECT 1 FROM entries WHERE key = ?"
+_SQL_PUT = """
+INSERT INTO entries (key, url, status, content_type, size, fetched_at, headers, doc_id, extra, body_sha256)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET
+    url = excluded.url, status = excluded.status, content_type = excluded.content_type,
+    size = excluded.size, fetched_at = excluded.fetched_at, headers = excluded.headers,
+    doc_id = excluded.doc_id, extra = excluded.extra, body_sha256 = excluded.body_sha256
+"""
+_SQL_OLD = "SELECT body_sha256, status, content_type, size FROM entries WHERE key = ?"
+_SQL_BLOB_INCREF = """
+INSERT INTO blobs (hash, size, refcount) VALUES (?, ?, 1)
+ON CONFLICT(hash) DO UPDATE SET refcount = refcount + 1
+"""
+_SQL_BLOB_DECREF = "UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?"
+# Lỗi chỉ được ghi khi key chưa có entry thành công (không bao giờ đè entry tốt)
+_SQL_FAILURE_PUT = """
+INSERT OR REPLACE INTO failures (key, url, status, error, headers, body, failed_at, expires_at)
+SELECT ?, ?, ?, ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM entries WHERE key = ?)
+"""
+_SQL_FAILURE_GET = "SELECT url, status, error, headers, body, failed_at, expires_at FROM failures WHERE key = ? AND expires_at > ?"
+_SQL_FAILURE_DROP = "DELETE FROM failures WHERE key = ?"
+_SQL_COUNTER = """
+INSERT INTO counters (dim, value, entries, bytes) VALUES (?, ?, ?, ?)
+ON CONFLICT(dim, value) DO UPDATE SET entries = entries + excluded.entries, bytes = bytes + excluded.bytes
+"""
+
+# Các field meta có cột riêng; field còn lại (encoding, variants...) nằm trong cột extra (JSON)
+_COLUMN_FIELDS = ("url", "status", "headers", "size", "body_sha256", "fetched_at")
+
+def _doc_id(url: str):
+    """docId trong query string (nếu có) - cột có index để tra 'tất cả URL có docId=X'"""
+    try:
+        params = parse_qs(urlparse(url).query)
+    except ValueError:
+        return None
+    values = params.get("docId") or params.get("docid")
+    return values[0] if values else None
+
+def _content_type(headers: dict):
+    for k, v in headers.items():
+        if k.lower() == "content-type":
+            return v
+    return None
+
+def _cache_is_empty(cache_dir: str) -> bool:
+    """Thư mục cache chưa có gì ngoài chính file index (+ -wal/-shm) và thư mục tmp/ trống"""
+    with os.scandir(cache_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith(INDEX_FILE):
+                continue
+            if entry.name == "tmp" and entry.is_dir() and not os.listdir(entry.path):
+                continue
+            return False
+    return True
+
+class MetaIndex:
+    """
+    Index metadata dùng chung giữa các process (WAL: 1 writer, nhiều reader song song).
+    read_only=True (offline viewer): mở file:...?mode=ro, không tạo / migrate schema, không đếm lại -
+    mọi thao tác ghi sẽ lỗi sqlite3.OperationalError.
+    """
+
+    def __init__(self, cache_dir: str, read_only: bool = False):
+        self.path = os.path.join(cache_dir, INDEX_FILE)
+        self.read_only = read_only
+        self._local = threading.local()
+        self._complete = None
+        created = not read_only and not os.path.exists(self.path)
+        conn = self._conn()
+        if read_only:
+            return
+        conn.executescript(_SCHEMA)
+        # Index tạo bởi phiên bản cũ chưa có các cột mới
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+        for column in ("extra", "body_sha256"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE entries ADD COLUMN {column} TEXT")
+        conn.commit()
+        # Index cũ chưa có bộ đếm: đếm lại 1 lần từ bảng entries
+        if conn.execute("SELECT 1 FROM index_info WHERE name = 'counters'").fetchone() is None:
+            self.recount()
+        # Cài mới (chưa có entry nào ở layout cũ): index đầy đủ ngay, miss không phải stat file
+        if created and _cache_is_empty(cache_dir):
+            self.mark_complete()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Mỗi thread 1 connection (Flask threaded server, ThreadPoolExecutor...)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                uri = "file:" + pathname2url(os.path.abspath(self.path)) + "?mode=ro"
+                conn = sqlite3.connect(uri, uri=True, timeout=30, cached_statements=256)
+            else:
+                conn = sqlite3.connect(self.path, timeout=30, cached_statements=256)
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        """Returns meta {"url", "status", "headers", ...extra} hoặc None"""
+        row = self._conn().execute(_SQL_GET, (key,)).fetchone()
+        if row is None:
+            return None
+        meta = json.loads(row[3]) if row[3] else {}
+        meta.update(url=row[0], status=row[1], headers=json.loads(row[2]))
+        if row[4]:
+            meta["body_sha256"] = row[4]
+        meta["fetched_at"] = row[5]
+        meta["size"] = row[6]
+        return meta
+
+    def has(self, key: str) -> bool:
+        return self._conn().execute(_SQL_HAS, (key,)).fetchone() is not None
+
+    def _row(self, key: str, meta: dict, size: int, fetched_at: float = None):
+        headers = meta.get("headers", {}) or {}
+        url = meta.get("url", "")
+        extra = {k: v for k, v in meta.items() if k not in _COLUMN_FIELDS}
+        return (
+            key, url, int(meta.get("status", 200)), _content_type(headers),
+            # size = kích thước identity (body có thể đang được lưu ở dạng nén)
+            int(meta.get("size", size)),
+            fetched_at if fetched_at is not None else meta.get("fetched_at") or time.time(),
+            json.dumps(headers, ensure_ascii=False, separators=(",", ":")), _doc_id(url),
+            json.dumps(extra, ensure_ascii=False, separators=(",", ":")) if extra else None,
+            meta.get("body_sha256"),
+        )
+
+    def _put_rows(self, rows):
+        """
+        Ghi entries + cập nhật refcount của blob (body_sha256) và bộ đếm
+        (tổng / theo status / theo content-type) trong 1 transaction.
+        BEGIN IMMEDIATE: đọc giá trị cũ và ghi giá trị mới không bị process khác chen vào.
+        """
+        deltas = {}
+
+        def _count(status, content_type, size, sign):
+            for dim, value in (("total", ""), ("status", str(status)), ("content_type", content_type or "")):
+                n, b = deltas.get((dim, value), (0, 0))
+                deltas[(dim, value)] = (n + sign, b + sign * size)
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for row in rows:
+                key, status, content_type, size, digest = row[0], row[2], row[3], row[4], row[9]
+                old = conn.execute(_SQL_OLD, (key,)).fetchone()
+                conn.execute(_SQL_PUT, row)
+                # Đã có body tốt: lỗi cũ trong negative cache hết ý nghĩa
+                conn.execute(_SQL_FAILURE_DROP, (key,))
+                if old:
+                    _count(old[1], old[2], old[3], -1)
+                _count(status, content_type, size, 1)
+                old_digest = old[0] if old else None
+                if old_digest == digest:
+                    continue
+                if old_digest:
+                    conn.execute(_SQL_BLOB_DECREF, (old_digest,))
+                if digest:
+                    conn.execute(_SQL_BLOB_INCREF, (digest, size))
+            conn.executemany(_SQL_COUNTER, [(dim, value, n, b) for (dim, value), (n, b) in deltas.items()])
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def put(self, key: str, meta: dict, size: int, fetched_at: float = None):
+        self._put_rows([self._row(key, meta, size, fetched_at)])
+
+    def put_many(self, rows):
+        """rows: iterable (key, meta, size, fetched_at) - ghi trong 1 transaction"""
+        self._put_rows([self._row(*r) for r in rows])
+
+    def unreferenced_blobs(self):
+        """Hash của các blob không còn entry nào trỏ tới (refcount <= 0)"""
+        return [r[0] for r in self._conn().execute("SELECT hash FROM blobs WHERE refcount <= 0")]
+
+    def drop_blobs(self, digests):
+        conn = self._conn()
+        with conn:
+            conn.executemany("DELETE FROM blobs WHERE hash = ? AND refcount <= 0", ((d,) for d in digests))
+
+    def blob_stats(self):
+        """(số blob, tổng refcount, bytes lưu thực tế, bytes nếu không dedup)"""
+        return self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(refcount), 0), COALESCE(SUM(size), 0), "
+            "COALESCE(SUM(size * refcount), 0) FROM blobs WHERE refcount > 0"
+        ).fetchone()
+
+    def fetched_at(self, key: str):
+        row = self._conn().execute("SELECT fetched_at FROM entries WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def count(self) -> int:
+        """Số entry (bộ đếm duy trì khi ghi - không quét bảng)"""
+        row = self._conn().execute(
+            "SELECT entries FROM counters WHERE dim = 'total' AND value = ''"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def counters(self) -> dict:
+        """Bộ đếm: tổng entries/bytes (identity) + theo status + theo content-type"""
+        stats = {"entries": 0, "bytes": 0, "by_status": {}, "by_content_type": {}}
+        rows = self._conn().execute(
+            "SELECT dim, value, entries, bytes FROM counters WHERE entries > 0 ORDER BY entries DESC"
+        )
+        for dim, value, n, size in rows:
+            if dim == "total":
+                stats["entries"], stats["bytes"] = n, size
+            else:
+                stats["by_" + dim][value] = {"entries": n, "bytes": size}
+        return stats
+
+    def recount(self):
+        """Đếm lại bộ đếm từ bảng entries (chậm: quét toàn bộ bảng)"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM counters")
+            conn.execute(
+                "INSERT INTO counters (dim, value, entries, bytes) "
+                "SELECT 'total', '', COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            )
+            conn.execute(
+                "INSERT INTO counters (dim, value, entries, bytes) "
+                "SELECT 'status', CAST(status AS TEXT), COUNT(*), SUM(size) FROM entries GROUP BY status"
+            )
+            conn.execute(
+                "INSERT INTO counters (dim, value, entries, bytes) "
+                "SELECT 'content_type', COALESCE(content_type, ''), COUNT(*), SUM(size) "
+                "FROM entries GROUP BY COALESCE(content_type, '')"
+            )
+            conn.execute("INSERT OR REPLACE INTO index_info (name, value) VALUES ('counters', '1')")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def put_failure(self, key: str, url: str, status: int, ttl: float, headers: dict = None,
+                    body: bytes = None, error: str = None) -> bool:
+        """
+        Ghi lỗi vào negative cache (status 0 = lỗi kết nối/timeout, không có response), hết hạn sau ttl giây.
+        Returns False nếu key đã có entry thành công (lỗi không bao giờ đè entry tốt).
+        """
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            cur = conn.execute(_SQL_FAILURE_PUT, (
+                key, url, int(status), error,
+                json.dumps(headers or {}, ensure_ascii=False, separators=(",", ":")),
+                body, now, now + ttl, key,
+            ))
+        return cur.rowcount > 0
+
+    def get_failure(self, key: str):
+        """Lỗi còn hạn của key: {"url", "status", "error", "headers", "body", "failed_at", "expires_at"} hoặc None"""
+        row = self._conn().execute(_SQL_FAILURE_GET, (key, time.time())).fetchone()
+        if row is None:
+            return None
+        return {
+            "url": row[0], "status": row[1], "error": row[2], "headers": json.loads(row[3] or "{}"),
+            "body": row[4] or b"", "failed_at": row[5], "expires_at": row[6],
+        }
+
+    def drop_failure(self, key: str):
+        conn = self._conn()
+        with conn:
+            conn.execute(_SQL_FAILURE_DROP, (key,))
+
+    def purge_failures(self, expired_only: bool = True) -> int:
+        """Xoá lỗi đã hết hạn (hoặc toàn bộ negative cache). Returns: số dòng đã xoá"""
+        conn = self._conn()
+        with conn:
+            if expired_only:
+                cur = conn.execute("DELETE FROM failures WHERE expires_at <= ?", (time.time(),))
+            else:
+                cur = conn.execute("DELETE FROM failures")
+        return cur.rowcount
+
+    def failure_stats(self) -> dict:
+        """Số lỗi còn hạn theo status (0 = lỗi kết nối) + số lỗi đã hết hạn chưa dọn"""
+        now = time.time()
+        conn = self._conn()
+        by_status = {
+            str(status): n for status, n in conn.execute(
+                "SELECT status, COUNT(*) FROM failures WHERE expires_at > ? GROUP BY status ORDER BY 2 DESC", (now,)
+            )
+        }
+        expired = conn.execute("SELECT COUNT(*) FROM failures WHERE expires_at <= ?", (now,)).fetchone()[0]
+        return {"active": sum(by_status.values()), "expired": expired, "by_status": by_status}
+
+    def list_failures(self, limit: int = 100):
+        """[(url, status, error, giây còn lại)] các lỗi còn hạn, mới nhất trước"""
+        now = time.time()
+        rows = self._conn().execute(
+            "SELECT url, status, error, expires_at - ? FROM failures WHERE expires_at > ? "
+            "ORDER BY failed_at DESC LIMIT ?", (now, now, limit)
+        )
+        return rows.fetchall()
+
+    def iter_entries(self, fetched_before: float = None, content_type: str = None):
+        """(key, url, fetched_at, content_type) của các entry, cũ nhất trước (lọc theo thời điểm fetch / content-type)"""
+        sql = "SELECT key, url, fetched_at, content_type FROM entries WHERE 1 = 1"
+        params = []
+        if fetched_before is not None:
+            sql += " AND fetched_at < ?"
+            params.append(fetched_before)
+        if content_type:
+            sql += " AND content_type LIKE ?"
+            params.append(f"%{content_type}%")
+        return self._conn().execute(sql + " ORDER BY fetched_at", params)
+
+    def urls_with_docid(self, doc_id: str):
+        rows = self._conn().execute(
+            "SELECT url, status FROM entries WHERE doc_id = ? ORDER BY url", (str(doc_id),)
+        )
+        return rows.fetchall()
+
+    @property
+    def complete(self) -> bool:
+        """
+        True khi index đã chứa toàn bộ cache (sau --rebuild) - lúc đó cache miss
+        không cần stat file .bin/.json của layout cũ nữa
+        """
+        if self._complete is None:
+            row = self._conn().execute("SELECT value FROM index_info WHERE name = 'complete'").fetchone()
+            self._complete = bool(row and row[0] == "1")
+        return self._complete
+
+    def mark_complete(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO index_info (name, value) VALUES ('complete', '1')")
+        self._complete = True
+
+def rebuild(cache_dir: str, batch_size: int = 2000):
+    """Nạp metadata của các entry chưa có trong index (đọc sidecar .json / pack index)"""
+    import cache_store
+
+    store = cache_store.get_store(cache_dir)
+    index = store.index
+    if index is None:
+        raise RuntimeError("CACHE_INDEX=none - index SQLite đang bị tắt")
+
+    added = 0
+    scanned = 0
+    batch = []
+    for key in store.iter_keys():
+        scanned += 1
+        if index.has(key):
+            continue
+        entry = store.load_unindexed(key)
+        if entry is None:
+            continue
+        meta, size, fetched_at = entry
+        batch.append((key, meta, size, fetched_at))
+        if len(batch) >= batch_size:
+            index.put_many(batch)
+            added += len(batch)
+            batch = []
+            print(f"   Đã index: {added:,} entries (đã duyệt {scanned:,})")
+    if batch:
+        index.put_many(batch)
+        added += len(batch)
+    index.mark_complete()
+    return scanned, added
+
+def main():
+    ap = argparse.ArgumentParser(description="Quản lý / truy vấn SQLite index của cache")
+    ap.add_argument("--cache-dir", type=str, default=os.getenv("CACHE_DIR", "cache"),
+                    help="Thư mục cache (mặc định: $CACHE_DIR hoặc cache)")
+    ap.add_argument("--rebuild", action="store_true",
+                    help="Nạp metadata của cache hiện có (sidecar .json / pack) vào index")
+    ap.add_argument("--stats", action="store_true",
+                    help="Thống kê số entry theo status và content-type (bộ đếm duy trì sẵn)")
+    ap.add_argument("--recount", action="store_true",
+                    help="Đếm lại bộ đếm từ bảng entries (chậm)")
+    ap.add_argument("--docid", type=str, default="",
+                    help="Liệt kê tất cả URL đã cache có docId=<giá trị>")
+    ap.add_argument("--failures", action="store_true",
+                    help="Negative cache: thống kê + liệt kê URL lỗi còn hạn TTL")
+    ap.add_argument("--purge-failures", action="store_true",
+                    help="Xoá lỗi đã hết hạn khỏi negative cache")
+    ap.add_argument("--clear-failures", action="store_true",
+                    help="Xoá toàn bộ negative cache (crawl lại mọi URL lỗi)")
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.cache_dir):
+        print(f"❌ Không tìm thấy thư mục cache: {args.cache_dir}")
+        sys.exit(1)
+
+    if args.rebuild:
+        print(f"🗂️  Rebuild index cho {args.cache_dir}...")
+        start = time.time()
+        scanned, added = rebuild(args.cache_dir)
+        print(f"✅ Đã duyệt {scanned:,} entries, thêm {added:,} vào index ({time.time() - start:.1f}s)")
+
+    index = MetaIndex(args.cache_dir)
+
+    if args.recount:
+        start = time.time()
+        index.recount()
+        print(f"🔢 Đã đếm lại bộ đếm ({time.time() - start:.1f}s)")
+
+    if args.stats:
+        stats = index.counters()
+        print(f"📊 Tổng entries: {stats['entries']:,} ({stats['bytes'] / 1024 / 1024:.1f} MB) "
+              f"(index {'đầy đủ' if index.complete else 'CHƯA đầy đủ - chạy --rebuild'})")
+        print("\n📈 Theo status:")
+        for status, c in stats["by_status"].items():
+            print(f"   {status}: {c['entries']:,} ({c['bytes'] / 1024 / 1024:.1f} MB)")
+        print("\n📄 Theo content-type:")
+        for ctype, c in stats["by_content_type"].items():
+            print(f"   {ctype or '(none)'}: {c['entries']:,} ({c['bytes'] / 1024 / 1024:.1f} MB)")
+
+    if args.purge_failures or args.clear_failures:
+        removed = index.purge_failures(expired_only=not args.clear_failures)
+        print(f"🧹 Đã xoá {removed:,} lỗi khỏi negative cache")
+
+    if args.failures:
+        stats = index.failure_stats()
+        print(f"🚫 Negative cache: {stats['active']:,} URL lỗi còn hạn, {stats['expired']:,} đã hết hạn")
+        for status, n in stats["by_status"].items():
+            print(f"   {status if status != '0' else 'lỗi kết nối'}: {n:,}")
+        for url, status, error, remaining in index.list_failures():
+            print(f"   [{status or error}] {url} (còn {remaining:.0f}s)")
+
+    if args.docid:
+        rows = index.urls_with_docid(args.docid)
+        print(f"🔗 {len(rows)} URL đã cache có docId={args.docid}:")
+        for url, status in rows:
+            print(f"   [{status}] {url}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1067 @@
+"""
+Lưu trữ cache dùng chung cho app.py, app_offline_viewer.py, auto_crawl_proxy.py
+và các script kiểm tra (check_cached_urls.py, verify_cached_links.py...)
+
+Layout trên đĩa (fan-out 2 cấp để mỗi thư mục chỉ chứa vài nghìn file):
+    cache/ab/cd/<sha256>.bin   - body của response
+    cache/ab/cd/<sha256>.json  - metadata (url, status, headers)
+
+Layout phẳng cũ (cache/<sha256>.bin) vẫn đọc được, để proxy tiếp tục phục vụ
+trong lúc migrate_cache_layout.py đang chuyển dữ liệu sang layout mới.
+
+Backend lưu trữ (CACHE_BACKEND):
+    files - 2 file / URL như trên (mặc định)
+    pack  - body được append vào các pack file lớn cache/packs/seg-000001.pack,
+            index.log ghi key -> (segment, offset, length, meta)
+
+Metadata (url, status, headers...) được ghi vào SQLite index cache/index.sqlite3
+(xem cache_index.py) thay cho sidecar .json; sidecar chỉ còn được đọc cho entry cũ.
+
+Nén khi lưu (CACHE_COMPRESS): body dạng text được lưu ở dạng nén gzip (body chính,
+meta["encoding"]) kèm các biến thể br/zstd nếu có thư viện (meta["variants"]).
+Proxy có thể trả thẳng bytes đã nén khi client chấp nhận Content-Encoding đó.
+
+Dedup (CACHE_DEDUP): body được lưu theo nội dung - cache/blobs/ab/cd/<body_sha256>.bin,
+<key>.bin chỉ là hard link tới blob. Nhiều URL có body giống hệt nhau dùng chung 1 blob;
+refcount nằm trong bảng blobs của SQLite index (dedup_cache.py --gc dọn blob không còn dùng).
+Vì vậy file trong cache KHÔNG BAO GIỜ được ghi đè tại chỗ - luôn ghi file tạm rồi os.replace.
+
+Negative cache: response lỗi của origin (status >= 400) và lỗi kết nối không thành entry mà được nhớ
+trong bảng failures của index với TTL (NEGATIVE_TTL / NEGATIVE_TTL_5XX), không bao giờ đè entry tốt.
+"""
+
+import os
+import re
+import gzip
+import json
+import fcntl
+import time
+import hashlib
+import threading
+
+try:
+    import brotli
+except ImportError:  # tuỳ chọn: uv pip install brotli
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # tuỳ chọn: uv pip install zstandard
+    zstandard = None
+
+from cache_index import MetaIndex, INDEX_FILE
+import url_rewrite
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+# sharded: ghi vào cache/ab/cd/<key>.*  |  flat: ghi vào cache/<key>.* (layout cũ)
+CACHE_LAYOUT = os.getenv("CACHE_LAYOUT", "sharded").lower()
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "files").lower()
+PACK_SEGMENT_BYTES = int(os.getenv("PACK_SEGMENT_BYTES", str(256 * 1024 * 1024)))
+# Backend pack: cache hit cũng đọc đuôi index.log tối đa mỗi ngần này giây (entry bị process khác ghi lại)
+PACK_REFRESH_INTERVAL = float(os.getenv("PACK_REFRESH_INTERVAL", "1.0"))
+# sqlite: metadata trong cache/index.sqlite3 | none: chỉ dùng sidecar .json như cũ
+CACHE_INDEX = os.getenv("CACHE_INDEX", "sqlite").lower()
+# Vẫn ghi sidecar <key>.json khi đã có index (để script ngoài đọc trực tiếp)
+CACHE_JSON_SIDECAR = os.getenv("CACHE_JSON_SIDECAR", "false").lower() == "true"
+# Thứ tự encoding khi lưu: encoding đầu tiên là body chính, các encoding sau là biến thể.
+# CACHE_COMPRESS= (rỗng) để lưu nguyên bản như cũ
+CACHE_COMPRESS = [e.strip().lower() for e in os.getenv("CACHE_COMPRESS", "gzip,br,zstd").split(",") if e.strip()]
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "512"))
+# Lưu body theo nội dung (blob dùng chung giữa các URL có body giống nhau)
+CACHE_DEDUP = os.getenv("CACHE_DEDUP", "true").lower() == "true"
+# Process chỉ đọc cache (offline viewer đặt cache_store.READ_ONLY = True trước khi dùng store):
+# index SQLite mở mode=ro, không tạo / migrate / đếm lại
+READ_ONLY = os.getenv("CACHE_READ_ONLY", "false").lower() == "true"
+# Negative cache (bảng failures trong index): TTL giây cho 4xx / cho 5xx + lỗi kết nối (0 = không nhớ lỗi)
+NEGATIVE_TTL = int(os.getenv("NEGATIVE_TTL", "3600"))
+NEGATIVE_TTL_5XX = int(os.getenv("NEGATIVE_TTL_5XX", "300"))
+# Body lỗi lớn hơn ngần này không được giữ (trả body rỗng khi phục vụ từ negative cache)
+NEGATIVE_MAX_BODY = 64 * 1024
+
+def cache_key(method: str, url: str) -> str:
+    """Cache key = sha256("METHOD url") - giữ nguyên như app.py cũ"""
+    return hashlib.sha256(f"{method} {url}".encode("utf-8")).hexdigest()
+
+def shard_dir(key: str, cache_dir: str = None) -> str:
+    """Thư mục con chứa key: cache/ab/cd"""
+    return os.path.join(cache_dir or CACHE_DIR, key[:2], key[2:4])
+
+def sharded_paths(key: str, cache_dir: str = None):
+    d = shard_dir(key, cache_dir)
+    return os.path.join(d, key + ".bin"), os.path.join(d, key + ".json")
+
+def flat_paths(key: str, cache_dir: str = None):
+    d = cache_dir or CACHE_DIR
+    return os.path.join(d, key + ".bin"), os.path.join(d, key + ".json")
+
+def write_paths(key: str, cache_dir: str = None):
+    """Đường dẫn để GHI entry mới (theo CACHE_LAYOUT), tự tạo thư mục shard"""
+    if CACHE_LAYOUT == "flat":
+        return flat_paths(key, cache_dir)
+    os.makedirs(shard_dir(key, cache_dir), exist_ok=True)
+    return sharded_paths(key, cache_dir)
+
+def find_paths(key: str, cache_dir: str = None):
+    """
+    Tìm cặp (.bin, .json) đang tồn tại của key: ưu tiên layout sharded,
+    fallback về layout phẳng. Returns: (bin_path, meta_path) hoặc None
+    """
+    for bin_path, meta_path in (sharded_paths(key, cache_dir), flat_paths(key, cache_dir)):
+        if os.path.exists(bin_path) and os.path.exists(meta_path):
+            return bin_path, meta_path
+    return None
+
+def find_body_path(key: str, cache_dir: str = None):
+    """Đường dẫn .bin đang tồn tại của key (sharded trước, phẳng sau) hoặc None"""
+    for bin_path, _ in (sharded_paths(key, cache_dir), flat_paths(key, cache_dir)):
+        if os.path.exists(bin_path):
+            return bin_path
+    return None
+
+def _atomic_write(path: str, data: bytes):
+    """Ghi ra file tạm rồi os.replace - reader không bao giờ đọc phải file ghi dở"""
+    tmp = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def blob_path(digest: str, ext: str = ".bin", cache_dir: str = None) -> str:
+    """cache/blobs/ab/cd/<body_sha256><ext> - body dùng chung theo nội dung"""
+    return os.path.join(cache_dir or CACHE_DIR, "blobs", digest[:2], digest[2:4], digest + ext)
+
+def _link_blob(blob: str, data: bytes, dest: str):
+    """
+    Đảm bảo blob tồn tại (ghi nếu chưa có) rồi hard-link nó thành dest (atomic).
+    Nếu GC vừa xoá blob giữa chừng thì ghi lại; filesystem không hỗ trợ link thì ghi thẳng.
+    """
+    tmp = f"{dest}.tmp{os.getpid()}.{threading.get_ident()}"
+    for _ in range(3):
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            _atomic_write(blob, data)
+        try:
+            os.link(blob, tmp)
+        except FileNotFoundError:
+            continue
+        except FileExistsError:
+            os.unlink(tmp)
+            continue
+        except OSError:
+            break
+        os.replace(tmp, dest)
+        return
+    _atomic_write(dest, data)
+
+def _load_files(key: str, cache_dir: str = None):
+    """
+    Đọc (body, meta) từ cặp .bin/.json. Returns None nếu chưa cache.
+    Thử lại 1 lần nếu file vừa bị migrate_cache_layout.py chuyển đi giữa chừng.
+    """
+    for _ in range(2):
+        found = find_paths(key, cache_dir)
+        if not found:
+            return None
+        bin_path, meta_path = found
+        try:
+            with open(bin_path, "rb") as f:
+                body = f.read()
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            return body, meta
+        except FileNotFoundError:
+            continue
+    return None
+
+def _is_key_file(name: str, suffix: str) -> bool:
+    return name.endswith(suffix) and len(name) == 64 + len(suffix)
+
+def iter_keys(cache_dir: str = None):
+    """Duyệt tất cả key có file .bin (layout phẳng + sharded) bằng os.scandir"""
+    root = cache_dir or CACHE_DIR
+    try:
+        top = list(os.scandir(root))
+    except FileNotFoundError:
+        return
+    for entry in top:
+        if entry.is_file() and _is_key_file(entry.name, ".bin"):
+            yield entry.name[:-4]
+        elif entry.is_dir() and len(entry.name) == 2:
+            for sub in os.scandir(entry.path):
+                if not (sub.is_dir() and len(sub.name) == 2):
+                    continue
+                for f in os.scandir(sub.path):
+                    if _is_key_file(f.name, ".bin"):
+                        yield f.name[:-4]
+
+def iter_flat_keys(cache_dir: str = None):
+    """Chỉ duyệt các key còn nằm ở layout phẳng (dùng cho migrate)"""
+    root = cache_dir or CACHE_DIR
+    try:
+        entries = os.scandir(root)
+    except FileNotFoundError:
+        return
+    with entries:
+        for entry in entries:
+            if entry.is_file() and _is_key_file(entry.name, ".bin"):
+                yield entry.name[:-4]
+
+# ================== COMPRESSION ==================
+
+# Đuôi file của các biến thể nén (backend files): <key>.gz / <key>.br / <key>.zst
+VARIANT_EXT = {"gzip": ".gz", "br": ".br", "zstd": ".zst"}
+
+# Body có chứa URL cần rewrite (origin hoặc proxy online) -> không trả thẳng bytes đã nén
+_ORIGIN_REF_RE = re.compile(rb"kiagds\.ru|localhost:5002", re.I)
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6, mtime=0)
+    if encoding == "br":
+        return brotli.compress(body, quality=9)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(body)
+    raise ValueError(f"encoding không hỗ trợ: {encoding}")
+
+def decompress(data: bytes, encoding: str) -> bytes:
+    """Giải nén body đã lưu về identity"""
+    if not encoding or encoding == "identity":
+        return data
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "br":
+        return brotli.decompress(data)
+    if encoding == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"encoding không hỗ trợ: {encoding}")
+
+def available_encodings():
+    """Các encoding trong CACHE_COMPRESS có thư viện để nén"""
+    libs = {"gzip": True, "br": brotli is not None, "zstd": zstandard is not None}
+    return [e for e in CACHE_COMPRESS if libs.get(e)]
+
+def is_compressible(content_type: str) -> bool:
+    """Text/JS/JSON/XML/SVG nén tốt; ảnh, font woff2, pdf... đã nén sẵn nên bỏ qua"""
+    ct = (content_type or "").lower()
+    return (
+        "text/" in ct
+        or "javascript" in ct
+        or "json" in ct
+        or "xml" in ct
+        or "svg" in ct
+    )
+
+def has_origin_refs(body: bytes) -> bool:
+    """Body (charset tương thích ASCII) có URL origin cần rewrite"""
+    return _ORIGIN_REF_RE.search(body) is not None
+
+def _ascii_incompatible_text(meta: dict) -> bool:
+    """
+    Body textual với charset không tương thích ASCII (UTF-16...): "kiagds.ru" không xuất hiện dưới dạng
+    bytes ASCII nên has_origin_refs() luôn sai - entry loại này luôn được rewrite (decode rồi thay)
+    """
+    content_type = _header(meta.get("headers"), "Content-Type", "")
+    return is_compressible(content_type) and not url_rewrite.ascii_compatible(url_rewrite.charset_of(content_type))
+
+def needs_rewrite(meta: dict) -> bool:
+    """
+    Body textual của entry có thể còn URL origin cần rewrite lúc phục vụ. Không dựa vào meta["origin_refs"]
+    với charset không tương thích ASCII (entry lưu trước đây có thể mang origin_refs=False sai)
+    """
+    return meta.get("origin_refs", True) or _ascii_incompatible_text(meta)
+
+def _header(headers: dict, name: str, default=None):
+    name = name.lower()
+    for k, v in (headers or {}).items():
+        if k.lower() == name:
+            return v
+    return default
+
+def headers_from_raw(raw) -> dict:
+    """
+    Header origin từ các cặp (name, value) bytes (httpx: resp.headers.raw) giống dict(resp.headers) của requests:
+    giữ nguyên hoa/thường, header lặp nối bằng ', ' - entry ghi bằng httpx và requests giống hệt nhau
+    """
+    headers = {}
+    lower = {}
+    for raw_name, raw_value in raw:
+        name, value = raw_name.decode("latin-1"), raw_value.decode("latin-1")
+        first = lower.setdefault(name.lower(), name)
+        headers[first] = f"{headers[first]}, {value}" if first in headers else value
+    return headers
+
+def encode_for_storage(body: bytes, meta: dict):
+    """
+    Chuẩn bị entry để lưu: (stored_body, meta, variants)
+    - stored_body: body chính ở dạng meta["encoding"] (gzip hoặc identity)
+    - variants: {encoding: bytes} các biến thể nén khác (br, zstd)
+    """
+    meta = dict(meta)
+    content_type = _header(meta.get("headers"), "Content-Type", "")
+    meta["size"] = len(body)
+    meta["body_sha256"] = hashlib.sha256(body).hexdigest()
+    if _ascii_incompatible_text(meta):
+        # Không quét được trên bytes: coi như có URL cần rewrite (phục vụ bằng decode + rewrite như trước)
+        meta["origin_refs"] = True
+    else:
+        meta["origin_refs"] = is_compressible(content_type) and has_origin_refs(body)
+    if meta["origin_refs"] and url_rewrite.ascii_compatible(url_rewrite.charset_of(content_type)):
+        # Vị trí các URL cần rewrite (trên body identity): lúc phục vụ chỉ cần ghép, không quét regex
+        meta["rewrite_offsets"] = url_rewrite.pack_spans(url_rewrite.rewrite_spans(body))
+    meta["encoding"] = "identity"
+    meta["variants"] = []
+    if len(body) < COMPRESS_MIN_BYTES or not is_compressible(content_type):
+        return body, meta, {}
+
+    encoded = {}
+    for encoding in available_encodings():
+        data = _compress(body, encoding)
+        if len(data) < len(body):
+            encoded[encoding] = data
+    if not encoded:
+        return body, meta, {}
+    primary = next(iter(encoded))
+    stored = encoded.pop(primary)
+    meta["encoding"] = primary
+    meta["variants"] = list(encoded)
+    return stored, meta, encoded
+
+def parse_accept_encoding(header: str) -> set:
+    """Các encoding client chấp nhận (q > 0) từ header Accept-Encoding"""
+    accepted = set()
+    for part in (header or "").split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(token)
+    return accepted
+
+# Ưu tiên encoding nhỏ nhất khi client chấp nhận nhiều loại
+_ENCODING_PREFERENCE = ("br", "zstd", "gzip")
+
+class BodyFile:
+    """
+    File-like giới hạn trong [offset, offset + length) của 1 file đã mở - dùng cho
+    wsgi.file_wrapper. fileno() trỏ đúng vị trí body nên server hỗ trợ sendfile
+    (gunicorn...) gửi thẳng từ kernel, giới hạn bởi Content-Length = length.
+    """
+
+    def __init__(self, f, offset: int, length: int):
+        self._f = f
+        self._f.seek(offset)
+        self.offset = offset
+        self.length = length
+        self._left = length
+
+    def restrict(self, start: int, length: int):
+        """Chỉ gửi đoạn [start, start + length) của body (Range request)"""
+        self._f.seek(self.offset + start)
+        self.offset += start
+        self.length = length
+        self._left = length
+
+    def iter_range(self, start: int, stop: int, chunk_size: int = 64 * 1024):
+        """Đọc đoạn [start, stop) của body bằng pread theo từng chunk - không đụng vị trí file"""
+        fd = self._f.fileno()
+        pos = start
+        while pos < stop:
+            data = os.pread(fd, min(chunk_size, stop - pos), self.offset + pos)
+            if not data:
+                break
+            pos += len(data)
+            yield data
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self._left:
+            size = self._left
+        data = self._f.read(size) if size else b""
+        self._left -= len(data)
+        return data
+
+    def fileno(self) -> int:
+        return self._f.fileno()
+
+    def tell(self) -> int:
+        return self.length - self._left
+
+    def close(self):
+        self._f.close()
+
+def _open_body_file(path: str, offset: int = 0, length: int = None):
+    f = open(path, "rb")
+    if length is None:
+        length = os.fstat(f.fileno()).st_size - offset
+    return BodyFile(f, offset, length)
+
+# ================== BACKENDS ==================
+
+class FileStore:
+    """
+    Backend 2 file / URL: <key>.bin (layout sharded hoặc phẳng) + metadata.
+    Có index: metadata lấy từ SQLite, không ghi/đọc sidecar .json nữa
+    (trừ entry cũ chưa được index, hoặc khi CACHE_JSON_SIDECAR=true).
+    """
+
+    name = "files"
+
+    def __init__(self, cache_dir: str, index: MetaIndex = None):
+        self.cache_dir = cache_dir
+        self.index = index
+
+    def load(self, key: str):
+        if self.index is not None:
+            meta = self.index.get(key)
+            if meta is not None:
+                for _ in range(2):
+                    bin_path = find_body_path(key, self.cache_dir)
+                    if bin_path is None:
+                        return None
+                    try:
+                        with open(bin_path, "rb") as f:
+                            return f.read(), meta
+                    except FileNotFoundError:
+                        continue
+                return None
+            if self.index.complete:
+                return None
+        return _load_files(key, self.cache_dir)
+
+    def load_meta(self, key: str):
+        """Chỉ metadata (index, hoặc sidecar .json với entry cũ) - không mở body"""
+        if self.index is not None:
+            meta = self.index.get(key)
+            if meta is not None or self.index.complete:
+                return meta
+        for _ in range(2):
+            found = find_paths(key, self.cache_dir)
+            if not found:
+                return None
+            try:
+                with open(found[1], "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                continue
+        return None
+
+    def open_body(self, key: str, meta: dict = None):
+        """(BodyFile, meta) của body lưu identity - không đọc body vào RAM. None nếu miss/đã nén"""
+        if meta is None:
+            meta = self.load_meta(key)
+        if meta is None or (meta.get("encoding") or "identity") != "identity":
+            return None
+        for _ in range(2):
+            bin_path = find_body_path(key, self.cache_dir)
+            if bin_path is None:
+                return None
+            try:
+                return _open_body_file(bin_path), meta
+            except FileNotFoundError:
+                continue
+        return None
+
+    def exists(self, key: str) -> bool:
+        if self.index is not None:
+            if self.index.has(key):
+                return True
+            if self.index.complete:
+                return False
+        return find_paths(key, self.cache_dir) is not None
+
+    def load_variant(self, key: str, encoding: str):
+        """Bytes của biến thể nén <key>.<ext> (nằm cạnh .bin) hoặc None"""
+        bin_path = find_body_path(key, self.cache_dir)
+        if bin_path is None or encoding not in VARIANT_EXT:
+            return None
+        try:
+            with open(bin_path[:-4] + VARIANT_EXT[encoding], "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def save(self, key: str, body: bytes, meta: dict, variants: dict = None, fetched_at: float = None):
+        bin_path, meta_path = write_paths(key, self.cache_dir)
+        digest = meta.get("body_sha256") if CACHE_DEDUP else None
+        # Biến thể + .bin ghi trước, index ghi sau => index không bao giờ trỏ vào body chưa có
+        for encoding, data in (variants or {}).items():
+            ext = VARIANT_EXT[encoding]
+            if digest:
+                _link_blob(blob_path(digest, ext, self.cache_dir), data, bin_path[:-4] + ext)
+            else:
+                _atomic_write(bin_path[:-4] + ext, data)
+        if digest:
+            # Tên blob theo encoding đang lưu: cùng body nhưng lưu identity/gzip là 2 blob khác nhau
+            encoding = meta.get("encoding", "identity")
+            ext = ".bin" if encoding == "identity" else VARIANT_EXT[encoding]
+            _link_blob(blob_path(digest, ext, self.cache_dir), body, bin_path)
+        else:
+            _atomic_write(bin_path, body)
+        self._save_meta(key, meta, len(body), fetched_at)
+
+    def save_file(self, key: str, path: str, meta: dict, fetched_at: float = None):
+        """
+        Như save() nhưng body identity đã nằm sẵn trong file tạm `path` (cùng filesystem với cache):
+        file được chuyển vào chỗ bằng os.replace/link, không đọc lại vào RAM.
+        """
+        bin_path, _ = write_paths(key, self.cache_dir)
+        digest = meta.get("body_sha256") if CACHE_DEDUP else None
+        size = os.path.getsize(path)
+        if digest:
+            blob = blob_path(digest, ".bin", self.cache_dir)
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                # Blob chưa có thì file tạm trở thành blob; có rồi thì link blob cũ, bỏ file tạm
+                os.link(path, blob)
+            except FileExistsError:
+                tmp = f"{bin_path}.tmp{os.getpid()}.{threading.get_ident()}"
+                try:
+                    os.link(blob, tmp)
+                    os.replace(tmp, bin_path)
+                    os.unlink(path)
+                    path = None
+                except OSError:
+                    pass
+            except OSError:
+                pass
+        if path is not None:
+            os.replace(path, bin_path)
+        self._save_meta(key, meta, size, fetched_at)
+
+    def _save_meta(self, key: str, meta: dict, size: int, fetched_at: float = None):
+        _, meta_path = write_paths(key, self.cache_dir)
+        # Sidecar cũ đang có cũng phải được cập nhật, để không mô tả sai body mới (vd: đã nén)
+        if self.index is None or CACHE_JSON_SIDECAR or os.path.exists(meta_path):
+            _atomic_write(meta_path, json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"))
+        if self.index is not None:
+            self.index.put(key, meta, size, fetched_at)
+        if CACHE_LAYOUT != "flat":
+            # Bản ở layout phẳng cũ (nếu có, kể cả biến thể nén) đã bị entry mới thay thế
+            flat_bin, flat_meta = flat_paths(key, self.cache_dir)
+            for path in [flat_bin[:-4] + ext for ext in VARIANT_EXT.values()] + [flat_meta, flat_bin]:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+
+    def touch(self, key: str, meta: dict, fetched_at: float = None) -> bool:
+        """Chỉ ghi lại metadata (body giữ nguyên). False nếu key chưa có body"""
+        bin_path = find_body_path(key, self.cache_dir)
+        if bin_path is None:
+            return False
+        meta_path = bin_path[:-4] + ".json"
+        if self.index is None or CACHE_JSON_SIDECAR or os.path.exists(meta_path):
+            _atomic_write(meta_path, json.dumps(meta, ensure_ascii=False, indent=2).encode("utf-8"))
+        if self.index is not None:
+            self.index.put(key, meta, os.path.getsize(bin_path), fetched_at)
+        return True
+
+    def load_unindexed(self, key: str):
+        """(meta, size, fetched_at) từ sidecar .json - dùng khi rebuild index"""
+        found = find_paths(key, self.cache_dir)
+        if not found:
+            return None
+        bin_path, meta_path = found
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            st = os.stat(bin_path)
+        except (OSError, ValueError):
+            return None
+        return meta, st.st_size, st.st_mtime
+
+    def iter_keys(self):
+        return iter_keys(self.cache_dir)
+
+class PackStore:
+    """
+    Backend append-only: body được nối vào cuối segment hiện tại
+    (cache/packs/seg-NNNNNN.pack), sau đó 1 dòng JSON được append vào
+    cache/packs/index.log: {"k": key, "s": segment, "o": offset, "n": length, "m": meta,
+    "v": {encoding: [segment, offset, length]}} ("v": các biến thể nén, nếu có).
+
+    - Ghi: giữ flock trên index.log nên nhiều process (proxy, crawler) ghi an toàn.
+      Body được ghi TRƯỚC dòng index => reader không bao giờ thấy index trỏ vào byte chưa có.
+    - Đọc: index được nạp vào dict trong RAM, đọc thêm phần đuôi index.log khi miss (entry do
+      process khác vừa ghi) và cả khi hit nếu lần đọc trước đã quá PACK_REFRESH_INTERVAL giây
+      (key bị process khác ghi lại -> offset mới); body đọc bằng os.pread(offset, length).
+    - Entry cũ (layout files) vẫn đọc được qua FileStore fallback.
+    - Dedup: body có body_sha256 đã nằm trong pack thì chỉ ghi dòng index trỏ vào vị trí cũ.
+    """
+
+    name = "pack"
+
+    def __init__(self, cache_dir: str, index: MetaIndex = None, segment_bytes: int = PACK_SEGMENT_BYTES):
+        self.cache_dir = cache_dir
+        self.index = index
+        self.pack_dir = os.path.join(cache_dir, "packs")
+        os.makedirs(self.pack_dir, exist_ok=True)
+        self.index_path = os.path.join(self.pack_dir, "index.log")
+        self.segment_bytes = segment_bytes
+        self.legacy = FileStore(cache_dir, index)
+        self._index = {}       # key -> (segment, offset, length, meta, variants)
+        self._blobs = {}       # (body_sha256, encoding) -> (segment, offset, length, variants)
+        self._index_pos = 0    # đã đọc index.log tới byte này
+        self._refreshed_at = 0.0
+        self._fds = {}         # segment -> fd (mở để pread)
+        self._lock = threading.Lock()
+        self._refresh()
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.pack_dir, f"seg-{segment:06d}.pack")
+
+    def _refresh(self):
+        """Đọc các dòng index mới (do process này hoặc process khác append)"""
+        self._refreshed_at = time.monotonic()
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return
+        if size <= self._index_pos:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_pos)
+            data = f.read(size - self._index_pos)
+        # Chỉ nhận các dòng hoàn chỉnh - dòng cuối có thể đang được ghi dở
+        end = data.rfind(b"\n")
+        if end < 0:
+            return
+        for line in data[:end].split(b"\n"):
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            self._remember(rec["k"], rec["s"], rec["o"], rec["n"], rec["m"], rec.get("v") or {})
+        self._index_pos += end + 1
+
+    def _remember(self, key, segment, offset, length, meta, variants):
+        self._index[key] = (segment, offset, length, meta, variants)
+        digest = meta.get("body_sha256")
+        if digest and CACHE_DEDUP:
+            self._blobs[(digest, meta.get("encoding", "identity"))] = (segment, offset, length, variants)
+
+    def _lookup(self, key: str):
+        with self._lock:
+            loc = self._index.get(key)
+            if loc is None or time.monotonic() - self._refreshed_at >= PACK_REFRESH_INTERVAL:
+                self._refresh()
+                loc = self._index.get(key)
+            return loc
+
+    def _fd(self, segment: int) -> int:
+        fd = self._fds.get(segment)
+        if fd is None:
+            with self._lock:
+                fd = self._fds.get(segment)
+                if fd is None:
+                    fd = os.open(self._segment_path(segment), os.O_RDONLY)
+                    self._fds[segment] = fd
+        return fd
+
+    def load_unindexed(self, key: str):
+        loc = self._lookup(key)
+        if loc is None:
+            return self.legacy.load_unindexed(key)
+        return loc[3], loc[2], None
+
+    def load(self, key: str):
+        loc = self._lookup(key)
+        if loc is None:
+            return self.legacy.load(key)
+        segment, offset, length, meta, _ = loc
+        body = os.pread(self._fd(segment), length, offset)
+        return body, meta
+
+    def load_variant(self, key: str, encoding: str):
+        loc = self._lookup(key)
+        if loc is None:
+            return self.legacy.load_variant(key, encoding)
+        where = loc[4].get(encoding)
+        if not where:
+            return None
+        segment, offset, length = where
+        return os.pread(self._fd(segment), length, offset)
+
+    def load_meta(self, key: str):
+        loc = self._lookup(key)
+        if loc is None:
+            return self.legacy.load_meta(key)
+        return loc[3]
+
+    def open_body(self, key: str, meta: dict = None):
+        loc = self._lookup(key)
+        if loc is None:
+            return self.legacy.open_body(key, meta)
+        segment, offset, length, meta, _ = loc
+        if (meta.get("encoding") or "identity") != "identity":
+            return None
+        return _open_body_file(self._segment_path(segment), offset, length), meta
+
+    def exists(self, key: str) -> bool:
+        return self._lookup(key) is not None or self.legacy.exists(key)
+
+    def save(self, key: str, body: bytes, meta: dict, variants: dict = None, fetched_at: float = None):
+        variants = variants or {}
+        total = len(body) + sum(len(d) for d in variants.values())
+        digest = meta.get("body_sha256") if CACHE_DEDUP else None
+        with self._lock, open(self.index_path, "ab") as idx:
+            fcntl.flock(idx, fcntl.LOCK_EX)
+            try:
+                # Blob có thể vừa được process khác append
+                self._refresh()
+                shared = self._blobs.get((digest, meta.get("encoding", "identity"))) if digest else None
+                if shared and shared[2] == len(body) and set(shared[3]) >= set(variants):
+                    segment, offset, _, locs = shared
+                else:
+                    segment = self._current_segment(total)
+                    locs = {}
+                    with open(self._segment_path(segment), "ab") as seg:
+                        offset = seg.tell()
+                        seg.write(body)
+                        for encoding, data in variants.items():
+                            locs[encoding] = [segment, seg.tell(), len(data)]
+                            seg.write(data)
+                rec = {"k": key, "s": segment, "o": offset, "n": len(body), "m": meta}
+                if locs:
+                    rec["v"] = locs
+                idx.write(json.dumps(rec, ensure_ascii=False).encode("utf-8") + b"\n")
+                idx.flush()
+            finally:
+                fcntl.flock(idx, fcntl.LOCK_UN)
+            self._remember(key, segment, offset, len(body), meta, locs)
+        if self.index is not None:
+            self.index.put(key, meta, len(body), fetched_at)
+
+    def touch(self, key: str, meta: dict, fetched_at: float = None) -> bool:
+        """Append dòng index trỏ vào body cũ với metadata mới (không ghi lại body)"""
+        if self._lookup(key) is None:
+            return self.legacy.touch(key, meta, fetched_at)
+        with self._lock, open(self.index_path, "ab") as idx:
+            fcntl.flock(idx, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                segment, offset, length, current, locs = self._index[key]
+                # Body vừa bị process khác thay: metadata này không còn đúng
+                if current.get("body_sha256") != meta.get("body_sha256"):
+                    return False
+                rec = {"k": key, "s": segment, "o": offset, "n": length, "m": meta}
+                if locs:
+                    rec["v"] = locs
+                idx.write(json.dumps(rec, ensure_ascii=False).encode("utf-8") + b"\n")
+                idx.flush()
+            finally:
+                fcntl.flock(idx, fcntl.LOCK_UN)
+            self._remember(key, segment, offset, length, meta, locs)
+        if self.index is not None:
+            self.index.put(key, meta, length, fetched_at)
+        return True
+
+    def _current_segment(self, incoming: int) -> int:
+        """Segment đang ghi; mở segment mới khi segment hiện tại vượt segment_bytes"""
+        segments = sorted(
+            int(n[4:10]) for n in os.listdir(self.pack_dir)
+            if n.startswith("seg-") and n.endswith(".pack")
+        )
+        segment = segments[-1] if segments else 1
+        path = self._segment_path(segment)
+        if os.path.exists(path) and os.path.getsize(path) + incoming > self.segment_bytes:
+            segment += 1
+        return segment
+
+    def iter_keys(self):
+        with self._lock:
+            self._refresh()
+            keys = list(self._index)
+        seen = set(keys)
+        yield from keys
+        for key in self.legacy.iter_keys():
+            if key not in seen:
+                yield key
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def _open_index(cache_dir: str):
+    if CACHE_INDEX != "sqlite":
+        return None
+    if READ_ONLY:
+        # Không tạo index mới; cache chưa có index thì đọc theo layout file như cũ
+        if not os.path.exists(os.path.join(cache_dir, INDEX_FILE)):
+            return None
+        return MetaIndex(cache_dir, read_only=True)
+    return MetaIndex(cache_dir)
+
+def get_store(cache_dir: str = None, backend: str = None):
+    """Store dùng chung trong process cho (cache_dir, backend)"""
+    cache_dir = cache_dir or CACHE_DIR
+    backend = (backend or CACHE_BACKEND).lower()
+    with _stores_lock:
+        store = _stores.get((cache_dir, backend))
+        if store is None:
+            index = _open_index(cache_dir)
+            if backend == "pack":
+                store = PackStore(cache_dir, index)
+            elif backend == "files":
+                store = FileStore(cache_dir, index)
+            else:
+                raise ValueError(f"CACHE_BACKEND không hợp lệ: {backend} (files|pack)")
+            _stores[(cache_dir, backend)] = store
+        return store
+
+def load_entry(key: str, cache_dir: str = None):
+    """Đọc (body identity, meta) của key qua backend đang chọn. Returns None nếu chưa cache"""
+    entry = get_store(cache_dir).load(key)
+    if entry is None:
+        return None
+    body, meta = entry
+    return decompress(body, meta.get("encoding")), meta
+
+def load_meta(key: str, cache_dir: str = None):
+    """Chỉ metadata của entry (không đọc body) - dùng để trả 304 mà không chạm tới body"""
+    return get_store(cache_dir).load_meta(key)
+
+def entry_fetched_at(key: str, cache_dir: str = None):
+    """
+    fetched_at hiện tại của entry (None nếu không còn) - đổi mỗi lần entry được ghi / refresh.
+    Có index: 1 SELECT theo khoá chính, thấy ngay thay đổi của process khác.
+    """
+    index = get_store(cache_dir).index
+    if index is not None:
+        return index.fetched_at(key)
+    meta = load_meta(key, cache_dir)
+    return meta.get("fetched_at") if meta is not None else None
+
+def choose_encoding(meta: dict, accepted: set) -> str:
+    """Encoding sẽ được trả cho client: encoding nén đã lưu mà client chấp nhận, hoặc "identity" """
+    if meta.get("origin_refs") or _ascii_incompatible_text(meta):
+        return "identity"
+    stored = meta.get("encoding") or "identity"
+    available = {stored, *(meta.get("variants") or [])}
+    for encoding in _ENCODING_PREFERENCE:
+        if encoding in accepted and encoding in available:
+            return encoding
+    return "identity"
+
+def entry_etag(meta: dict, variant: str = ""):
+    """
+    Strong ETag (chưa quote) từ hash body; variant phân biệt các biểu diễn khác nhau của cùng body
+    (encoding nén, body đã rewrite). None nếu entry cũ chưa có body_sha256.
+    """
+    digest = meta.get("body_sha256")
+    if not digest:
+        return None
+    return f"{digest[:32]}-{variant}" if variant else digest[:32]
+
+def load_encoded(key: str, accepted: set, cache_dir: str = None):
+    """
+    Đọc body ở dạng nén mà client chấp nhận, KHÔNG giải nén.
+    Body còn URL cần rewrite (meta["origin_refs"]) luôn được trả về identity.
+    Returns: (bytes, meta, encoding) - encoding = "identity" nếu không có biến thể phù hợp
+    """
+    store = get_store(cache_dir)
+    entry = store.load(key)
+    if entry is None:
+        return None
+    body, meta = entry
+    stored = meta.get("encoding") or "identity"
+    encoding = choose_encoding(meta, accepted)
+    if encoding == stored and encoding != "identity":
+        return body, meta, encoding
+    if encoding != "identity":
+        data = store.load_variant(key, encoding)
+        if data is not None:
+            return data, meta, encoding
+    return decompress(body, stored), meta, "identity"
+
+def open_body(key: str, cache_dir: str = None, meta: dict = None):
+    """
+    Mở body đã lưu ở dạng identity để stream/sendfile thay vì đọc hết vào RAM.
+    meta: metadata đã đọc trước đó (load_meta) - tránh tra index lần nữa.
+    Returns: (BodyFile, meta) - None nếu chưa cache hoặc body đang lưu dạng nén.
+    Người gọi phải close() BodyFile (wsgi.file_wrapper tự đóng khi gửi xong).
+    """
+    return get_store(cache_dir).open_body(key, meta)
+
+def save_entry(key: str, body: bytes, meta: dict, cache_dir: str = None, fetched_at: float = None):
+    """Ghi entry (body identity) qua backend đang chọn, nén theo CACHE_COMPRESS"""
+    if fetched_at is None:
+        fetched_at = time.time()
+    # fetched_at nằm trong meta để mọi backend đều có Last-Modified
+    stored, meta, variants = encode_for_storage(body, dict(meta, fetched_at=fetched_at))
+    get_store(cache_dir).save(key, stored, meta, variants, fetched_at)
+
+class CacheWriter:
+    """
+    Ghi body đang tải từ origin vào file tạm cache/tmp/ (hash sha256 dần theo từng chunk).
+    Chỉ commit() khi đã nhận đủ mới thành entry (atomic); abort() hoặc thiếu byte so với
+    Content-Length thì file tạm bị xoá - transfer bị cắt ngang không bao giờ thành entry.
+    """
+
+    def __init__(self, key: str, cache_dir: str = None):
+        self.key = key
+        self.cache_dir = cache_dir or CACHE_DIR
+        tmp_dir = os.path.join(self.cache_dir, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        self.path = os.path.join(tmp_dir, f"{key}.{os.getpid()}.{threading.get_ident()}.part")
+        self.size = 0
+        self._sha = hashlib.sha256()
+        self._f = open(self.path, "wb")
+
+    def write(self, chunk: bytes):
+        self._f.write(chunk)
+        self._sha.update(chunk)
+        self.size += len(chunk)
+
+    def abort(self):
+        self._f.close()
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def commit_failure(self, meta: dict, expected_length: int = None) -> bool:
+        """Response lỗi của origin: ghi vào negative cache thay vì thành entry"""
+        self._f.close()
+        if expected_length is not None and self.size != expected_length:
+            self.abort()
+            return False
+        body = b""
+        if self.size <= NEGATIVE_MAX_BODY:
+            with open(self.path, "rb") as f:
+                body = f.read()
+        os.unlink(self.path)
+        remember_failure(self.key, meta.get("url", ""), meta["status"], meta.get("headers"), body,
+                         cache_dir=self.cache_dir)
+        return True
+
+    def commit(self, meta: dict, expected_length: int = None, fetched_at: float = None) -> bool:
+        """Lưu entry từ file tạm. False (và không lưu gì) nếu số byte khác expected_length"""
+        self._f.close()
+        if expected_length is not None and self.size != expected_length:
+            self.abort()
+            return False
+        if fetched_at is None:
+            fetched_at = time.time()
+        store = get_store(self.cache_dir)
+        content_type = _header(meta.get("headers"), "Content-Type", "")
+        if isinstance(store, FileStore) and not is_compressible(content_type):
+            # Nhị phân lưu identity (giống encode_for_storage): chuyển thẳng file tạm vào cache, không đọc lại
+            meta = dict(
+                meta, fetched_at=fetched_at, size=self.size, body_sha256=self._sha.hexdigest(),
+                origin_refs=False, encoding="identity", variants=[],
+            )
+            store.save_file(self.key, self.path, meta, fetched_at)
+            return True
+        # Text (cần nén / tính offset rewrite) hoặc pack backend: đọc lại file tạm 1 lần
+        with open(self.path, "rb") as f:
+            body = f.read()
+        os.unlink(self.path)
+        save_entry(self.key, body, meta, self.cache_dir, fetched_at)
+        return True
+
+# ================== REVALIDATION ==================
+
+# Header của response 304 thay cho header đã lưu (RFC 9111 4.3.4)
+_REVALIDATE_UPDATE = ("etag", "last-modified", "cache-control", "expires", "date")
+
+def revalidation_headers(meta: dict) -> dict:
+    """If-None-Match / If-Modified-Since từ ETag / Last-Modified của origin đã lưu (rỗng nếu origin không gửi)"""
+    headers = (meta or {}).get("headers") or {}
+    out = {}
+    etag = _header(headers, "ETag")
+    if etag:
+        out["If-None-Match"] = etag
+    last_modified = _header(headers, "Last-Modified")
+    if last_modified:
+        out["If-Modified-Since"] = last_modified
+    return out
+
+def touch_entry(key: str, meta: dict, response_headers: dict = None, cache_dir: str = None,
+                fetched_at: float = None) -> bool:
+    """
+    Origin trả 304 Not Modified: chỉ cập nhật metadata (fetched_at + ETag/Last-Modified/Cache-Control... mới),
+    không đọc/ghi body. False nếu entry không còn hoặc body vừa bị thay bởi lần ghi khác.
+    """
+    store = get_store(cache_dir)
+    current = store.load_meta(key)
+    if current is None or current.get("body_sha256") != meta.get("body_sha256"):
+        return False
+    meta = dict(meta)
+    headers = dict(meta.get("headers") or {})
+    for name, value in (response_headers or {}).items():
+        if name.lower() in _REVALIDATE_UPDATE:
+            for old in [k for k in headers if k.lower() == name.lower()]:
+                del headers[old]
+            headers[name] = value
+    meta["headers"] = headers
+    meta["fetched_at"] = fetched_at = fetched_at or time.time()
+    return store.touch(key, meta, fetched_at)
+
+# ================== NEGATIVE CACHE ==================
+
+def is_error_status(status: int) -> bool:
+    return status >= 400
+
+def negative_ttl(status: int) -> int:
+    """TTL cho lỗi: 4xx (URL sai, ít khi tự hết) lâu hơn 5xx / lỗi kết nối (status 0, thường tạm thời)"""
+    return NEGATIVE_TTL if 400 <= status < 500 else NEGATIVE_TTL_5XX
+
+def remember_failure(key: str, url: str, status: int, headers: dict = None, body: bytes = b"",
+                     error: str = None, cache_dir: str = None) -> bool:
+    """
+    Nhớ lỗi của origin (status 0 + error = lỗi kết nối/timeout) trong negative cache.
+    Returns False nếu không ghi: TTL = 0, không có index, hoặc key đã có entry thành công.
+    """
+    ttl = negative_ttl(status)
+    index = get_store(cache_dir).index
+    if ttl <= 0 or index is None:
+        return False
+    return index.put_failure(key, url, status, ttl, headers, body, error)
+
+def load_failure(key: str, cache_dir: str = None):
+    """Lỗi còn hạn của key (xem MetaIndex.get_failure) hoặc None"""
+    index = get_store(cache_dir).index
+    return index.get_failure(key) if index is not None else None
+
+def is_known_bad(url: str, method: str = "GET", cache_dir: str = None) -> bool:
+    """URL đang nằm trong negative cache (lỗi còn hạn) - crawler dùng để bỏ qua"""
+    return load_failure(cache_key(method, url), cache_dir) is not None
+
+def failure_stats(cache_dir: str = None) -> dict:
+    index = get_store(cache_dir).index
+    if index is None:
+        return {"active": 0, "expired": 0, "by_status": {}}
+    return index.failure_stats()
+
+def is_cached(url: str, method: str = "GET", cache_dir: str = None) -> bool:
+    """Kiểm tra URL đã được cache chưa (backend đang chọn, kể cả entry layout cũ)"""
+    return get_store(cache_dir).exists(cache_key(method, url))
+
+def cache_stats(cache_dir: str = None, recount: bool = False) -> dict:
+    """
+    Thống kê cache từ bộ đếm trong index (cập nhật khi ghi, giữ qua restart - không duyệt thư mục).
+    recount=True: đếm lại từ bảng entries (chậm). Chưa có index đầy đủ thì phải duyệt thư mục.
+    """
+    store = get_store(cache_dir)
+    index = store.index
+    if index is not None and index.complete:
+        recount = recount and not index.read_only
+        if recount:
+            index.recount()
+        stats = index.counters()
+        stats["source"] = "recount" if recount else "counters"
+        return stats
+    # Entry layout cũ chưa được index (chưa chạy cache_index.py --rebuild)
+    return {"entries": sum(1 for _ in store.iter_keys()), "source": "scan"}
+
+def count_entries(cache_dir: str = None) -> int:
+    """Số entry trong cache (xem cache_stats)"""
+    return cache_stats(cache_dir)["entries"]
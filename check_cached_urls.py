@@ -5,21 +5,14 @@ Script kiểm tra URLs nào trong full_urls_to_crawl.json đã được cache
 
 import json
 import os
-import hashlib
 import argparse
+import cache_store
 
 CACHE_DIR = os.getenv("CACHE_DIR", "cache")
 
-def cache_key(method: str, url: str) -> str:
-    """Tạo cache key giống với app.py"""
-    return hashlib.sha256(f"{method} {url}".encode("utf-8")).hexdigest()
-
 def is_cached(url: str) -> bool:
     """Kiểm tra URL đã được cache chưa"""
-    key = cache_key("GET", url)
-    bin_path = os.path.join(CACHE_DIR, key + ".bin")
-    meta_path = os.path.join(CACHE_DIR, key + ".json")
-    return os.path.exists(bin_path) and os.path.exists(meta_path)
+    return cache_store.is_cached(url, cache_dir=CACHE_DIR)
 
 def main():
     ap = argparse.ArgumentParser(
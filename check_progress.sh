@@ -42,7 +42,9 @@ fi
 
 # Cache directory stats
 if [ -d "cache" ]; then
-    CACHE_COUNT=$(find cache -name "*.bin" | wc -l)
+    # Đếm entry qua cache_store (index SQLite); body dedup trong cache/blobs/ không bị đếm 2 lần
+    CACHE_COUNT=$(python3 -c "import cache_store; print(cache_store.count_entries('cache'))" 2>/dev/null \
+        || find cache -path cache/blobs -prune -o -name "*.bin" -print | wc -l)
     echo "💾 Cache directory:"
     echo "   Total cached files: $CACHE_COUNT"
 else
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Nén các entry đã có trong cache (in-place, song song nhiều process).
+
+Mỗi body dạng text (HTML/CSS/JS/JSON/XML/SVG) chưa nén được ghi lại qua
+cache_store.save_entry(): body chính gzip + biến thể br/zstd (nếu có thư viện),
+metadata và thời điểm fetch được giữ nguyên. Ảnh, font, PDF... bỏ qua.
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import cache_store
+
+def compress_key(key: str, cache_dir: str, dry_run: bool = False):
+    """
+    Returns: (trạng thái, bytes trước, bytes sau)
+    trạng thái: 'compressed' | 'already' | 'skipped' | 'missing'
+    """
+    store = cache_store.get_store(cache_dir)
+    entry = store.load(key)
+    if entry is None:
+        return "missing", 0, 0
+    body, meta = entry
+    if (meta.get("encoding") or "identity") != "identity":
+        return "already", 0, 0
+
+    content_type = cache_store._header(meta.get("headers"), "Content-Type", "")
+    if not cache_store.is_compressible(content_type) or len(body) < cache_store.COMPRESS_MIN_BYTES:
+        return "skipped", 0, 0
+
+    stored, new_meta, variants = cache_store.encode_for_storage(body, meta)
+    after = len(stored) + sum(len(v) for v in variants.values())
+    if new_meta["encoding"] == "identity":
+        return "skipped", 0, 0
+    if not dry_run:
+        # Giữ nguyên thời điểm fetch gốc (index, hoặc mtime của .bin với entry cũ)
+        fetched_at = store.index.fetched_at(key) if store.index is not None else None
+        if fetched_at is None:
+            legacy = store.load_unindexed(key)
+            fetched_at = legacy[2] if legacy else None
+        store.save(key, stored, new_meta, variants, fetched_at)
+    return "compressed", len(body), after
+
+def _run_batch(keys, cache_dir, dry_run):
+    results = []
+    for key in keys:
+        try:
+            results.append(compress_key(key, cache_dir, dry_run))
+        except Exception as e:
+            print(f"  ⚠️  {key}: {e}")
+            results.append(("error", 0, 0))
+    return results
+
+def _batches(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def main():
+    ap = argparse.ArgumentParser(description="Nén (gzip/br/zstd) các body dạng text đã có trong cache")
+    ap.add_argument("--cache-dir", type=str, default=cache_store.CACHE_DIR,
+                    help=f"Thư mục cache (mặc định: {cache_store.CACHE_DIR})")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 4,
+                    help="Số process nén song song (mặc định: số CPU)")
+    ap.add_argument("--batch-size", type=int, default=500,
+                    help="Số entry mỗi job (mặc định: 500)")
+    ap.add_argument("--dry-run", action="store_true",
+                    help="Chỉ tính dung lượng tiết kiệm được, không ghi")
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.cache_dir):
+        print(f"❌ Không tìm thấy thư mục cache: {args.cache_dir}")
+        sys.exit(1)
+
+    encodings = cache_store.available_encodings()
+    if not encodings:
+        print("❌ CACHE_COMPRESS rỗng hoặc không có thư viện nén nào")
+        sys.exit(1)
+    print(f"🗜️  Nén cache {args.cache_dir} ({', '.join(encodings)}; {args.workers} workers)"
+          f"{' [DRY-RUN]' if args.dry_run else ''}")
+
+    start = time.time()
+    counts = {"compressed": 0, "already": 0, "skipped": 0, "missing": 0, "error": 0}
+    bytes_before = bytes_after = 0
+    done = 0
+
+    keys = cache_store.get_store(args.cache_dir).iter_keys()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # Giới hạn số job đang chờ để không nạp toàn bộ danh sách key vào bộ nhớ
+        pending = []
+        for batch in _batches(keys, args.batch_size):
+            pending.append(pool.submit(_run_batch, batch, args.cache_dir, args.dry_run))
+            if len(pending) < args.workers * 2:
+                continue
+            for result in pending.pop(0).result():
+                status, before, after = result
+                counts[status] += 1
+                bytes_before += before
+                bytes_after += after
+                done += 1
+            print(f"   Đã xử lý: {done:,} entries")
+        for fut in pending:
+            for status, before, after in fut.result():
+                counts[status] += 1
+                bytes_before += before
+                bytes_after += after
+                done += 1
+
+    mb = 1024 * 1024
+    print(f"\n{'='*60}")
+    print(f"✅ Hoàn thành trong {time.time() - start:.1f}s ({done:,} entries)")
+    print(f"   - Đã nén: {counts['compressed']:,}")
+    print(f"   - Đã nén từ trước: {counts['already']:,}")
+    print(f"   - Bỏ qua (không nén được / quá nhỏ): {counts['skipped']:,}")
+    print(f"   - Lỗi: {counts['error']:,}")
+    if bytes_before:
+        print(f"   - Dung lượng: {bytes_before / mb:.1f} MB -> {bytes_after / mb:.1f} MB "
+              f"(tỉ lệ {bytes_before / max(bytes_after, 1):.1f}x, gồm cả các biến thể)")
+    print(f"{'='*60}")
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,8 @@ python3 auto_crawl_proxy.py \
   --concurrency 5 \
   --delay 0.3 \
   --max-retries 10 \
-  --auto-pagination
+  --auto-pagination \
+  --fresh
 
 echo ""
 echo "✅ Hoàn thành!"
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Frontier của auto_crawl_proxy.py lưu trên đĩa (SQLite WAL): crawl_frontier-<hash>.sqlite3
+
+Chỉ bật khi crawler chạy với --resume / --fresh (hoặc --frontier). Tên file lấy theo tham số quyết định
+seed của lượt chạy (--seed, trang, --extra-urls, --json-file + khoảng index, --direct) nên các lượt
+khác nhau (vd. crawl_range.sh chạy song song nhiều khoảng) không dùng chung một frontier.
+
+Bảng `urls` giữ mọi URL crawler đã thấy (= `seen`) cùng depth; URL chưa xử lý xong (done = 0)
+là hàng đợi. Crash / Ctrl-C giữa chừng thì `--resume` nạp lại seen + hàng đợi theo đúng thứ tự
+và crawl tiếp, không quay lại từ seed.
+
+Ghi theo batch trên 1 thread riêng (FIFO) nên event loop của crawler không chờ SQLite:
+URL con luôn được ghi trước (hoặc cùng transaction với) URL cha đánh dấu done, nên mất
+batch cuối khi crash chỉ khiến vài URL được crawl lại.
+
+Lượt crawl mới (không --resume) chỉ xoá frontier cũ khi nó đã xong hết hoặc có `fresh=True` (--fresh):
+frontier còn URL chờ thì từ chối (FileExistsError) để chạy nhầm không làm mất tiến độ của lượt bị dừng.
+
+Dùng như script:
+    python crawl_frontier.py                 # số URL đã thấy / đã xong / còn chờ theo depth (mọi frontier)
+    python crawl_frontier.py --frontier F    # chỉ frontier F
+"""
+
+import os
+import glob
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+from urllib.request import pathname2url
+from concurrent.futures import ThreadPoolExecutor
+
+# Đặt env thì mọi lượt dùng đúng file này; mặc định: FRONTIER_PREFIX-<hash tham số seed>.sqlite3
+FRONTIER_FILE = os.getenv("CRAWL_FRONTIER", "")
+FRONTIER_PREFIX = "crawl_frontier"
+# Ghi batch khi đệm đủ ngần này thao tác hoặc sau ngần này giây
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 2.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    id    INTEGER PRIMARY KEY,
+    url   TEXT NOT NULL UNIQUE,
+    depth INTEGER NOT NULL,
+    done  INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS urls_pending ON urls(id) WHERE done = 0;
+"""
+
+_SQL_ADD = "INSERT OR IGNORE INTO urls (url, depth) VALUES (?, ?)"
+_SQL_DONE = "UPDATE urls SET done = 1 WHERE url = ?"
+
+def frontier_path(**seed_args) -> str:
+    """File frontier của 1 lượt crawl: FRONTIER_FILE nếu có, không thì theo hash các tham số quyết định seed"""
+    if FRONTIER_FILE:
+        return FRONTIER_FILE
+    digest = hashlib.sha1(json.dumps(seed_args, sort_keys=True).encode()).hexdigest()[:12]
+    return f"{FRONTIER_PREFIX}-{digest}.sqlite3"
+
+class Frontier:
+    """seen + hàng đợi của crawler, ghi đệm theo batch (gọi add/done/checkpoint từ event loop)"""
+
+    def __init__(self, path: str = FRONTIER_FILE, resume: bool = False, fresh: bool = False,
+                 read_only: bool = False):
+        """
+        resume: giữ frontier cũ để load(). Không resume: frontier cũ còn URL chờ thì FileExistsError,
+        trừ khi fresh=True (bỏ hẳn). read_only: chỉ đọc (mode=ro), không tạo bảng / không ghi.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._added, self._done = [], []
+        self._last_flush = time.monotonic()
+        if read_only:
+            uri = "file:" + pathname2url(os.path.abspath(path)) + "?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False)
+            return
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        if not resume:
+            pending = self.pending()
+            if pending and not fresh:
+                self._writer.shutdown()
+                self._conn.close()
+                raise FileExistsError(f"Frontier {path} còn {pending:,} URL chưa crawl xong")
+            # Lượt crawl mới: bỏ frontier của lượt trước
+            self._conn.execute("DELETE FROM urls")
+        self._conn.commit()
+
+    def load(self):
+        """(seen, [(url, depth)] còn chờ theo thứ tự đã thêm) của lượt trước"""
+        with self._lock:
+            seen = {row[0] for row in self._conn.execute("SELECT url FROM urls")}
+            pending = self._conn.execute("SELECT url, depth FROM urls WHERE done = 0 ORDER BY id").fetchall()
+        return seen, pending
+
+    def pending(self) -> int:
+        """Số URL đã ghi xuống đĩa mà chưa xong"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM urls WHERE done = 0").fetchone()[0]
+
+    def add(self, url: str, depth: int):
+        self._added.append((url, depth))
+
+    def done(self, url: str):
+        self._done.append((url,))
+
+    def checkpoint(self, force: bool = False):
+        """Đẩy batch đang đệm sang thread ghi nếu đủ lớn / đủ lâu (force: luôn đẩy). Không chờ ghi xong."""
+        if not (self._added or self._done):
+            return
+        if not force and len(self._added) + len(self._done) < BATCH_SIZE \
+                and time.monotonic() - self._last_flush < FLUSH_INTERVAL:
+            return
+        added, done = self._added, self._done
+        self._added, self._done = [], []
+        self._last_flush = time.monotonic()
+        self._writer.submit(self._write, added, done)
+
+    def _write(self, added, done):
+        # 1 transaction: URL con (added) luôn vào cùng lúc hoặc trước URL cha (done)
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(_SQL_ADD, added)
+                self._conn.executemany(_SQL_DONE, done)
+
+    def close(self):
+        """Ghi nốt batch cuối và đóng (gọi khi crawl xong / bị dừng)"""
+        self.checkpoint(force=True)
+        self._writer.shutdown(wait=True)
+        self._conn.close()
+
+    def stats(self):
+        """[(depth, đã thấy, đã xong)] theo depth"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT depth, COUNT(*), SUM(done) FROM urls GROUP BY depth ORDER BY depth"
+            ).fetchall()
+
+def print_stats(path: str):
+    frontier = Frontier(path, read_only=True)
+    rows = frontier.stats()
+    frontier.close()
+    print(f"{'Depth':>6} {'Đã thấy':>10} {'Đã xong':>10} {'Còn chờ':>10}")
+    for depth, seen, done in rows:
+        print(f"{depth:>6} {seen:>10,} {done:>10,} {seen - done:>10,}")
+    total_seen = sum(r[1] for r in rows)
+    total_done = sum(r[2] for r in rows)
+    print(f"{'Tổng':>6} {total_seen:>10,} {total_done:>10,} {total_seen - total_done:>10,}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Xem frontier đã lưu của auto_crawl_proxy.py")
+    ap.add_argument("--frontier", type=str, default=FRONTIER_FILE,
+                    help=f"File frontier (mặc định: mọi {FRONTIER_PREFIX}-*.sqlite3 ở thư mục hiện tại, env CRAWL_FRONTIER)")
+    args = ap.parse_args()
+
+    paths = [args.frontier] if args.frontier else sorted(glob.glob(f"{FRONTIER_PREFIX}-*.sqlite3"))
+    if not paths or not os.path.exists(paths[0]):
+        print(f"❌ Không có frontier: {args.frontier or f'{FRONTIER_PREFIX}-*.sqlite3'}")
+        return
+    for path in paths:
+        print(f"\n📄 {path}")
+        print_stats(path)
+
+if __name__ == "__main__":
+    main()
@@ -20,6 +20,7 @@ nohup python3 auto_crawl_proxy.py \
   --delay 0.3 \
   --max-retries 10 \
   --auto-pagination \
+  --resume \
   > cache_important_full.log 2>&1 &
 
 PID=$!
@@ -34,5 +35,6 @@ echo "   tail -f cache_important_full.log"
 echo ""
 echo "🛑 Dừng crawl:"
 echo "   pkill -f auto_crawl_proxy.py"
+echo "   (chạy lại ./crawl_full.sh để crawl tiếp từ frontier đã lưu)"
 echo ""
 
@@ -33,6 +33,7 @@ nohup python3 auto_crawl_proxy.py \
   --delay 0.3 \
   --max-retries 10 \
   --auto-pagination \
+  --resume \
   > cache_range_${START}_${END}.log 2>&1 &
 
 PID=$!
@@ -42,4 +43,6 @@ echo ""
 echo "📝 Xem log:"
 echo "   tail -f cache_range_${START}_${END}.log"
 echo ""
+echo "♻️  Bị dừng thì chạy lại '$0 $START $END' để crawl tiếp (mỗi khoảng có frontier riêng)"
+echo ""
 
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Dedup body trong cache theo nội dung (content-addressed).
+
+- Mặc định (report): tìm các entry có body giống hệt nhau, báo số bytes có thể tiết kiệm.
+- --reclaim: gộp các body trùng thành 1 blob (cache/blobs/ab/cd/<sha256>), mỗi <key>.bin
+  chỉ còn là hard link tới blob; metadata + refcount trong SQLite index được cập nhật.
+- --gc: xoá blob không còn entry nào trỏ tới.
+
+Chạy được khi proxy đang chạy: mọi file đều được thay bằng os.replace (atomic).
+
+CACHE_BACKEND=pack: body trùng đã được dedup lúc ghi, script chỉ báo cáo (report only);
+--reclaim / --gc không thay đổi gì và thoát với mã 2.
+"""
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import cache_store
+
+BLOB_EXTS = (".bin",) + tuple(cache_store.VARIANT_EXT.values())
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def scan(cache_dir: str, workers: int):
+    """
+    Gom các .bin trùng nội dung.
+    Returns: (số entry, tổng bytes, {sha256 file: [(key, size, inode), ...]})
+    Chỉ hash những file có cùng kích thước với file khác (và khác inode).
+    """
+    by_size = defaultdict(dict)   # size -> {inode: [key, ...]}
+    total = total_bytes = 0
+    for key in cache_store.iter_keys(cache_dir):
+        path = cache_store.find_body_path(key, cache_dir)
+        if path is None:
+            continue
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        total += 1
+        total_bytes += st.st_size
+        by_size[st.st_size].setdefault((st.st_dev, st.st_ino), []).append(key)
+
+    candidates = [
+        (size, inode, keys)
+        for size, inodes in by_size.items() if len(inodes) > 1 and size > 0
+        for inode, keys in inodes.items()
+    ]
+
+    def _hash(item):
+        size, inode, keys = item
+        try:
+            return _file_digest(cache_store.find_body_path(keys[0], cache_dir)), item
+        except (OSError, TypeError):
+            return None, item
+
+    groups = defaultdict(list)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for digest, (size, inode, keys) in pool.map(_hash, candidates):
+            if digest:
+                groups[digest].extend((key, size, inode) for key in keys)
+    # Chỉ giữ nhóm có >= 2 inode khác nhau (file đã link chung thì không tiết kiệm thêm được)
+    dups = {d: items for d, items in groups.items() if len({i[2] for i in items}) > 1}
+    return total, total_bytes, dups
+
+def reclaim_key(store, key: str) -> bool:
+    """Ghi lại entry qua store.save() để body được link vào blob dùng chung"""
+    entry = store.load(key)
+    if entry is None:
+        return False
+    stored, meta = entry
+    meta = dict(meta)
+    if not meta.get("body_sha256"):
+        body = cache_store.decompress(stored, meta.get("encoding") or "identity")
+        meta["body_sha256"] = hashlib.sha256(body).hexdigest()
+    variants = {}
+    for encoding in meta.get("variants") or []:
+        data = store.load_variant(key, encoding)
+        if data is not None:
+            variants[encoding] = data
+    # Giữ nguyên thời điểm fetch gốc
+    fetched_at = store.index.fetched_at(key) if store.index is not None else None
+    if fetched_at is None:
+        legacy = store.load_unindexed(key)
+        fetched_at = legacy[2] if legacy else None
+    store.save(key, stored, meta, variants, fetched_at)
+    return True
+
+def gc(cache_dir: str, index) -> tuple:
+    """
+    Xoá blob không còn entry nào link tới (st_nlink == 1).
+    Returns: (số file đã xoá, bytes giải phóng)
+    """
+    removed = freed = 0
+    root = os.path.join(cache_dir, "blobs")
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+                if st.st_nlink > 1:
+                    continue
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += st.st_size
+    if index is not None:
+        gone = [
+            d for d in index.unreferenced_blobs()
+            if not any(os.path.exists(cache_store.blob_path(d, ext, cache_dir)) for ext in BLOB_EXTS)
+        ]
+        index.drop_blobs(gone)
+    return removed, freed
+
+def main():
+    ap = argparse.ArgumentParser(description="Dedup body trùng nội dung trong cache (report / reclaim / gc)")
+    ap.add_argument("--cache-dir", type=str, default=cache_store.CACHE_DIR,
+                    help=f"Thư mục cache (mặc định: {cache_store.CACHE_DIR})")
+    ap.add_argument("--workers", type=int, default=8,
+                    help="Số thread hash/ghi song song (mặc định: 8)")
+    ap.add_argument("--reclaim", action="store_true",
+                    help="Gộp các body trùng thành blob dùng chung (hard link)")
+    ap.add_argument("--gc", action="store_true",
+                    help="Xoá blob không còn entry nào trỏ tới")
+    ap.add_argument("--top", type=int, default=10,
+                    help="Số nhóm trùng lớn nhất hiển thị (mặc định: 10)")
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.cache_dir):
+        print(f"❌ Không tìm thấy thư mục cache: {args.cache_dir}")
+        sys.exit(1)
+
+    store = cache_store.get_store(args.cache_dir)
+    mb = 1024 * 1024
+    start = time.time()
+
+    pack = isinstance(store, cache_store.PackStore)
+    if pack:
+        # Pack backend dedup lúc ghi (dòng index trỏ vào blob đã có), không có file để gộp / dọn
+        print("ℹ️  CACHE_BACKEND=pack: report only - body trùng đã được dedup khi ghi, không gộp / xoá gì")
+    else:
+        print(f"🔍 Quét {args.cache_dir} ({args.workers} workers)...")
+        total, total_bytes, dups = scan(args.cache_dir, args.workers)
+        saving = sum(items[0][1] * (len({i[2] for i in items}) - 1) for items in dups.values())
+        dup_keys = sum(len(items) for items in dups.values())
+
+        print(f"\n{'='*60}")
+        print(f"📦 Entries: {total:,} ({total_bytes / mb:.1f} MB trên đĩa)")
+        print(f"🔁 Nhóm body trùng: {len(dups):,} ({dup_keys:,} entries)")
+        print(f"💾 Có thể tiết kiệm: {saving / mb:.1f} MB")
+        ranked = sorted(dups.values(), key=lambda items: items[0][1] * len(items), reverse=True)
+        for items in ranked[:args.top]:
+            print(f"   - {len(items):,} x {items[0][1]:,} bytes (vd: {items[0][0][:16]}...)")
+        print(f"{'='*60}")
+
+        if args.reclaim and dups:
+            keys = [key for items in dups.values() for key, _, _ in items]
+            print(f"\n🔗 Gộp {len(keys):,} entries vào blob dùng chung...")
+            done = 0
+
+            def _run(key):
+                try:
+                    return reclaim_key(store, key)
+                except Exception as e:
+                    print(f"  ⚠️  {key}: {e}")
+                    return False
+
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                done = sum(pool.map(_run, keys))
+            print(f"✅ Đã gộp: {done:,}/{len(keys):,} entries")
+
+    if args.gc and not pack:
+        removed, freed = gc(args.cache_dir, store.index)
+        print(f"🧹 GC: xoá {removed:,} blob không còn dùng ({freed / mb:.1f} MB)")
+
+    if store.index is not None:
+        blobs, refs, stored, logical = store.index.blob_stats()
+        print(f"\n📊 Index: {blobs:,} blob cho {refs:,} entries - "
+              f"{logical / mb:.1f} MB logic, {stored / mb:.1f} MB thực tế "
+              f"(đã tiết kiệm {(logical - stored) / mb:.1f} MB)")
+    print(f"⏱️  {time.time() - start:.1f}s")
+
+    if pack and (args.reclaim or args.gc):
+        print("⚠️  CACHE_BACKEND=pack: report only, --reclaim / --gc không được thực hiện")
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Chuyển cache từ layout phẳng cũ (cache/<key>.bin + .json) sang layout sharded
+(cache/ab/cd/<key>.bin + .json) - chạy được ONLINE trong lúc proxy vẫn phục vụ.
+
+Thứ tự thao tác cho mỗi entry: hard-link biến thể nén .gz/.br/.zst, .json (nếu có) rồi .bin
+sang shard mới, rồi mới xoá các file phẳng. Link không ghi đè: file shard đã có (proxy vừa ghi
+bản mới) thì giữ nguyên, coi như đã migrate. Ở mọi thời điểm luôn còn ít nhất 1 bản đầy đủ,
+nên cache_store không bao giờ trả về miss giả.
+"""
+
+import os
+import sys
+import time
+import shutil
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import cache_store
+
+def _link_no_clobber(src: str, dst: str) -> bool:
+    """
+    Hard-link src -> dst, KHÔNG ghi đè: dst đã có (proxy vừa ghi bản mới / worker khác đã chuyển)
+    thì giữ nguyên. Fallback copy ra file tạm cạnh dst rồi link nếu không link thẳng được.
+    Returns: True nếu đã tạo dst, False nếu dst đã có sẵn
+    """
+    try:
+        os.link(src, dst)
+        return True
+    except FileExistsError:
+        return False
+    except OSError:
+        pass
+    tmp = f"{dst}.migrating{os.getpid()}.{threading.get_ident()}"
+    shutil.copy2(src, tmp)
+    try:
+        os.link(tmp, dst)
+        return True
+    except FileExistsError:
+        return False
+    except OSError:
+        # Filesystem không hỗ trợ hard link: chỉ còn os.replace (atomic nhưng có thể đè)
+        if os.path.exists(dst):
+            return False
+        os.replace(tmp, dst)
+        return True
+    finally:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+
+def _unlink_all(paths):
+    for p in paths:
+        try:
+            os.unlink(p)
+        except FileNotFoundError:
+            pass
+
+def migrate_key(key: str, cache_dir: str, dry_run: bool = False) -> str:
+    """
+    Chuyển 1 key (.bin, .json và các biến thể nén .gz/.br/.zst) sang layout sharded.
+    Returns: 'moved' | 'dropped' (shard đã có bản mới hơn) | 'skipped' (không còn .bin)
+    """
+    flat_bin, flat_meta = cache_store.flat_paths(key, cache_dir)
+    if not os.path.exists(flat_bin):
+        return "skipped"
+    shard_bin, shard_meta = cache_store.sharded_paths(key, cache_dir)
+    # Biến thể trước, .json rồi mới tới .bin: shard chỉ được coi là có entry khi .bin xuất hiện
+    pairs = [(flat_bin[:-4] + ext, shard_bin[:-4] + ext) for ext in cache_store.VARIANT_EXT.values()]
+    # Entry ghi sau khi có SQLite index không có sidecar .json
+    pairs.append((flat_meta, shard_meta))
+    flat_files = [src for src, _ in pairs] + [flat_bin]
+
+    # Proxy đã ghi entry mới vào shard -> bản phẳng là bản cũ, chỉ cần xoá
+    if os.path.exists(shard_bin):
+        if not dry_run:
+            _unlink_all(flat_files)
+        return "dropped"
+
+    if dry_run:
+        return "moved"
+
+    os.makedirs(cache_store.shard_dir(key, cache_dir), exist_ok=True)
+    for src, dst in pairs:
+        if os.path.exists(src):
+            _link_no_clobber(src, dst)
+    # .bin đã có (proxy ghi entry mới giữa chừng / worker khác đã chuyển) = đã migrate
+    moved = _link_no_clobber(flat_bin, shard_bin)
+    _unlink_all(flat_files)
+    return "moved" if moved else "dropped"
+
+def _batches(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Migrate cache phẳng sang layout sharded ab/cd/<key> (chạy được khi proxy đang chạy)"
+    )
+    ap.add_argument("--cache-dir", type=str, default=cache_store.CACHE_DIR,
+                    help=f"Thư mục cache (mặc định: {cache_store.CACHE_DIR})")
+    ap.add_argument("--workers", type=int, default=16,
+                    help="Số thread chạy song song (mặc định: 16)")
+    ap.add_argument("--dry-run", action="store_true",
+                    help="Chỉ đếm, không di chuyển file")
+    args = ap.parse_args()
+
+    if not os.path.isdir(args.cache_dir):
+        print(f"❌ Không tìm thấy thư mục cache: {args.cache_dir}")
+        sys.exit(1)
+
+    print(f"🚚 Migrate {args.cache_dir} -> layout sharded ({args.workers} workers)"
+          f"{' [DRY-RUN]' if args.dry_run else ''}")
+    start = time.time()
+    counts = {"moved": 0, "dropped": 0, "skipped": 0, "error": 0}
+
+    def _run(key):
+        try:
+            return migrate_key(key, args.cache_dir, args.dry_run)
+        except Exception as e:
+            print(f"  ⚠️  {key}: {e}")
+            return "error"
+
+    done = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        # Xử lý theo lô để không giữ toàn bộ danh sách key (hàng triệu) trong bộ nhớ
+        for batch in _batches(cache_store.iter_flat_keys(args.cache_dir), 4096):
+            for result in pool.map(_run, batch):
+                counts[result] += 1
+            done += len(batch)
+            rate = done / max(time.time() - start, 1e-6)
+            print(f"   Đã xử lý: {done:,} entries (~{rate:,.0f}/s)")
+
+    elapsed = time.time() - start
+    print(f"\n{'='*60}")
+    print(f"✅ Hoàn thành migrate trong {elapsed:.1f}s")
+    print(f"   - Đã chuyển: {counts['moved']:,}")
+    print(f"   - Bỏ bản phẳng cũ (shard đã có): {counts['dropped']:,}")
+    print(f"   - Bỏ qua (đã bị chuyển/xoá): {counts['skipped']:,}")
+    print(f"   - Lỗi: {counts['error']:,}")
+    print(f"{'='*60}")
+
+if __name__ == "__main__":
+    main()
@@ -8,14 +8,15 @@ import time
 import re
 from datetime import datetime, timedelta
 from collections import defaultdict
+import cache_store
 
 LOG_FILE = "cache_important_auto.log"
 CACHE_DIR = "cache"
 
 def count_cache_files():
-    """Đếm số file cache"""
+    """Số entry cache - đọc bộ đếm trong index, không duyệt thư mục mỗi 10s"""
     try:
-        return len([f for f in os.listdir(CACHE_DIR) if f.endswith(".bin")])
+        return cache_store.count_entries(CACHE_DIR)
     except Exception:
         return 0
 
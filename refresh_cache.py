@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Làm mới cache hàng loạt bằng request có điều kiện tới origin.
+
+- Mỗi entry gửi If-None-Match / If-Modified-Since từ ETag / Last-Modified đã lưu.
+- 304 Not Modified: chỉ cập nhật metadata (fetched_at, validator mới) - không tải / ghi lại body.
+- 200 (hoặc entry không có validator): body mới stream qua cache_store.CacheWriter (không giữ cả body
+  trong RAM) rồi commit atomic thay entry cũ; lỗi mạng / 4xx / 5xx / body thiếu byte: giữ entry cũ.
+
+Chạy được khi proxy đang chạy (ghi atomic như proxy). Proxy đang chạy có thể còn giữ body cũ
+trong LRU RAM tới khi entry bị đẩy ra.
+
+    python refresh_cache.py --older-than 86400 --content-type html
+"""
+
+import time
+import asyncio
+import argparse
+
+import httpx
+import cache_store
+
+UA = "CacheRefresher/1.0 (+respectful; conditional-get)"
+STREAM_CHUNK_BYTES = 64 * 1024
+
+def _candidates(cache_dir: str, older_than: float, content_type: str, limit: int):
+    """[(key, url)] các entry cần làm mới, cũ nhất trước"""
+    store = cache_store.get_store(cache_dir)
+    cutoff = time.time() - older_than if older_than else None
+    out = []
+    if store.index is not None and store.index.complete:
+        for key, url, _, _ in store.index.iter_entries(cutoff, content_type):
+            if url:
+                out.append((key, url))
+            if limit and len(out) >= limit:
+                break
+        return out
+    # Chưa có index đầy đủ: quét metadata từng entry
+    rows = []
+    for key in store.iter_keys():
+        meta = store.load_meta(key)
+        if not meta or not meta.get("url"):
+            continue
+        fetched_at = meta.get("fetched_at") or 0
+        if cutoff is not None and fetched_at >= cutoff:
+            continue
+        ct = cache_store._header(meta.get("headers"), "Content-Type", "")
+        if content_type and content_type.lower() not in ct.lower():
+            continue
+        rows.append((fetched_at, key, meta["url"]))
+    rows.sort()
+    out = [(key, url) for _, key, url in rows]
+    return out[:limit] if limit else out
+
+async def _stream_to_cache(resp: httpx.Response, key: str, url: str, cache_dir: str):
+    """
+    Stream body mới vào CacheWriter (ghi từng chunk ngoài event loop) rồi commit atomic như tee của proxy.
+    Returns: số byte đã lưu, None nếu body thiếu byte so với Content-Length (entry cũ giữ nguyên)
+    """
+    headers = cache_store.headers_from_raw(resp.headers.raw)
+    new_meta = {"url": url, "status": resp.status_code, "headers": headers}
+    length = headers.get("Content-Length", "")
+    # Content-Length của bản nén không so được với số byte identity đã giải nén
+    encoded = headers.get("Content-Encoding", "identity").lower() != "identity"
+    expected = int(length) if length.isdigit() and not encoded else None
+    writer = await asyncio.to_thread(cache_store.CacheWriter, key, cache_dir)
+    try:
+        # httpx giải nén gzip/br khi stream (cache lưu identity)
+        async for chunk in resp.aiter_bytes(STREAM_CHUNK_BYTES):
+            await asyncio.to_thread(writer.write, chunk)
+    except BaseException:
+        await asyncio.to_thread(writer.abort)
+        raise
+    if not await asyncio.to_thread(writer.commit, new_meta, expected):
+        return None
+    return writer.size
+
+async def refresh_one(client: httpx.AsyncClient, key: str, url: str, cache_dir: str, stats: dict, verbose: bool):
+    meta = await asyncio.to_thread(cache_store.load_meta, key, cache_dir)
+    if meta is None:
+        return
+    conditional = cache_store.revalidation_headers(meta)
+    if not conditional:
+        stats["no_validator"] += 1
+    try:
+        async with client.stream("GET", url, headers=conditional) as resp:
+            status = resp.status_code
+            # 304 / lỗi: không đọc body (đóng stream bỏ phần còn lại)
+            saved = None
+            if status != 304 and not cache_store.is_error_status(status):
+                saved = await _stream_to_cache(resp, key, url, cache_dir)
+            response_headers = cache_store.headers_from_raw(resp.headers.raw)
+    except httpx.HTTPError as e:
+        stats["failed"] += 1
+        if verbose:
+            print(f"❌ {url}: {e.__class__.__name__}")
+        return
+    stats["requests"] += 1
+    # Byte thực trên đường truyền (bản nén nếu origin gửi gzip/br)
+    stats["bytes_downloaded"] += resp.num_bytes_downloaded
+    stats["bytes_cached"] += meta.get("size") or 0
+
+    if status == 304:
+        if await asyncio.to_thread(cache_store.touch_entry, key, meta, response_headers, cache_dir):
+            stats["not_modified"] += 1
+        if verbose:
+            print(f"✅ 304 {url}")
+    elif cache_store.is_error_status(status):
+        stats["failed"] += 1
+        if verbose:
+            print(f"⚠️  {status} {url} (giữ entry cũ)")
+    elif saved is None:
+        stats["failed"] += 1
+        if verbose:
+            print(f"⚠️  {status} {url}: body thiếu byte (giữ entry cũ)")
+    else:
+        stats["updated"] += 1
+        if verbose:
+            print(f"🔄 {status} {url} ({saved:,} bytes)")
+
+async def run(args):
+    print(f"📥 Chọn entry từ {args.cache_dir}...")
+    items = await asyncio.to_thread(_candidates, args.cache_dir, args.older_than, args.content_type, args.limit)
+    print(f"   {len(items):,} entry cần làm mới")
+    if not items:
+        return
+
+    stats = dict.fromkeys(
+        ("requests", "not_modified", "updated", "failed", "no_validator", "bytes_downloaded", "bytes_cached"), 0
+    )
+    queue = asyncio.Queue()
+    for item in items:
+        queue.put_nowait(item)
+
+    async def worker(client):
+        while not queue.empty():
+            key, url = queue.get_nowait()
+            await refresh_one(client, key, url, args.cache_dir, stats, args.verbose)
+            if args.delay:
+                await asyncio.sleep(args.delay)
+
+    start = time.time()
+    # httpx tự giải nén gzip/br; cache lưu body identity như proxy
+    accept_encoding = "gzip, deflate, br" if cache_store.brotli is not None else "gzip, deflate"
+    async with httpx.AsyncClient(
+        headers={"User-Agent": UA, "Accept-Encoding": accept_encoding},
+        timeout=httpx.Timeout(30.0),
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=args.concurrency),
+    ) as client:
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+    elapsed = time.time() - start
+
+    print(f"\n{'='*60}")
+    print(f"✅ 304 Not Modified:  {stats['not_modified']:,} (chỉ cập nhật metadata)")
+    print(f"🔄 Body mới:          {stats['updated']:,}")
+    print(f"❌ Lỗi (giữ entry):   {stats['failed']:,}")
+    print(f"ℹ️  Không có validator: {stats['no_validator']:,} (tải lại cả body)")
+    print(f"📦 Tải về (trên đường truyền): {stats['bytes_downloaded'] / 1024 / 1024:.1f} MB "
+          f"/ {stats['bytes_cached'] / 1024 / 1024:.1f} MB nếu tải lại tất cả")
+    print(f"⏱️  {elapsed:.1f}s, {stats['requests'] / max(elapsed, 1e-9):.1f} request/s")
+    print(f"{'='*60}")
+
+def main():
+    ap = argparse.ArgumentParser(description="Làm mới cache bằng GET có điều kiện (ETag / Last-Modified) tới origin")
+    ap.add_argument("--cache-dir", type=str, default=cache_store.CACHE_DIR,
+                    help=f"Thư mục cache (mặc định: {cache_store.CACHE_DIR})")
+    ap.add_argument("--older-than", type=float, default=0,
+                    help="Chỉ làm mới entry đã lưu quá ngần này giây (mặc định: 0 = tất cả)")
+    ap.add_argument("--content-type", type=str, default=None,
+                    help="Chỉ entry có Content-Type chứa chuỗi này (vd: html, javascript)")
+    ap.add_argument("--limit", type=int, default=0,
+                    help="Số entry tối đa (mặc định: 0 = không giới hạn)")
+    ap.add_argument("--concurrency", type=int, default=4,
+                    help="Số request song song tới origin (mặc định: 4)")
+    ap.add_argument("--delay", type=float, default=0.2,
+                    help="Nghỉ giữa các request của mỗi worker, giây (mặc định: 0.2)")
+    ap.add_argument("--verbose", action="store_true",
+                    help="In kết quả từng URL")
+    args = ap.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -88,6 +88,7 @@ nohup python3 auto_crawl_proxy.py \
   --delay 0.3 \
   --max-retries 10 \
   --auto-pagination \
+  --fresh \
   > cache_important_full.log 2>&1 &
 
 CRAWLER_PID=$!
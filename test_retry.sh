@@ -33,6 +33,7 @@ conda run -n crawl python auto_crawl_proxy.py \
   --extra-urls "https://kiagds.ru/?mode=ETM&marke=KM&year=2026&model=9193&mkb=447__29696&docId=435571&page=13" \
   --follow-depth 0 \
   --max-retries 3 \
+  --fresh \
   --verbose
 
 echo ""
@@ -43,16 +44,13 @@ echo ""
 
 # Kiểm tra page 13 đã được cache chưa
 python3 -c "
-import hashlib, os, json
+import cache_store
 url = 'https://kiagds.ru/?mode=ETM&marke=KM&year=2026&model=9193&mkb=447__29696&docId=435571&page=13'
-key = hashlib.sha256(f'GET {url}'.encode('utf-8')).hexdigest()
-bin_path = f'cache/{key}.bin'
-meta_path = f'cache/{key}.json'
+cached = cache_store.load_entry(cache_store.cache_key('GET', url), 'cache')
 
-if os.path.exists(bin_path) and os.path.exists(meta_path):
+if cached:
+    body, meta = cached
     print('✅ Page 13 is NOW cached!')
-    with open(meta_path, 'r') as f:
-        meta = json.load(f)
     print(f'   Status: {meta.get(\"status\")}')
     print(f'   URL: {meta.get(\"url\")}')
 else:
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Các module của repo là script phẳng ở thư mục gốc; CACHE_DIR tạm để import không đụng cache/ thật
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("CACHE_DIR", tempfile.mkdtemp(prefix="test_cache_"))
@@ -0,0 +1,167 @@
+"""Proxy app.py phục vụ entry có sẵn trong cache (không gọi origin thật): LRU, ETag / 304, Range, negative cache, refresh nền"""
+
+import time
+import uuid
+
+import pytest
+
+import app as proxy
+import cache_store
+
+HTML = b'<html><a href="https://kiagds.ru/next">next</a></html>'
+PDF = bytes(range(256)) * 8
+
+@pytest.fixture
+def client(monkeypatch):
+    # Không bao giờ gọi origin thật: miss trả 404 offline, refresh nền đi qua _open_origin giả
+    monkeypatch.setattr(proxy, "LIVE_FALLBACK", False)
+    return proxy.app.test_client()
+
+def _path():
+    return f"/test-{uuid.uuid4().hex}"
+
+def _save(path, body, content_type, fetched_at=None, extra_headers=None):
+    target = proxy._target_url(path, "")
+    key = proxy._cache_key("GET", target)
+    headers = {"Content-Type": content_type, **(extra_headers or {})}
+    cache_store.save_entry(key, body, {"url": target, "status": 200, "headers": headers},
+                           proxy.CACHE_DIR, fetched_at)
+    return key
+
+def test_html_hit_rewritten_with_etag_and_304(client):
+    path = _path()
+    _save(path, HTML, "text/html; charset=utf-8")
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.data == HTML.replace(b"https://kiagds.ru", proxy.LOCAL_BASE.encode())
+    etag = response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+
+    # Lần 2 (có thể từ LRU trong RAM) vẫn cùng validator
+    assert client.get(path).headers["ETag"] == etag
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert client.get(path, headers={"If-None-Match": '"other"'}).status_code == 200
+
+def test_binary_hit_etag_and_range(client):
+    path = _path()
+    _save(path, PDF, "application/pdf")
+    response = client.get(path)
+    assert response.status_code == 200
+    assert response.data == PDF
+    etag = response.headers["ETag"]
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    response = client.get(path, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.data == PDF[10:20]
+    assert response.headers["Content-Range"] == f"bytes 10-19/{len(PDF)}"
+    response = client.get(path, headers={"Range": "bytes=10-19", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.data == PDF
+    assert client.get(path, headers={"Range": f"bytes={len(PDF)}-"}).status_code == 416
+
+def test_miss_offline_and_negative_cache(client):
+    path = _path()
+    assert client.get(path).status_code == 404
+    target = proxy._target_url(path, "")
+    cache_store.remember_failure(proxy._cache_key("GET", target), target, 410,
+                                 {"Content-Type": "text/plain"}, b"gone", cache_dir=proxy.CACHE_DIR)
+    response = client.get(path)
+    assert response.status_code == 410
+    assert response.data == b"gone"
+
+def test_lru_drops_entry_replaced_by_another_process(client):
+    path = _path()
+    key = _save(path, HTML, "text/html; charset=utf-8")
+    assert b"next" in client.get(path).data
+    # Ghi thẳng qua cache_store (như 1 worker khác), không qua _save_cache của process này
+    _save(path, HTML.replace(b"next", b"changed"), "text/html; charset=utf-8")
+    assert b"changed" in client.get(path).data
+    assert proxy.response_cache.get(key) is not None
+
+class FakeOrigin:
+    """Response của requests (stream=True) đủ dùng cho _refresh_entry"""
+
+    def __init__(self, status, headers, body=b""):
+        self.status_code = status
+        self.headers = headers
+        self._body = body
+        self.requests = []
+
+    def __call__(self, target, headers=None):
+        self.requests.append((target, headers))
+        return self
+
+    def iter_content(self, size):
+        for i in range(0, len(self._body), size):
+            yield self._body[i:i + size]
+
+    def close(self):
+        pass
+
+class InlineExecutor:
+    """Chạy refresh ngay lúc submit: refresh lên lịch trước khi body cũ được đọc thì request thấy body mới"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+def _refreshed(before: dict) -> dict:
+    return {k: proxy.refresh_stats[k] - before[k] for k in ("refreshed", "not_modified", "failed")}
+
+@pytest.fixture
+def stale_client(client, monkeypatch):
+    monkeypatch.setattr(proxy, "LIVE_FALLBACK", True)
+    monkeypatch.setattr(proxy, "_freshness_rules", [])
+    monkeypatch.setattr(proxy, "_freshness_default", 60)
+    monkeypatch.setattr(proxy, "_refresher", InlineExecutor())
+    return client
+
+@pytest.mark.parametrize("old, content_type, marker", [
+    (HTML, "text/html; charset=utf-8", b"next"),
+    (PDF, "application/pdf", PDF[:16]),
+], ids=["html", "pdf"])
+def test_stale_entry_served_then_refreshed(stale_client, monkeypatch, old, content_type, marker):
+    path = _path()
+    key = _save(path, old, content_type, fetched_at=time.time() - 3600, extra_headers={"ETag": '"v1"'})
+    new_body = b"fresh" * 10
+    origin = FakeOrigin(200, {"Content-Type": content_type, "Content-Length": str(len(new_body))}, new_body)
+    monkeypatch.setattr(proxy, "_open_origin", origin)
+
+    before = dict(proxy.refresh_stats)
+    # Entry cũ vẫn được trả (refresh đã chạy xong trong lúc xử lý request), refresh gửi If-None-Match của origin
+    assert marker in stale_client.get(path).data
+    assert _refreshed(before) == {"refreshed": 1, "not_modified": 0, "failed": 0}
+    assert origin.requests == [(proxy._target_url(path, ""), {"If-None-Match": '"v1"'})]
+    assert cache_store.load_entry(key, proxy.CACHE_DIR)[0] == new_body
+    assert b"fresh" in stale_client.get(path).data
+
+def test_stale_entry_not_modified_only_touches_meta(stale_client, monkeypatch):
+    path = _path()
+    old = time.time() - 3600
+    key = _save(path, PDF, "application/pdf", fetched_at=old, extra_headers={"ETag": '"v1"'})
+    monkeypatch.setattr(proxy, "_open_origin", FakeOrigin(304, {"ETag": '"v2"'}))
+
+    before = dict(proxy.refresh_stats)
+    assert stale_client.get(path).data == PDF
+    assert _refreshed(before) == {"refreshed": 0, "not_modified": 1, "failed": 0}
+    meta = cache_store.load_meta(key, proxy.CACHE_DIR)
+    assert meta["fetched_at"] > old
+    assert meta["headers"]["ETag"] == '"v2"'
+    assert cache_store.load_entry(key, proxy.CACHE_DIR)[0] == PDF
+
+def test_failed_refresh_keeps_entry(stale_client, monkeypatch):
+    path = _path()
+    key = _save(path, PDF, "application/pdf", fetched_at=time.time() - 3600)
+    monkeypatch.setattr(proxy, "_open_origin", FakeOrigin(503, {"Content-Type": "text/plain"}, b"busy"))
+
+    before = dict(proxy.refresh_stats)
+    assert stale_client.get(path).data == PDF
+    assert _refreshed(before) == {"refreshed": 0, "not_modified": 0, "failed": 1}
+    assert cache_store.load_entry(key, proxy.CACHE_DIR)[0] == PDF
+    # Trong REFRESH_RETRY_SECONDS không lên lịch lại
+    scheduled = proxy.refresh_stats["scheduled"]
+    stale_client.get(path)
+    assert proxy.refresh_stats["scheduled"] == scheduled
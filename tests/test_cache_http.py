@@ -0,0 +1,116 @@
+"""cache_http: validator / 304 và Range (If-Range, multipart/byteranges, 416) trên body lưu trong cache"""
+
+import pytest
+from flask import Flask
+
+import cache_http
+import cache_store
+
+BODY = bytes(range(256)) * 40   # 10240 byte nhị phân
+LENGTH = len(BODY)
+VALIDATORS = {"ETag": '"abc"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"}
+
+app = Flask(__name__)
+
+def _ranges(range_header=None, length=LENGTH, **headers):
+    if range_header is not None:
+        headers["Range"] = range_header
+    with app.test_request_context(headers=headers):
+        return cache_http.requested_ranges(length, VALIDATORS)
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", [(0, 100)]),
+    ("bytes=100-", [(100, LENGTH)]),
+    ("bytes=-10", [(LENGTH - 10, LENGTH)]),
+    ("bytes=-99999", [(0, LENGTH)]),
+    ("bytes=0-99999", [(0, LENGTH)]),
+    ("bytes=0-9,20-29", [(0, 10), (20, 30)]),
+    ("bytes=99999-", []),
+    ("items=0-9", None),
+    ("garbage", None),
+])
+def test_requested_ranges(header, expected):
+    assert _ranges(header) == expected
+
+def test_requested_ranges_too_many():
+    many = ",".join(f"{i * 2}-{i * 2}" for i in range(cache_http.MAX_RANGES + 1))
+    assert _ranges("bytes=" + many) is None
+
+def test_requested_ranges_if_range():
+    assert _ranges("bytes=0-9", **{"If-Range": '"abc"'}) == [(0, 10)]
+    assert _ranges("bytes=0-9", **{"If-Range": '"other"'}) is None
+    assert _ranges("bytes=0-9", **{"If-Range": VALIDATORS["Last-Modified"]}) == [(0, 10)]
+    assert _ranges("bytes=0-9", **{"If-Range": "Thu, 02 Jan 2025 00:00:00 GMT"}) is None
+
+@pytest.fixture
+def body_file(tmp_path):
+    cache_dir = str(tmp_path)
+    key = cache_store.cache_key("GET", "https://kiagds.ru/file.pdf")
+    headers = {"Content-Type": "application/pdf", "Content-Length": "1"}
+    cache_store.save_entry(key, BODY, {"url": "https://kiagds.ru/file.pdf", "status": 200, "headers": headers},
+                           cache_dir)
+    opened = cache_store.open_body(key, cache_dir)
+    assert opened is not None
+    yield opened[0], opened[1]["headers"]
+    opened[0].close()
+
+def _file_response(body_file, headers, status=200, **request_headers):
+    with app.test_request_context(headers=request_headers):
+        response = cache_http.file_response(body_file, headers, status, VALIDATORS)
+        return response, b"".join(response.response)
+
+def test_file_response_full(body_file):
+    response, data = _file_response(*body_file)
+    assert response.status_code == 200
+    assert data == BODY
+    assert response.headers["Content-Length"] == str(LENGTH)
+    assert response.headers["Accept-Ranges"] == "bytes"
+    assert response.headers["ETag"] == VALIDATORS["ETag"]
+    assert response.headers["Content-Type"] == "application/pdf"
+
+def test_file_response_single_range(body_file):
+    response, data = _file_response(*body_file, Range="bytes=1000-1999")
+    assert response.status_code == 206
+    assert data == BODY[1000:2000]
+    assert response.headers["Content-Range"] == f"bytes 1000-1999/{LENGTH}"
+    assert response.headers["Content-Length"] == "1000"
+
+def test_file_response_multirange(body_file):
+    response, data = _file_response(*body_file, Range="bytes=0-9,-5")
+    assert response.status_code == 206
+    content_type = response.headers["Content-Type"]
+    assert content_type.startswith("multipart/byteranges; boundary=")
+    boundary = content_type.split("boundary=", 1)[1]
+    assert response.headers["Content-Length"] == str(len(data))
+    parts = data.split(f"--{boundary}".encode())
+    assert parts[-1] == b"--\r\n"
+    assert parts[1].endswith(b"Content-Range: bytes 0-9/%d\r\n\r\n" % LENGTH + BODY[:10] + b"\r\n")
+    assert parts[2].endswith(b"Content-Range: bytes %d-%d/%d\r\n\r\n" % (LENGTH - 5, LENGTH - 1, LENGTH)
+                             + BODY[-5:] + b"\r\n")
+
+def test_file_response_unsatisfiable(body_file):
+    response, data = _file_response(*body_file, Range=f"bytes={LENGTH}-")
+    assert response.status_code == 416
+    assert response.headers["Content-Range"] == f"bytes */{LENGTH}"
+    assert data == b""
+
+def test_file_response_ignores_range_on_error_status(body_file):
+    body, headers = body_file
+    response, data = _file_response(body, headers, 404, Range="bytes=0-9")
+    assert response.status_code == 404
+    assert data == BODY
+
+def test_validators_only():
+    headers = {"ETag": '"x"', "Content-Type": "text/html", "Cache-Control": "max-age=1", "Vary": "Accept-Encoding"}
+    assert cache_http.validators_only(headers) == {"ETag": '"x"', "Cache-Control": "max-age=1", "Vary": "Accept-Encoding"}
+
+def test_is_not_modified():
+    with app.test_request_context(headers={"If-None-Match": '"abc"'}):
+        assert cache_http.is_not_modified(VALIDATORS)
+    with app.test_request_context(headers={"If-None-Match": '"zzz"'}):
+        assert not cache_http.is_not_modified(VALIDATORS)
+    with app.test_request_context(headers={"If-Modified-Since": VALIDATORS["Last-Modified"]}):
+        assert cache_http.is_not_modified(VALIDATORS)
+    with app.test_request_context():
+        assert not cache_http.is_not_modified(VALIDATORS)
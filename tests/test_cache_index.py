@@ -0,0 +1,27 @@
+"""MetaIndex: index tạo mới trên thư mục cache trống là đầy đủ ngay; cache cũ phải chờ --rebuild"""
+
+import os
+
+import cache_index
+from cache_index import MetaIndex
+
+def test_fresh_install_is_complete(tmp_path):
+    os.makedirs(tmp_path / "tmp")
+    assert MetaIndex(str(tmp_path)).complete
+    # Mở lại (process khác / restart) vẫn đầy đủ
+    assert MetaIndex(str(tmp_path)).complete
+
+def test_existing_cache_not_complete(tmp_path):
+    (tmp_path / ("ab" * 32 + ".bin")).write_bytes(b"old entry")
+    index = MetaIndex(str(tmp_path))
+    assert not index.complete
+
+    # Index đã có sẵn không được coi là mới tạo dù thư mục chỉ còn nó
+    (tmp_path / ("ab" * 32 + ".bin")).unlink()
+    assert not MetaIndex(str(tmp_path)).complete
+
+def test_rebuild_marks_complete(tmp_path):
+    (tmp_path / "packs").mkdir()
+    assert not MetaIndex(str(tmp_path)).complete
+    cache_index.rebuild(str(tmp_path))
+    assert MetaIndex(str(tmp_path)).complete
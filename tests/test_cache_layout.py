@@ -0,0 +1,115 @@
+"""Layout sharded cache/ab/cd/<key>.* và migrate_cache_layout.py (phẳng -> sharded, không ghi đè)"""
+
+import os
+
+import pytest
+
+import cache_store
+import migrate_cache_layout
+
+URL = "https://kiagds.ru/?mode=ETM&docId=1&page=1"
+BODY = b"<html>" + b"<p>kiagds.ru</p>" * 200 + b"</html>"
+KEY = cache_store.cache_key("GET", URL)
+
+def _save(cache_dir, body=BODY):
+    cache_store.save_entry(KEY, body, {"url": URL, "status": 200, "headers": {"Content-Type": "text/html"}},
+                           cache_dir)
+
+def _key_files(directory):
+    return sorted(name for name in os.listdir(directory) if name.startswith(KEY))
+
+def _suffixes(directory):
+    return [name[len(KEY):] for name in _key_files(directory)]
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path)
+
+@pytest.fixture
+def flat_entry(cache_dir, monkeypatch):
+    """Entry ghi theo layout phẳng cũ: cache/<key>.bin + biến thể nén cạnh nó"""
+    monkeypatch.setattr(cache_store, "CACHE_LAYOUT", "flat")
+    _save(cache_dir)
+    monkeypatch.setattr(cache_store, "CACHE_LAYOUT", "sharded")
+    suffixes = _suffixes(cache_dir)
+    assert ".bin" in suffixes
+    return suffixes
+
+def test_sharded_paths(cache_dir):
+    shard = os.path.join(cache_dir, KEY[:2], KEY[2:4])
+    assert cache_store.shard_dir(KEY, cache_dir) == shard
+    assert cache_store.sharded_paths(KEY, cache_dir) == (os.path.join(shard, KEY + ".bin"),
+                                                         os.path.join(shard, KEY + ".json"))
+
+def test_save_writes_sharded(cache_dir):
+    _save(cache_dir)
+    shard = cache_store.shard_dir(KEY, cache_dir)
+    assert ".bin" in _suffixes(shard)
+    assert _key_files(cache_dir) == []
+    assert cache_store.load_entry(KEY, cache_dir)[0] == BODY
+    assert list(cache_store.iter_keys(cache_dir)) == [KEY]
+    assert list(cache_store.iter_flat_keys(cache_dir)) == []
+
+def test_flat_entry_still_readable(cache_dir, flat_entry):
+    assert list(cache_store.iter_flat_keys(cache_dir)) == [KEY]
+    assert cache_store.find_body_path(KEY, cache_dir) == cache_store.flat_paths(KEY, cache_dir)[0]
+    assert cache_store.load_entry(KEY, cache_dir)[0] == BODY
+
+def test_migrate_moves_body_and_variants(cache_dir, flat_entry):
+    variants = {e: cache_store.get_store(cache_dir).load_variant(KEY, e) for e in cache_store.VARIANT_EXT}
+
+    assert migrate_cache_layout.migrate_key(KEY, cache_dir) == "moved"
+    assert _key_files(cache_dir) == []
+    assert _suffixes(cache_store.shard_dir(KEY, cache_dir)) == flat_entry
+    assert cache_store.load_entry(KEY, cache_dir)[0] == BODY
+    for encoding, data in variants.items():
+        assert cache_store.get_store(cache_dir).load_variant(KEY, encoding) == data
+
+    assert migrate_cache_layout.migrate_key(KEY, cache_dir) == "skipped"
+
+def test_migrate_dry_run_leaves_files(cache_dir, flat_entry):
+    assert migrate_cache_layout.migrate_key(KEY, cache_dir, dry_run=True) == "moved"
+    assert _suffixes(cache_dir) == flat_entry
+    assert not os.path.exists(cache_store.shard_dir(KEY, cache_dir))
+
+def test_save_sharded_replaces_flat_entry(cache_dir, flat_entry):
+    _save(cache_dir, BODY.replace(b"<p>", b"<b>"))
+    assert _key_files(cache_dir) == []
+
+def test_migrate_drops_flat_when_shard_is_newer(cache_dir, monkeypatch):
+    _save(cache_dir, BODY.replace(b"<p>", b"<b>"))
+    shard_bin = cache_store.sharded_paths(KEY, cache_dir)[0]
+    with open(shard_bin, "rb") as f:
+        newer = f.read()
+    monkeypatch.setattr(cache_store, "CACHE_LAYOUT", "flat")
+    _save(cache_dir)
+
+    assert migrate_cache_layout.migrate_key(KEY, cache_dir) == "dropped"
+    assert _key_files(cache_dir) == []
+    with open(shard_bin, "rb") as f:
+        assert f.read() == newer
+
+def test_migrate_never_clobbers_shard_files(cache_dir, flat_entry):
+    # Proxy ghi biến thể mới vào shard sau khi migrate đã kiểm tra .bin (chưa kịp ghi .bin)
+    variant = next(s for s in flat_entry if s != ".bin")
+    shard = cache_store.shard_dir(KEY, cache_dir)
+    os.makedirs(shard)
+    with open(os.path.join(shard, KEY + variant), "wb") as f:
+        f.write(b"newer")
+
+    assert migrate_cache_layout.migrate_key(KEY, cache_dir) == "moved"
+    with open(os.path.join(shard, KEY + variant), "rb") as f:
+        assert f.read() == b"newer"
+    assert _key_files(cache_dir) == []
+
+def test_link_no_clobber(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.write_bytes(b"old")
+    assert migrate_cache_layout._link_no_clobber(str(src), str(dst))
+    assert dst.read_bytes() == b"old"
+
+    dst.unlink()
+    dst.write_bytes(b"new")
+    assert not migrate_cache_layout._link_no_clobber(str(src), str(dst))
+    assert dst.read_bytes() == b"new"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["dst", "src"]
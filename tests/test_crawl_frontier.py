@@ -0,0 +1,105 @@
+"""Frontier: add / done / checkpoint ghi xuống SQLite và --resume nạp lại đúng seen + hàng đợi"""
+
+import sqlite3
+
+import pytest
+
+import crawl_frontier
+from crawl_frontier import Frontier
+
+def _path(tmp_path):
+    return str(tmp_path / "frontier.sqlite3")
+
+def test_resume_round_trip(tmp_path):
+    path = _path(tmp_path)
+    frontier = Frontier(path)
+    for i in range(5):
+        frontier.add(f"https://kiagds.ru/p{i}", i % 2)
+    frontier.done("https://kiagds.ru/p0")
+    frontier.done("https://kiagds.ru/p3")
+    frontier.close()
+
+    frontier = Frontier(path, resume=True)
+    seen, pending = frontier.load()
+    assert seen == {f"https://kiagds.ru/p{i}" for i in range(5)}
+    # Thứ tự thêm vào được giữ nguyên, depth đi kèm
+    assert pending == [("https://kiagds.ru/p1", 1), ("https://kiagds.ru/p2", 0), ("https://kiagds.ru/p4", 0)]
+    assert frontier.pending() == 3
+    assert frontier.stats() == [(0, 3, 1), (1, 2, 1)]
+    frontier.close()
+
+def test_add_is_idempotent(tmp_path):
+    path = _path(tmp_path)
+    frontier = Frontier(path)
+    frontier.add("https://kiagds.ru/a", 0)
+    frontier.add("https://kiagds.ru/a", 3)
+    frontier.close()
+    frontier = Frontier(path, resume=True)
+    assert frontier.load() == ({"https://kiagds.ru/a"}, [("https://kiagds.ru/a", 0)])
+    frontier.close()
+
+def test_checkpoint_batches_until_forced(tmp_path, monkeypatch):
+    monkeypatch.setattr(crawl_frontier, "BATCH_SIZE", 3)
+    monkeypatch.setattr(crawl_frontier, "FLUSH_INTERVAL", 3600)
+    path = _path(tmp_path)
+    frontier = Frontier(path)
+    frontier.add("https://kiagds.ru/a", 0)
+    frontier.checkpoint()
+    assert frontier.pending() == 0  # chưa đủ batch: vẫn đệm trong RAM
+    frontier.add("https://kiagds.ru/b", 1)
+    frontier.done("https://kiagds.ru/a")
+    frontier.checkpoint()
+    frontier._writer.submit(lambda: None).result()  # chờ thread ghi xong
+    assert frontier.pending() == 1
+    frontier.close()
+
+def test_new_run_refuses_unfinished_frontier(tmp_path):
+    path = _path(tmp_path)
+    frontier = Frontier(path)
+    frontier.add("https://kiagds.ru/a", 0)
+    frontier.close()
+
+    with pytest.raises(FileExistsError):
+        Frontier(path)
+    # Từ chối thì không được đụng tới dữ liệu cũ
+    frontier = Frontier(path, resume=True)
+    assert frontier.pending() == 1
+    frontier.close()
+
+    frontier = Frontier(path, fresh=True)
+    assert frontier.load() == (set(), [])
+    frontier.close()
+
+def test_new_run_clears_finished_frontier(tmp_path):
+    path = _path(tmp_path)
+    frontier = Frontier(path)
+    frontier.add("https://kiagds.ru/a", 0)
+    frontier.done("https://kiagds.ru/a")
+    frontier.close()
+
+    frontier = Frontier(path)
+    assert frontier.load() == (set(), [])
+    frontier.close()
+
+def test_read_only_does_not_write(tmp_path):
+    path = _path(tmp_path)
+    frontier = Frontier(path)
+    frontier.add("https://kiagds.ru/a", 0)
+    frontier.close()
+
+    frontier = Frontier(path, read_only=True)
+    assert frontier.stats() == [(0, 1, 0)]
+    with pytest.raises(sqlite3.OperationalError):
+        frontier._write([("https://kiagds.ru/b", 1)], [])
+    frontier.close()
+
+def test_frontier_path_per_seed_set(monkeypatch):
+    monkeypatch.setattr(crawl_frontier, "FRONTIER_FILE", "")
+    first = crawl_frontier.frontier_path(json_file="/x/links.json", json_start_index=0, json_end_index=100)
+    assert first == crawl_frontier.frontier_path(json_end_index=100, json_start_index=0, json_file="/x/links.json")
+    assert first.startswith("crawl_frontier-") and first.endswith(".sqlite3")
+    # crawl_range.sh chạy song song: mỗi khoảng 1 file
+    assert first != crawl_frontier.frontier_path(json_file="/x/links.json", json_start_index=100, json_end_index=200)
+
+    monkeypatch.setattr(crawl_frontier, "FRONTIER_FILE", "fixed.sqlite3")
+    assert crawl_frontier.frontier_path(json_file="/x/links.json") == "fixed.sqlite3"
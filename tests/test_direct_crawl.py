@@ -0,0 +1,114 @@
+"""--direct: ghi cache giống proxy, entry có sẵn không gọi lại origin, lỗi kết nối chỉ nhớ sau lần thử cuối"""
+
+import asyncio
+import uuid
+
+import httpx
+import pytest
+
+import auto_crawl_proxy as crawler
+import cache_store
+
+PDF = bytes(range(256)) * 8
+
+def _url(suffix=""):
+    return f"{crawler.ORIGIN}/direct-{uuid.uuid4().hex}{suffix}"
+
+def _key(url):
+    return cache_store.cache_key("GET", crawler.proxy_target(url))
+
+class Origin:
+    """Origin giả cho httpx.MockTransport: đếm số lần bị gọi theo URL"""
+
+    def __init__(self):
+        self.hits = {}
+
+    def __call__(self, request):
+        url = str(request.url)
+        self.hits[url] = self.hits.get(url, 0) + 1
+        if url.endswith(".pdf"):
+            return httpx.Response(200, headers={"Content-Type": "application/pdf"}, content=PDF)
+        body = f'<html><a href="{crawler.ORIGIN}/next">next</a></html>'.encode()
+        return httpx.Response(200, headers={"Content-Type": "text/html; charset=utf-8"}, content=body)
+
+def _fetch(url, origin):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(origin)) as client:
+            return await crawler.fetch_direct(client, url)
+    return asyncio.run(run())
+
+def test_fetch_direct_writes_entry_like_proxy():
+    origin = Origin()
+    html_url, pdf_url = _url(), _url(".pdf")
+    r = _fetch(html_url, origin)
+    assert r.status_code == 200
+    assert b"/next" in r.content
+    assert cache_store.load_entry(_key(html_url), crawler.CACHE_DIR)[0] == r.content
+
+    # Nhị phân đi thẳng xuống cache, không giữ trong RAM cho crawler
+    r = _fetch(pdf_url, origin)
+    assert r.content == b""
+    assert cache_store.load_entry(_key(pdf_url), crawler.CACHE_DIR)[0] == PDF
+
+def test_load_direct_uses_cached_entry():
+    origin = Origin()
+    html_url, pdf_url = _url(), _url(".pdf")
+    assert crawler.load_direct(html_url) is None
+    html = _fetch(html_url, origin).content
+    _fetch(pdf_url, origin)
+
+    r = crawler.load_direct(html_url)
+    assert r.status_code == 200
+    assert r.headers["Content-Type"] == "text/html; charset=utf-8"
+    assert r.content == html
+    r = crawler.load_direct(pdf_url)
+    assert r.status_code == 200
+    assert r.content == b""
+    assert origin.hits == {html_url: 1, pdf_url: 1}
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    async def sleep(_):
+        return None
+    monkeypatch.setattr(crawler.asyncio, "sleep", sleep)
+
+def test_connection_error_remembered_once_after_last_retry(no_sleep, monkeypatch):
+    calls = []
+    remember = cache_store.remember_failure
+    monkeypatch.setattr(cache_store, "remember_failure", lambda *a, **kw: calls.append(a) or remember(*a, **kw))
+
+    def refuse(request):
+        raise httpx.ConnectError("refused", request=request)
+
+    url = _url()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(refuse)) as client:
+            await crawler.fetch_via_proxy_with_retry(client, url, "", max_retries=3, direct=True)
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(run())
+    assert len(calls) == 1
+    failure = cache_store.load_failure(_key(url), crawler.CACHE_DIR)
+    assert failure["status"] == 0
+    assert failure["error"] == "ConnectError"
+
+def test_transient_error_not_remembered(no_sleep):
+    attempts = []
+
+    def flaky(request):
+        attempts.append(request)
+        if len(attempts) == 1:
+            raise httpx.ReadTimeout("slow", request=request)
+        return httpx.Response(200, headers={"Content-Type": "text/plain"}, content=b"ok")
+
+    url = _url()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(flaky)) as client:
+            return await crawler.fetch_via_proxy_with_retry(client, url, "", max_retries=3, direct=True)
+
+    assert asyncio.run(run()).status_code == 200
+    assert len(attempts) == 2
+    assert cache_store.load_failure(_key(url), crawler.CACHE_DIR) is None
+    assert cache_store.load_entry(_key(url), crawler.CACHE_DIR)[0] == b"ok"
@@ -0,0 +1,64 @@
+"""
+extract_page / extract_page_fast phải cho kết quả giống hệt 3 hàm extract cũ trên corpus HTML mẫu.
+
+extract_page được so với 3 hàm cũ chạy cùng parser (html.parser, lxml nếu đã cài). extract_page_fast
+mô phỏng html.parser nên luôn so với html.parser - kể cả CDATA (cdata.html): nội dung là text, thẻ bên
+trong không phải link; CDATA không có "]]>" đóng thì bị coi như khai báo <!...> tới ">" đầu tiên.
+"""
+
+import os
+
+import pytest
+from bs4 import BeautifulSoup
+
+import auto_crawl_proxy as crawler
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "extract")
+PAGES = sorted(name for name in os.listdir(FIXTURES) if name.endswith(".html"))
+BASE_URL = "https://kiagds.ru/?mode=ETM&marke=KM"
+
+def _read(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+def _legacy(url, html):
+    max_page, pagination_type = crawler.extract_pagination_info(url, html)
+    return crawler.PageInfo(
+        crawler.extract_links(url, html), crawler.extract_docids_from_html(url, html), max_page, pagination_type
+    )
+
+@pytest.fixture(params=crawler.HTML_PARSERS)
+def parser(request, monkeypatch):
+    """Parser của extract_page; 3 hàm cũ (cố định html.parser) cũng chạy bằng parser này để so"""
+    if request.param != "html.parser":
+        pytest.importorskip(request.param)
+    monkeypatch.setattr(crawler, "BeautifulSoup", lambda markup, _: BeautifulSoup(markup, request.param))
+    return request.param
+
+@pytest.mark.parametrize("name", PAGES)
+def test_extract_page_matches_legacy(name, parser):
+    html = _read(name)
+    assert crawler.extract_page(BASE_URL, html, parser) == _legacy(BASE_URL, html)
+
+@pytest.mark.parametrize("name", PAGES)
+def test_extract_page_fast_matches_legacy(name):
+    html = _read(name)
+    assert crawler.extract_page_fast(BASE_URL, html) == _legacy(BASE_URL, html)
+
+def test_corpus_exercises_extraction():
+    # Corpus phải thực sự có links / docIds / pagination, không so 2 kết quả rỗng
+    results = [_legacy(BASE_URL, _read(name)) for name in PAGES]
+    assert all(r.links for r in results)
+    assert any(r.docids for r in results)
+    assert {r.pagination_type for r in results} >= {"page_of", "numbered", None}
+
+def test_entities_and_comments():
+    page = crawler.extract_page_fast(BASE_URL, _read("entities.html"))
+    assert {"1001", "1002", "1003"} <= page.docids
+    page = crawler.extract_page_fast(BASE_URL, _read("comments.html"))
+    assert not any("commented-out" in link or "old.js" in link for link in page.links)
+
+def test_cdata_is_text():
+    page = crawler.extract_page_fast(BASE_URL, _read("cdata.html"))
+    assert not any("cdata-link" in link for link in page.links)
+    assert (page.max_page, page.pagination_type) == (3, "numbered")
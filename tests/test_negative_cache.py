@@ -0,0 +1,61 @@
+"""Negative cache: TTL theo loại lỗi, hết hạn thì bỏ, không bao giờ đè entry tốt"""
+
+import time
+
+import pytest
+
+import cache_store
+
+URL = "https://kiagds.ru/missing"
+KEY = cache_store.cache_key("GET", URL)
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return str(tmp_path)
+
+@pytest.mark.parametrize("status, ttl_name", [
+    (404, "NEGATIVE_TTL"),
+    (410, "NEGATIVE_TTL"),
+    (500, "NEGATIVE_TTL_5XX"),
+    (503, "NEGATIVE_TTL_5XX"),
+    (0, "NEGATIVE_TTL_5XX"),
+])
+def test_ttl_by_status(cache_dir, status, ttl_name):
+    assert cache_store.remember_failure(KEY, URL, status, error="ConnectError" if not status else None,
+                                        cache_dir=cache_dir)
+    failure = cache_store.load_failure(KEY, cache_dir)
+    assert failure["status"] == status
+    assert failure["expires_at"] - failure["failed_at"] == pytest.approx(getattr(cache_store, ttl_name))
+    assert cache_store.is_known_bad(URL, cache_dir=cache_dir)
+
+def test_failure_keeps_headers_and_body(cache_dir):
+    headers = {"Content-Type": "text/html; charset=utf-8"}
+    cache_store.remember_failure(KEY, URL, 404, headers, b"<h1>Not found</h1>", cache_dir=cache_dir)
+    failure = cache_store.load_failure(KEY, cache_dir)
+    assert failure["headers"] == headers
+    assert failure["body"] == b"<h1>Not found</h1>"
+
+def test_zero_ttl_disables(cache_dir, monkeypatch):
+    monkeypatch.setattr(cache_store, "NEGATIVE_TTL", 0)
+    assert not cache_store.remember_failure(KEY, URL, 404, cache_dir=cache_dir)
+    assert cache_store.load_failure(KEY, cache_dir) is None
+
+def test_expired_failure_is_ignored(cache_dir):
+    index = cache_store.get_store(cache_dir).index
+    index.put_failure(KEY, URL, 404, ttl=-1)
+    assert cache_store.load_failure(KEY, cache_dir) is None
+    assert not cache_store.is_known_bad(URL, cache_dir=cache_dir)
+    assert index.purge_failures() == 1
+
+def test_failure_never_overrides_entry(cache_dir):
+    meta = {"url": URL, "status": 200, "headers": {"Content-Type": "text/plain"}}
+    cache_store.save_entry(KEY, b"ok", meta, cache_dir)
+    assert not cache_store.remember_failure(KEY, URL, 500, cache_dir=cache_dir)
+    assert cache_store.load_failure(KEY, cache_dir) is None
+
+def test_entry_replaces_failure(cache_dir):
+    cache_store.remember_failure(KEY, URL, 503, cache_dir=cache_dir)
+    meta = {"url": URL, "status": 200, "headers": {"Content-Type": "text/plain"}}
+    cache_store.save_entry(KEY, b"ok", meta, cache_dir, fetched_at=time.time())
+    assert cache_store.load_failure(KEY, cache_dir) is None
+    assert cache_store.load_entry(KEY, cache_dir)[0] == b"ok"
@@ -0,0 +1,35 @@
+"""Backend pack: key bị process khác ghi lại phải được đọc theo offset mới, không phải offset đã nạp"""
+
+import hashlib
+
+import cache_store
+
+KEY = cache_store.cache_key("GET", "https://kiagds.ru/style.css")
+
+def _meta(body):
+    return {"url": "https://kiagds.ru/style.css", "status": 200, "headers": {"Content-Type": "text/css"},
+            "body_sha256": hashlib.sha256(body).hexdigest()}
+
+def test_hit_sees_rewrite_from_other_process(tmp_path, monkeypatch):
+    # 2 PackStore trên cùng thư mục = proxy và crawler ở 2 process
+    writer = cache_store.PackStore(str(tmp_path))
+    reader = cache_store.PackStore(str(tmp_path))
+    writer.save(KEY, b"old body", _meta(b"old body"))
+    assert reader.load(KEY)[0] == b"old body"
+
+    writer.save(KEY, b"new body!", _meta(b"new body!"))
+    monkeypatch.setattr(cache_store, "PACK_REFRESH_INTERVAL", 3600)
+    assert reader.load(KEY)[0] == b"old body"   # trong khoảng interval: vẫn offset đã nạp
+    monkeypatch.setattr(cache_store, "PACK_REFRESH_INTERVAL", 0)
+    body, meta = reader.load(KEY)
+    assert body == b"new body!"
+    assert meta["body_sha256"] == _meta(b"new body!")["body_sha256"]
+    assert reader.load_meta(KEY) == meta
+
+def test_miss_reads_index_tail(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_store, "PACK_REFRESH_INTERVAL", 3600)
+    writer = cache_store.PackStore(str(tmp_path))
+    reader = cache_store.PackStore(str(tmp_path))
+    assert reader.load(KEY) is None
+    writer.save(KEY, b"body", _meta(b"body"))
+    assert reader.load(KEY)[0] == b"body"
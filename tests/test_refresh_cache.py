@@ -0,0 +1,77 @@
+"""refresh_cache.refresh_one: 304 chỉ cập nhật metadata, 200 stream qua CacheWriter, lỗi / thiếu byte giữ entry cũ"""
+
+import os
+import time
+import asyncio
+
+import httpx
+import pytest
+
+import cache_store
+import refresh_cache
+
+URL = "https://kiagds.ru/files/manual.pdf"
+KEY = cache_store.cache_key("GET", URL)
+OLD = bytes(range(256)) * 4
+NEW = bytes(range(255, -1, -1)) * 300
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    cache_dir = str(tmp_path)
+    cache_store.save_entry(KEY, OLD, {"url": URL, "status": 200,
+                                      "headers": {"Content-Type": "application/pdf", "ETag": '"v1"'}},
+                           cache_dir, fetched_at=time.time() - 3600)
+    return cache_dir
+
+def _refresh(cache_dir, handler):
+    requests = []
+
+    def record(request):
+        requests.append(request)
+        return handler(request)
+
+    stats = dict.fromkeys(
+        ("requests", "not_modified", "updated", "failed", "no_validator", "bytes_downloaded", "bytes_cached"), 0
+    )
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(record)) as client:
+            await refresh_cache.refresh_one(client, KEY, URL, cache_dir, stats, False)
+
+    asyncio.run(run())
+    assert requests[0].headers["If-None-Match"] == '"v1"'
+    # File tạm của CacheWriter không bao giờ bị bỏ lại
+    tmp_dir = os.path.join(cache_dir, "tmp")
+    assert not os.path.isdir(tmp_dir) or os.listdir(tmp_dir) == []
+    return stats
+
+def test_not_modified_touches_meta(cache_dir):
+    stats = _refresh(cache_dir, lambda request: httpx.Response(304, headers={"ETag": '"v2"'}))
+    assert stats["not_modified"] == 1
+    assert cache_store.load_meta(KEY, cache_dir)["headers"]["ETag"] == '"v2"'
+    assert cache_store.load_entry(KEY, cache_dir)[0] == OLD
+
+def test_new_body_streamed_into_cache(cache_dir, monkeypatch):
+    monkeypatch.setattr(refresh_cache, "STREAM_CHUNK_BYTES", 1024)
+    writes = []
+    write = cache_store.CacheWriter.write
+    monkeypatch.setattr(cache_store.CacheWriter, "write", lambda self, chunk: writes.append(len(chunk)) or write(self, chunk))
+
+    stats = _refresh(cache_dir, lambda request: httpx.Response(
+        200, headers={"Content-Type": "application/pdf", "ETag": '"v2"'}, content=NEW))
+    assert stats["updated"] == 1
+    assert len(writes) > 1 and sum(writes) == len(NEW)
+    body, meta = cache_store.load_entry(KEY, cache_dir)
+    assert body == NEW
+    assert meta["headers"]["ETag"] == '"v2"'
+
+@pytest.mark.parametrize("response", [
+    httpx.Response(500, content=b"boom"),
+    # Content-Length lớn hơn body nhận được: transfer bị cắt, không thành entry
+    httpx.Response(200, headers={"Content-Type": "application/pdf", "Content-Length": str(len(NEW) + 1)}, content=NEW),
+], ids=["5xx", "short"])
+def test_failure_keeps_old_entry(cache_dir, response):
+    stats = _refresh(cache_dir, lambda request: response)
+    assert stats["failed"] == 1
+    assert stats["updated"] == 0
+    assert cache_store.load_entry(KEY, cache_dir)[0] == OLD
@@ -0,0 +1,87 @@
+"""url_rewrite: rewrite 1 lượt trên bytes, theo offset tính sẵn và theo chunk (stream) phải cho cùng kết quả"""
+
+import random
+
+import pytest
+
+from url_rewrite import Rewriter, StreamRewriter, pack_spans, rewrite_spans, unpack_spans
+
+LOCAL_BASE = "http://localhost:5002"
+
+BODY = (
+    b'<html><head><link href="https://kiagds.ru/style.css" rel="stylesheet">'
+    b'<script src="//kiagds.ru/app.js"></script></head><body>'
+    b'<a href="http://kiagds.ru/?mode=ETM&amp;marke=KM">1</a>'
+    b'<a href="HTTPS://KIAGDS.RU/upper">2</a>'
+    b'<a href="http://localhost:5002/ajax.php?cat=1">3</a>'
+    b'<img src="//KiaGds.ru/img.png"><p>kiagds.ru without slashes, //example.com/x</p>'
+    b'<a href="https://kiagds.ru">end</a>//kiagds.ru'
+)
+
+def _stream(rewriter: Rewriter, chunks) -> bytes:
+    stream = rewriter.stream()
+    out = [stream.feed(chunk) for chunk in chunks]
+    out.append(stream.flush())
+    return b"".join(out)
+
+def _split(data: bytes, sizes):
+    chunks, pos = [], 0
+    for size in sizes:
+        chunks.append(data[pos:pos + size])
+        pos += size
+    chunks.append(data[pos:])
+    return chunks
+
+def test_rewrite_bytes_targets():
+    out = Rewriter(LOCAL_BASE).rewrite_bytes(BODY)
+    assert b"kiagds.ru/" not in out.lower()
+    assert b'href="http://localhost:5002/style.css"' in out
+    assert b'src="//localhost:5002/app.js"' in out
+    assert b'href="http://localhost:5002/upper"' in out
+    assert b'href="http://localhost:5002/ajax.php?cat=1"' in out
+    assert b"kiagds.ru without slashes, //example.com/x" in out
+    assert out.endswith(b'<a href="http://localhost:5002">end</a>//localhost:5002')
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 13, 21, 32, 33, 64, 4096])
+def test_stream_fixed_chunks_match_rewrite_bytes(size):
+    rewriter = Rewriter(LOCAL_BASE)
+    chunks = [BODY[i:i + size] for i in range(0, len(BODY), size)]
+    assert _stream(rewriter, chunks) == rewriter.rewrite_bytes(BODY)
+
+def test_stream_every_single_split_matches_rewrite_bytes():
+    # Cắt 1 lần ở mọi vị trí: URL / scheme bị tách giữa 2 chunk vẫn phải được thay đúng
+    rewriter = Rewriter(LOCAL_BASE)
+    expected = rewriter.rewrite_bytes(BODY)
+    for pos in range(len(BODY) + 1):
+        assert _stream(rewriter, [BODY[:pos], BODY[pos:]]) == expected, pos
+
+def test_stream_random_splits_match_rewrite_bytes():
+    rewriter = Rewriter(LOCAL_BASE)
+    rng = random.Random(1234)
+    for _ in range(200):
+        body = b"".join(rng.choice([BODY, b"x" * rng.randint(0, 40), b"https:", b"//", b"kiagds.ru"])
+                        for _ in range(rng.randint(1, 12)))
+        sizes = [rng.randint(0, 50) for _ in range(rng.randint(0, 20))]
+        assert _stream(rewriter, _split(body, sizes)) == rewriter.rewrite_bytes(body)
+
+def test_stream_empty_chunks():
+    rewriter = Rewriter(LOCAL_BASE)
+    assert _stream(rewriter, [b"", BODY, b"", b""]) == rewriter.rewrite_bytes(BODY)
+    assert _stream(rewriter, []) == b""
+    assert isinstance(rewriter.stream(), StreamRewriter)
+
+def test_packed_offsets_match_rewrite_bytes():
+    # Offset tính lúc lưu cache (meta["rewrite_offsets"]) cho cùng kết quả như quét lại bằng regex
+    rewriter = Rewriter(LOCAL_BASE)
+    packed = pack_spans(rewrite_spans(BODY))
+    assert unpack_spans(packed, BODY) == rewrite_spans(BODY)
+    parts, length = rewriter.spliced(BODY, "utf-8", packed)
+    out = b"".join(parts)
+    assert out == rewriter.rewrite_bytes(BODY)
+    assert length == len(out)
+
+def test_rewrite_body_non_ascii_charset():
+    rewriter = Rewriter(LOCAL_BASE)
+    text = BODY.decode("ascii") + " Привет"
+    out = rewriter.rewrite_body(text.encode("utf-16"), "utf-16")
+    assert out.decode("utf-16") == rewriter.rewrite_bytes(text.encode("utf-8")).decode("utf-8")
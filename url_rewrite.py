@@ -0,0 +1,204 @@
+"""
+Rewrite URL tuyệt đối của origin về proxy local - 1 lượt quét, làm việc trực tiếp trên bytes.
+
+Một regex duy nhất (alternation) thay cho 2-3 lần re.sub nối tiếp:
+- https?://kiagds.ru      -> LOCAL_BASE
+- //kiagds.ru (không có scheme phía trước) -> //<host:port của LOCAL_BASE>
+- http://localhost:5002   -> LOCAL_BASE (URL do proxy crawl ghi vào cache)
+
+Regex bắt đầu bằng literal "//" (không phân biệt hoa thường) nên engine re tìm bằng
+literal-prefix search rất nhanh; scheme đứng trước "//" được xét bằng slice vài byte.
+Charset tương thích ASCII (utf-8, latin-1, cp125x, koi8...) được rewrite thẳng trên bytes,
+không decode/encode; charset khác (utf-16...) mới phải decode sang str.
+"""
+
+import re
+import sys
+import array
+import base64
+import codecs
+import functools
+import urllib.parse
+
+_PATTERN = r"//(?:(kiagds\.ru)|(localhost:5002))"
+REWRITE_RE = re.compile(_PATTERN.encode("ascii"), re.I)
+REWRITE_TEXT_RE = re.compile(_PATTERN, re.I)
+
+# Loại thay thế của 1 span
+FULL = 0       # http(s)://kiagds.ru, http://localhost:5002 -> LOCAL_BASE
+RELATIVE = 1   # //kiagds.ru -> //<host:port>
+
+# Codec mà mọi ký tự ASCII được mã hoá đúng 1 byte giống ASCII và không byte nào khác rơi vào 0x00-0x7F
+_ASCII_COMPATIBLE_PREFIXES = ("utf-8", "ascii", "iso8859", "latin", "cp125", "koi8", "mac-", "tis-620")
+
+@functools.lru_cache(maxsize=64)
+def ascii_compatible(charset: str) -> bool:
+    """Charset có thể rewrite trực tiếp trên bytes. Charset lạ/không hợp lệ coi như utf-8"""
+    try:
+        name = codecs.lookup(charset or "utf-8").name
+    except LookupError:
+        return True
+    return name.startswith(_ASCII_COMPATIBLE_PREFIXES)
+
+def charset_of(content_type: str, default: str = "utf-8") -> str:
+    m = re.search(r"charset=([^;]+)", content_type or "", flags=re.I)
+    return m.group(1).strip().strip('"\'') if m else default
+
+def rewrite_spans(data):
+    """
+    Các đoạn cần thay trong data (bytes hoặc str): [(start, end, FULL|RELATIVE), ...] theo thứ tự.
+    Giống hệt kết quả của chuỗi re.sub cũ:
+    - "https://" / "http://" + kiagds.ru -> FULL (span bắt đầu từ scheme)
+    - "//kiagds.ru" đứng sau ":" của scheme khác (ftp://...) -> giữ nguyên
+    - "//kiagds.ru" còn lại -> RELATIVE
+    - "//localhost:5002" chỉ thay khi có "http:" phía trước
+    """
+    if isinstance(data, str):
+        regex, https, http, colon = REWRITE_TEXT_RE, "https:", "http:", ":"
+    else:
+        regex, https, http, colon = REWRITE_RE, b"https:", b"http:", b":"
+    spans = []
+    for m in regex.finditer(data):
+        p = m.start()
+        if p >= 5 and data[p - 5:p].lower() == http:
+            spans.append((p - 5, m.end(), FULL))
+        elif m.lastindex != 1:
+            continue
+        elif p >= 6 and data[p - 6:p].lower() == https:
+            spans.append((p - 6, m.end(), FULL))
+        elif p and data[p - 1:p] == colon:
+            continue
+        else:
+            spans.append((p, m.end(), RELATIVE))
+    return spans
+
+def pack_spans(spans) -> str:
+    """
+    Nén spans thành chuỗi base64 của mảng uint32 little-endian [start, end, start, end, ...]
+    (loại span suy ra được từ body: RELATIVE nếu bắt đầu bằng "/")
+    """
+    flat = array.array("I", [x for start, end, _ in spans for x in (start, end)])
+    if sys.byteorder == "big":
+        flat.byteswap()
+    return base64.b64encode(flat.tobytes()).decode("ascii")
+
+def unpack_spans(packed: str, body: bytes):
+    flat = array.array("I", base64.b64decode(packed))
+    if sys.byteorder == "big":
+        flat.byteswap()
+    return [
+        (start, end, RELATIVE if body[start] == 0x2F else FULL)
+        for start, end in zip(flat[0::2], flat[1::2])
+    ]
+
+class StreamRewriter:
+    """
+    Rewrite body đang tải về theo từng chunk (charset tương thích ASCII), kết quả ghép lại giống hệt
+    rewrite_bytes() trên cả body. Giữ lại HOLD byte cuối chưa gửi (URL có thể bị cắt giữa 2 chunk)
+    và CONTEXT byte đã gửi để xét scheme / ":" đứng trước "//".
+    """
+
+    HOLD = 32      # > match dài nhất tính cả scheme ("http://localhost:5002" = 21 byte)
+    CONTEXT = 6    # len("https:")
+
+    def __init__(self, replacements):
+        self._replacements = replacements
+        self._context = b""
+        self._pending = b""
+
+    def _emit(self, data: bytes, skip: int, stop: int):
+        """Ghép data[skip:end] (end >= stop: span bắt đầu trước stop được thay trọn vẹn)"""
+        parts = []
+        pos = end = skip
+        for start, span_end, kind in rewrite_spans(data):
+            if start < skip:
+                continue
+            if start >= stop:
+                break
+            parts.append(data[pos:start])
+            parts.append(self._replacements[kind])
+            pos = end = span_end
+        end = max(end, stop)
+        parts.append(data[pos:end])
+        self._context = data[max(0, end - self.CONTEXT):end]
+        self._pending = data[end:]
+        return b"".join(parts)
+
+    def feed(self, chunk: bytes) -> bytes:
+        data = self._context + self._pending + chunk
+        skip = len(self._context)
+        stop = len(data) - self.HOLD
+        if stop <= skip:
+            self._pending = data[skip:]
+            return b""
+        return self._emit(data, skip, stop)
+
+    def flush(self) -> bytes:
+        data = self._context + self._pending
+        return self._emit(data, len(self._context), len(data))
+
+class Rewriter:
+    """Rewriter cho 1 LOCAL_BASE (proxy: localhost:5002, offline viewer: localhost:5003)"""
+
+    def __init__(self, local_base: str):
+        self.local_base = local_base.rstrip("/")
+        host = urllib.parse.urlparse(self.local_base).netloc
+        self._bytes = (self.local_base.encode("ascii"), b"//" + host.encode("ascii"))
+        self._text = (self.local_base, "//" + host)
+
+    def iter_spliced(self, data: bytes, spans):
+        """Các mảnh (memoryview của đoạn không đổi + chuỗi thay thế) - không copy body"""
+        view = memoryview(data)
+        pos = 0
+        for start, end, kind in spans:
+            yield view[pos:start]
+            yield self._bytes[kind]
+            pos = end
+        yield view[pos:]
+
+    def splice(self, data: bytes, spans) -> bytes:
+        if not spans:
+            return data
+        return b"".join(self.iter_spliced(data, spans))
+
+    def spliced(self, body: bytes, charset: str = "utf-8", packed: str = None):
+        """
+        Body đã rewrite dưới dạng (iterator các mảnh bytes, tổng độ dài) - không regex nếu có
+        offset tính sẵn lúc lưu cache (packed = meta["rewrite_offsets"]), không copy cả body 1 lần nữa.
+        """
+        if packed is not None:
+            spans = unpack_spans(packed, body)
+        elif ascii_compatible(charset):
+            spans = rewrite_spans(body)
+        else:
+            data = self.rewrite_body(body, charset)
+            return iter((data,)), len(data)
+        length = len(body) + sum(len(self._bytes[kind]) - (end - start) for start, end, kind in spans)
+        # WSGI server (gunicorn) chỉ nhận bytes, không nhận memoryview
+        return (bytes(part) for part in self.iter_spliced(body, spans)), length
+
+    def stream(self) -> StreamRewriter:
+        return StreamRewriter(self._bytes)
+
+    def rewrite_bytes(self, data: bytes) -> bytes:
+        return self.splice(data, rewrite_spans(data))
+
+    def rewrite_text(self, s: str) -> str:
+        spans = rewrite_spans(s)
+        if not spans:
+            return s
+        parts = []
+        pos = 0
+        for start, end, kind in spans:
+            parts.append(s[pos:start])
+            parts.append(self._text[kind])
+            pos = end
+        parts.append(s[pos:])
+        return "".join(parts)
+
+    def rewrite_body(self, body: bytes, charset: str = "utf-8") -> bytes:
+        """Rewrite body theo charset: bytes trực tiếp nếu tương thích ASCII, ngược lại decode/encode"""
+        if ascii_compatible(charset):
+            return self.rewrite_bytes(body)
+        text = body.decode(charset, errors="replace")
+        return self.rewrite_text(text).encode(charset, errors="replace")
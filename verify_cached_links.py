@@ -4,22 +4,13 @@ Verify which important links are already cached
 """
 
 import json
-import os
-import hashlib
+import cache_store
 
 CACHE_DIR = "cache"
 
-def cache_key(method: str, url: str) -> str:
-    """Generate cache key (same as app.py)"""
-    return hashlib.sha256(f"{method} {url}".encode("utf-8")).hexdigest()
-
 def is_cached(url: str) -> bool:
-    """Check if URL is cached"""
-    method = "GET"
-    key = cache_key(method, url)
-    bin_path = os.path.join(CACHE_DIR, key + ".bin")
-    meta_path = os.path.join(CACHE_DIR, key + ".json")
-    return os.path.exists(bin_path) and os.path.exists(meta_path)
+    """Check if URL is cached (flat or sharded layout)"""
+    return cache_store.is_cached(url, cache_dir=CACHE_DIR)
 
 def main():
     print("=" * 80)